@@ -0,0 +1,217 @@
+# app/admission.py
+"""
+Contrôle d'admission : limite le nombre de requêtes concurrentes (budgets
+séparés lecture/écriture, limites par route) avec une file d'attente bornée.
+
+Quand la file est pleine, que l'attente dépasse ADMISSION_QUEUE_TIMEOUT ou que
+le pool de connexions est saturé, la requête est rejetée immédiatement avec
+503 + Retry-After au lieu d'attendre le timeout du pool.
+"""
+
+import asyncio
+import json
+import os
+from typing import Callable, Dict, Optional
+
+from starlette.routing import Match
+
+ADMISSION_READ_CONCURRENCY = int(os.getenv("ADMISSION_READ_CONCURRENCY", "32"))
+ADMISSION_WRITE_CONCURRENCY = int(os.getenv("ADMISSION_WRITE_CONCURRENCY", "8"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Routes non soumises au contrôle (sondes et documentation)
+EXEMPT_PATHS = {
+    "/",
+    "/health",
+    "/health/live",
+    "/health/ready",
+    "/health/messaging",
+    # Connexions longues (long-poll, SSE) sans session de base pendant l'attente
+    "/orders/changes",
+    "/docs",
+    "/openapi.json",
+}
+
+# Limites spécifiques pour les routes coûteuses : "METHODE /chemin" -> limite
+ROUTE_LIMITS = {
+    "GET /stats": 2,
+    "POST /orders/status/batch": 2,
+}
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+def route_key(scope) -> Optional[str]:
+    """Clé "METHODE /chemin/{param}" de la route correspondant à la requête"""
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return None
+
+
+class ConcurrencyBudget:
+    """Sémaphore avec file d'attente bornée et compteurs exposés"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            self.in_flight += 1
+            return
+
+        if self.waiting >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} queue full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} queue timeout")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionControlMiddleware:
+    """Middleware ASGI appliquant les budgets de concurrence"""
+
+    def __init__(
+        self,
+        app,
+        pool_saturated: Optional[Callable[[], bool]] = None,
+        read_concurrency: int = ADMISSION_READ_CONCURRENCY,
+        write_concurrency: int = ADMISSION_WRITE_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        route_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.app = app
+        self.pool_saturated = pool_saturated
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.budgets = {
+            "read": ConcurrencyBudget(
+                "read", read_concurrency, queue_size, queue_timeout
+            ),
+            "write": ConcurrencyBudget(
+                "write", write_concurrency, queue_size, queue_timeout
+            ),
+        }
+        self.route_limits = ROUTE_LIMITS if route_limits is None else route_limits
+        self.route_budgets: Dict[str, ConcurrencyBudget] = {}
+        self.pool_rejections = 0
+
+    def _route_budget(self, scope) -> Optional[ConcurrencyBudget]:
+        if not self.route_limits:
+            return None
+        key = route_key(scope)
+        if key not in self.route_limits:
+            return None
+        budget = self.route_budgets.get(key)
+        if budget is None:
+            budget = ConcurrencyBudget(
+                key,
+                self.route_limits[key],
+                self.queue_size,
+                self.queue_timeout,
+            )
+            self.route_budgets[key] = budget
+        return budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Exposé pour /health
+        state = scope["app"].state
+        if getattr(state, "admission_control", None) is not self:
+            state.admission_control = self
+
+        if scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if self.pool_saturated and self.pool_saturated():
+            self.pool_rejections += 1
+            await self._reject(send, "database pool saturated")
+            return
+
+        kind = "read" if scope["method"] in READ_METHODS else "write"
+        acquired = []
+        try:
+            for budget in (self._route_budget(scope), self.budgets[kind]):
+                if budget is None:
+                    continue
+                await budget.acquire()
+                acquired.append(budget)
+        except AdmissionRejected as e:
+            for budget in acquired:
+                budget.release()
+            await self._reject(send, str(e))
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            for budget in acquired:
+                budget.release()
+
+    async def _reject(self, send, reason: str):
+        print(f"Request rejected by admission control: {reason}")
+        body = json.dumps(
+            {"detail": "Service temporairement surchargé, réessayez plus tard"}
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(ADMISSION_RETRY_AFTER).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def stats(self) -> dict:
+        return {
+            "read": self.budgets["read"].stats(),
+            "write": self.budgets["write"].stats(),
+            "routes": {
+                key: budget.stats() for key, budget in self.route_budgets.items()
+            },
+            "pool_rejections": self.pool_rejections,
+        }
@@ -0,0 +1,404 @@
+# app/analytics.py
+"""
+Instantané colonnaire (NumPy) de la table orders pour l'analyse ad hoc.
+
+Les colonnes textuelles (statut, client, pays, devise) sont encodées par
+dictionnaire et les montants stockés en centimes (int64). L'instantané est
+rafraîchi incrémentalement à partir de updated_at ; `/stats/query` agrège
+ces tableaux sans interroger la base.
+
+L'instantané est désactivé par défaut (`/stats/query` répond 503) : il
+garde en mémoire une copie de toute la table orders. Pour l'activer,
+installer NumPy et définir ANALYTICS_SNAPSHOT_ENABLED=true. Les suppressions
+de commandes ne sont prises en compte qu'au rechargement complet
+(ANALYTICS_FULL_RELOAD_INTERVAL).
+
+Seul le leader interroge la base : il écrit l'instantané dans
+ANALYTICS_SNAPSHOT_PATH (fichier .npz), que les autres workers rechargent
+quand il change. Ce chemin doit être partagé par les workers d'un même hôte.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import OrderModel
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    np = None
+
+ANALYTICS_SNAPSHOT_ENABLED = os.getenv(
+    "ANALYTICS_SNAPSHOT_ENABLED", "false"
+).lower() in ("1", "true", "yes")
+ANALYTICS_SNAPSHOT_PATH = os.getenv(
+    "ANALYTICS_SNAPSHOT_PATH",
+    os.path.join(tempfile.gettempdir(), "orders_analytics_snapshot.npz"),
+)
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "5"))
+ANALYTICS_FULL_RELOAD_INTERVAL = float(
+    os.getenv("ANALYTICS_FULL_RELOAD_INTERVAL", "3600")
+)
+# Recouvrement relu à chaque rafraîchissement, pour les transactions validées
+# après d'autres mais avec un updated_at antérieur
+ANALYTICS_WATERMARK_LAG = float(os.getenv("ANALYTICS_WATERMARK_LAG", "30"))
+ANALYTICS_BATCH_SIZE = 50000
+# Les clés internes combinent shard et id : (shard << SHARD_ID_SHIFT) | id
+SHARD_ID_SHIFT = 40
+
+DIMENSIONS = ("status", "customer_id", "shipping_country", "currency")
+GROUP_BY_FIELDS = DIMENSIONS + ("amount_bucket",)
+
+
+def analytics_available() -> bool:
+    return np is not None and ANALYTICS_SNAPSHOT_ENABLED
+
+
+class Dictionary:
+    """Encodage par dictionnaire, en ajout seul (les codes restent stables)"""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self.codes: Dict[Optional[str], int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Optional[str]) -> Optional[int]:
+        return self.codes.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class OrderSnapshot:
+    """Colonnes triées par id ; les premières `size` lignes sont valides"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.amount_cents = np.empty(0, dtype=np.int64)
+        self.created_at = np.empty(0, dtype="datetime64[us]")
+        self.codes = {name: np.empty(0, dtype=np.int32) for name in DIMENSIONS}
+        self.dictionaries = {name: Dictionary() for name in DIMENSIONS}
+        self.watermarks: Dict[int, datetime] = {}
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        """Watermark le plus ancien parmi les shards"""
+        return min(self.watermarks.values(), default=None)
+
+    def _columns(self):
+        return [self.ids, self.amount_cents, self.created_at] + [
+            self.codes[name] for name in DIMENSIONS
+        ]
+
+    def _set_columns(self, columns):
+        self.ids, self.amount_cents, self.created_at = columns[:3]
+        for name, column in zip(DIMENSIONS, columns[3:]):
+            self.codes[name] = column
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self.ids):
+            return
+        capacity = max(capacity, 2 * len(self.ids), 1024)
+        resized = []
+        for column in self._columns():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            resized.append(grown)
+        self._set_columns(resized)
+
+    def _apply(self, rows: Sequence, shard: int = 0):
+        """Insère ou met à jour un lot de lignes (id, updated_at, ...)"""
+        if not rows:
+            return
+        ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+        ids |= shard << SHARD_ID_SHIFT
+        amounts = np.fromiter(
+            (int(round((row.total_amount or 0) * 100)) for row in rows),
+            dtype=np.int64,
+            count=len(rows),
+        )
+        created_at = np.array(
+            [_naive_utc(row.created_at) for row in rows], dtype="datetime64[us]"
+        )
+        codes = {
+            name: np.fromiter(
+                (self.dictionaries[name].encode(getattr(row, name)) for row in rows),
+                dtype=np.int32,
+                count=len(rows),
+            )
+            for name in DIMENSIONS
+        }
+
+        # Lignes déjà présentes : mise à jour sur place
+        positions = np.searchsorted(self.ids[: self.size], ids)
+        existing = positions < self.size
+        existing[existing] = self.ids[positions[existing]] == ids[existing]
+        targets = positions[existing]
+        self.amount_cents[targets] = amounts[existing]
+        self.created_at[targets] = created_at[existing]
+        for name in DIMENSIONS:
+            self.codes[name][targets] = codes[name][existing]
+
+        # Nouvelles lignes : ajout en fin, puis tri si les ids arrivent en désordre
+        new = ~existing
+        count = int(new.sum())
+        if not count:
+            return
+        start = self.size
+        end = start + count
+        self._reserve(end)
+        self.ids[start:end] = ids[new]
+        self.amount_cents[start:end] = amounts[new]
+        self.created_at[start:end] = created_at[new]
+        for name in DIMENSIONS:
+            self.codes[name][start:end] = codes[name][new]
+        self.size = end
+
+        if start and self.ids[start] < self.ids[start - 1]:
+            order = np.argsort(self.ids[:end], kind="stable")
+            for column in self._columns():
+                column[:end] = column[:end][order]
+
+    def _advance_watermark(self, rows: Sequence, shard: int = 0):
+        if rows:
+            latest = max(_naive_utc(row.updated_at) for row in rows)
+            current = self.watermarks.get(shard)
+            if current is None or latest > current:
+                self.watermarks[shard] = latest
+
+    def refresh(self, sessions, full: bool = False) -> int:
+        """Relit les commandes modifiées depuis le watermark (nombre de lignes).
+
+        `sessions` : une session, ou une session par shard (indice = shard).
+        """
+        if isinstance(sessions, Session):
+            sessions = [sessions]
+        if full or not self.loaded:
+            return self._reload(sessions)
+
+        total = 0
+        for shard, db in enumerate(sessions):
+            stmt = _order_columns().order_by(OrderModel.id)
+            watermark = self.watermarks.get(shard)
+            if watermark is not None:
+                since = watermark - timedelta(seconds=ANALYTICS_WATERMARK_LAG)
+                stmt = stmt.where(OrderModel.updated_at >= since)
+            rows = db.execute(stmt).all()
+            with self._lock:
+                self._apply(rows, shard)
+                self._advance_watermark(rows, shard)
+            total += len(rows)
+        return total
+
+    def _reload(self, sessions: Sequence[Session]) -> int:
+        fresh = OrderSnapshot()
+        for shard, db in enumerate(sessions):
+            result = db.execute(
+                _order_columns()
+                .order_by(OrderModel.id)
+                .execution_options(yield_per=ANALYTICS_BATCH_SIZE)
+            )
+            for batch in result.partitions():
+                fresh._apply(batch, shard)
+                fresh._advance_watermark(batch, shard)
+        fresh.loaded_at = time.monotonic()
+        self._replace(fresh)
+        return self.size
+
+    def _replace(self, fresh: "OrderSnapshot"):
+        with self._lock:
+            for attribute in (
+                "size",
+                "ids",
+                "amount_cents",
+                "created_at",
+                "codes",
+                "dictionaries",
+                "watermarks",
+                "loaded_at",
+            ):
+                setattr(self, attribute, getattr(fresh, attribute))
+
+    def save(self, path: str):
+        """Écrit l'instantané dans un fichier .npz (remplacement atomique)"""
+        with self._lock:
+            n = self.size
+            arrays = {
+                "ids": self.ids[:n],
+                "amount_cents": self.amount_cents[:n],
+                "created_at": self.created_at[:n],
+            }
+            for name in DIMENSIONS:
+                arrays[f"codes_{name}"] = self.codes[name][:n]
+            meta = {
+                "dictionaries": {
+                    name: list(dictionary.values)
+                    for name, dictionary in self.dictionaries.items()
+                },
+                "watermarks": {
+                    str(shard): watermark.isoformat()
+                    for shard, watermark in self.watermarks.items()
+                },
+            }
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        """Remplace l'instantané par celui écrit par `save`"""
+        fresh = OrderSnapshot()
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            fresh._set_columns(
+                [data["ids"], data["amount_cents"], data["created_at"]]
+                + [data[f"codes_{name}"] for name in DIMENSIONS]
+            )
+        fresh.size = len(fresh.ids)
+        for name, values in meta["dictionaries"].items():
+            for value in values:
+                fresh.dictionaries[name].encode(value)
+        fresh.watermarks = {
+            int(shard): datetime.fromisoformat(watermark)
+            for shard, watermark in meta["watermarks"].items()
+        }
+        fresh.loaded_at = time.monotonic()
+        self._replace(fresh)
+
+    def needs_full_reload(self) -> bool:
+        return (
+            not self.loaded
+            or time.monotonic() - self.loaded_at > ANALYTICS_FULL_RELOAD_INTERVAL
+        )
+
+    def query(
+        self,
+        group_by: Sequence[str] = (),
+        filters: Optional[Dict[str, List[str]]] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        bucket_size_cents: int = 5000,
+        limit: int = 100,
+    ) -> dict:
+        """Filtre et agrège les colonnes (group-by vectorisé, sommes exactes)"""
+        with self._lock:
+            n = self.size
+            mask = np.ones(n, dtype=bool)
+
+            for name, values in (filters or {}).items():
+                codes = [
+                    code
+                    for code in map(self.dictionaries[name].lookup, values)
+                    if code is not None
+                ]
+                mask &= np.isin(self.codes[name][:n], codes)
+            if date_from is not None:
+                mask &= self.created_at[:n] >= np.datetime64(_naive_utc(date_from))
+            if date_to is not None:
+                mask &= self.created_at[:n] < np.datetime64(_naive_utc(date_to))
+
+            amounts = self.amount_cents[:n][mask]
+            key_columns = []
+            for name in group_by:
+                if name == "amount_bucket":
+                    buckets = amounts // bucket_size_cents
+                    key_columns.append((name, buckets, None))
+                else:
+                    key_columns.append(
+                        (name, self.codes[name][:n][mask], self.dictionaries[name])
+                    )
+            dictionaries_values = {
+                name: list(dictionary.values)
+                for name, _, dictionary in key_columns
+                if dictionary is not None
+            }
+            watermark = self.watermark
+
+        matched = len(amounts)
+        groups = []
+        if matched:
+            if key_columns:
+                keys = np.stack([column for _, column, _ in key_columns], axis=1)
+                unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+            else:
+                unique_keys = np.zeros((1, 0), dtype=np.int64)
+                inverse = np.zeros(matched, dtype=np.int64)
+
+            order = np.argsort(inverse, kind="stable")
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(inverse[order])) + 1))
+            revenue = np.add.reduceat(amounts[order], starts)
+            counts = np.diff(np.append(starts, matched))
+
+            for index in np.argsort(-revenue, kind="stable")[:limit]:
+                key = {}
+                for position, (name, _, dictionary) in enumerate(key_columns):
+                    value = int(unique_keys[index, position])
+                    if dictionary is None:
+                        key[name] = value * bucket_size_cents / 100
+                    else:
+                        key[name] = dictionaries_values[name][value]
+                group_revenue = int(revenue[index]) / 100
+                group_count = int(counts[index])
+                groups.append(
+                    {
+                        "key": key,
+                        "order_count": group_count,
+                        "revenue": group_revenue,
+                        "avg_order_value": round(group_revenue / group_count, 2),
+                    }
+                )
+
+        return {
+            "snapshot_rows": n,
+            "matched_orders": matched,
+            "watermark": watermark,
+            "groups": groups,
+        }
+
+
+def _order_columns():
+    return select(
+        OrderModel.id,
+        OrderModel.updated_at,
+        OrderModel.created_at,
+        OrderModel.total_amount,
+        OrderModel.status,
+        OrderModel.customer_id,
+        OrderModel.shipping_country,
+        OrderModel.currency,
+    )
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+order_snapshot = OrderSnapshot() if analytics_available() else None
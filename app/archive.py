@@ -0,0 +1,389 @@
+# app/archive.py
+"""
+Archivage des commandes terminées (table orders_archive).
+
+Les commandes livrées ou annulées dont la dernière modification date de plus
+de ORDER_ARCHIVE_AFTER_DAYS jours sont déplacées, avec leurs articles et
+leurs événements, dans orders_archive : une ligne par commande, dont le
+contenu complet est un document JSON compressé (gzip). Les tables orders,
+order_items et order_events ne gardent ainsi que les commandes actives.
+
+Les lectures par identifiant (commande, lot, historique) et les commandes
+d'un client relisent l'archive quand la commande n'est plus dans orders ;
+une commande archivée est reconstruite en objets OrderModel non attachés à
+la session, donc en lecture seule. Les agrégats (order_rollups,
+customer_order_counts) comptent toujours les commandes archivées ; l'archivage
+enregistre leur part sous la granularité "archived" (voir app.rollups).
+
+Usage :
+    python -m app.archive run [--older-than-days N] [--batch-size N]
+"""
+
+import argparse
+import gzip
+import heapq
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.change_feed import record_order_changes
+from app.models import (
+    CustomerProjectionModel,
+    OrderArchiveModel,
+    OrderEventModel,
+    OrderItemModel,
+    OrderModel,
+)
+from app.rollups import record_orders_archived
+from app.order_ids import order_shard
+from app.sharding import (
+    ShardSessions,
+    open_shard_session,
+    shard_count,
+    shard_for_order,
+)
+
+load_dotenv()
+
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "90"))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "500"))
+
+ARCHIVED_STATUSES = ("delivered", "cancelled")
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_document(order: dict, items: List[dict], events: List[dict]) -> bytes:
+    payload = {"order": order, "items": items, "events": events}
+    return gzip.compress(
+        json.dumps(payload, default=_json_default, ensure_ascii=False).encode("utf-8")
+    )
+
+
+def decode_document(document: bytes) -> dict:
+    return json.loads(gzip.decompress(document))
+
+
+def restore_columns(model, data: dict) -> dict:
+    """Valeurs typées (dates, montants) des colonnes d'un modèle"""
+    values = {}
+    for column in model.__table__.columns:
+        value = data.get(column.name)
+        if isinstance(value, str):
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = None
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is Decimal:
+                value = Decimal(value)
+        values[column.name] = value
+    return values
+
+
+def archive_orders(
+    db: Session,
+    older_than_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> int:
+    """Déplace les commandes terminées dans l'archive (une transaction par lot)"""
+    if older_than_days is None:
+        older_than_days = ORDER_ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or ORDER_ARCHIVE_BATCH_SIZE
+    cutoff = utc_now() - timedelta(days=older_than_days)
+    eligible = (
+        OrderModel.status.in_(ARCHIVED_STATUSES),
+        OrderModel.updated_at < cutoff,
+    )
+
+    archived = 0
+    while True:
+        try:
+            orders = [
+                dict(row)
+                for row in db.execute(
+                    select(OrderModel.__table__)
+                    .where(*eligible)
+                    .order_by(OrderModel.id)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                ).mappings()
+            ]
+            if not orders:
+                return archived
+
+            pks = [order["id"] for order in orders]
+            order_ids = [order["order_id"] for order in orders]
+            items: Dict[int, List[dict]] = {}
+            for row in db.execute(
+                select(OrderItemModel.__table__)
+                .where(OrderItemModel.order_id.in_(pks))
+                .order_by(OrderItemModel.id)
+            ).mappings():
+                items.setdefault(row["order_id"], []).append(dict(row))
+            events: Dict[str, List[dict]] = {}
+            for row in db.execute(
+                select(OrderEventModel.__table__)
+                .where(OrderEventModel.order_id.in_(order_ids))
+                .order_by(OrderEventModel.created_at, OrderEventModel.id)
+            ).mappings():
+                events.setdefault(row["order_id"], []).append(dict(row))
+
+            now = utc_now()
+            db.execute(
+                insert(OrderArchiveModel),
+                [
+                    {
+                        "order_id": order["order_id"],
+                        "customer_id": order["customer_id"],
+                        "customer_name": order["customer_name"],
+                        "customer_email": order["customer_email"],
+                        "status": order["status"],
+                        "currency": order["currency"],
+                        "total_amount": order["total_amount"],
+                        "created_at": order["created_at"],
+                        "updated_at": order["updated_at"],
+                        "archived_at": now,
+                        "document": encode_document(
+                            order,
+                            items.get(order["id"], []),
+                            events.get(order["order_id"], []),
+                        ),
+                    }
+                    for order in orders
+                ],
+            )
+            db.execute(
+                delete(OrderEventModel).where(OrderEventModel.order_id.in_(order_ids))
+            )
+            db.execute(delete(OrderItemModel).where(OrderItemModel.order_id.in_(pks)))
+            db.execute(delete(OrderModel).where(OrderModel.id.in_(pks)))
+            record_order_changes(
+                db,
+                [(order["order_id"], order["status"]) for order in orders],
+                "archived",
+            )
+            record_orders_archived(
+                db,
+                [
+                    (
+                        order["created_at"],
+                        order["status"],
+                        order["currency"],
+                        order["total_amount"],
+                    )
+                    for order in orders
+                ],
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        archived += len(orders)
+        print(f"Archived {archived} orders")
+
+
+def _build_order(row, projection: Optional[CustomerProjectionModel]) -> OrderModel:
+    """Commande archivée reconstruite (objet non attaché, lecture seule)"""
+    document = decode_document(row.document)
+    order = OrderModel(**restore_columns(OrderModel, document["order"]))
+    order.customer_name = row.customer_name
+    order.customer_email = row.customer_email
+    order.updated_at = row.updated_at
+    set_committed_value(
+        order,
+        "items",
+        [
+            OrderItemModel(**restore_columns(OrderItemModel, item))
+            for item in document["items"]
+        ],
+    )
+    set_committed_value(order, "customer", projection)
+    return order
+
+
+def find_archived_orders(
+    db: Session, order_ids: Sequence[str]
+) -> Dict[str, OrderModel]:
+    """Commandes archivées par identifiant (une requête)"""
+    if not order_ids:
+        return {}
+    rows = db.execute(
+        select(OrderArchiveModel, CustomerProjectionModel)
+        .outerjoin(
+            CustomerProjectionModel,
+            CustomerProjectionModel.customer_id == OrderArchiveModel.customer_id,
+        )
+        .where(OrderArchiveModel.order_id.in_(list(order_ids)))
+    ).all()
+    return {row.order_id: _build_order(row, projection) for row, projection in rows}
+
+
+def find_archived_order(db: Session, order_id: str) -> Optional[OrderModel]:
+    return find_archived_orders(db, [order_id]).get(order_id)
+
+
+def locate_archived_orders(
+    shards: ShardSessions, order_ids: Sequence[str]
+) -> Dict[str, OrderModel]:
+    """Commandes archivées sur leur shard ; comme pour `locate_orders`, un
+    ancien identifiant absent du shard 0 est cherché sur les autres"""
+    ids_by_shard: Dict[int, List[str]] = {}
+    for order_id in order_ids:
+        ids_by_shard.setdefault(shard_for_order(order_id), []).append(order_id)
+    found = {}
+    for shard, shard_order_ids in ids_by_shard.items():
+        found.update(find_archived_orders(shards.session(shard), shard_order_ids))
+
+    missing_legacy = [
+        order_id
+        for order_id in order_ids
+        if order_id not in found and order_shard(order_id) is None
+    ]
+    for shard in range(1, shards.count):
+        if not missing_legacy:
+            break
+        found.update(find_archived_orders(shards.session(shard), missing_legacy))
+        missing_legacy = [
+            order_id for order_id in missing_legacy if order_id not in found
+        ]
+    return found
+
+
+def archived_order_events(
+    db: Session, order_id: str
+) -> Optional[List[OrderEventModel]]:
+    """Historique d'une commande archivée ; None si elle n'est pas archivée"""
+    document = db.scalar(
+        select(OrderArchiveModel.document).where(OrderArchiveModel.order_id == order_id)
+    )
+    if document is None:
+        return None
+    return [
+        OrderEventModel(**restore_columns(OrderEventModel, event))
+        for event in decode_document(document)["events"]
+    ]
+
+
+def archived_customer_order_keys(
+    db: Session, customer_id: str, count: int
+) -> List[Tuple[datetime, str]]:
+    """(created_at, order_id) des commandes archivées d'un client, plus récentes d'abord"""
+    return [
+        tuple(row)
+        for row in db.execute(
+            select(OrderArchiveModel.created_at, OrderArchiveModel.order_id)
+            .where(OrderArchiveModel.customer_id == customer_id)
+            .order_by(OrderArchiveModel.created_at.desc())
+            .limit(count)
+        )
+    ]
+
+
+def merge_archived_orders(
+    db: Session, customer_id: str, orders: List[OrderModel], skip: int, limit: int
+) -> List[OrderModel]:
+    """Page des commandes d'un client, actives (`orders`, skip+limit premières
+    par date décroissante) et archivées ; seules les archivées de la page sont
+    décompressées"""
+    keys = archived_customer_order_keys(db, customer_id, skip + limit)
+    if not keys:
+        return orders[skip : skip + limit]
+
+    merged = heapq.merge(
+        ((order.created_at, order.order_id, order) for order in orders),
+        ((created_at, order_id, None) for created_at, order_id in keys),
+        key=itemgetter(0),
+        reverse=True,
+    )
+    page = list(islice(merged, skip, skip + limit))
+    archived = find_archived_orders(
+        db, [order_id for _, order_id, order in page if order is None]
+    )
+    return [order or archived[order_id] for _, order_id, order in page]
+
+
+def anonymize_document(document: bytes, name: str, email: str) -> bytes:
+    """Document réencodé sans les données personnelles du client (commande et
+    valeurs avant/après des événements)"""
+    data = decode_document(document)
+    values = {"customer_name": name, "customer_email": email}
+    data["order"].update(values)
+    for event in data["events"]:
+        event_data = event.get("event_data")
+        if not isinstance(event_data, dict):
+            continue
+        for section in (event_data.get("old_values"), event_data.get("changes")):
+            if isinstance(section, dict):
+                section.update({key: values[key] for key in values if key in section})
+    return encode_document(data["order"], data["items"], data["events"])
+
+
+def anonymize_archived_orders(db: Session, customer_id: str, name: str, email: str):
+    """Anonymise les commandes archivées d'un client supprimé (colonnes et
+    documents)"""
+    now = utc_now()
+    rows = db.execute(
+        select(OrderArchiveModel.order_id, OrderArchiveModel.document).where(
+            OrderArchiveModel.customer_id == customer_id
+        )
+    ).all()
+    if not rows:
+        return
+    db.execute(
+        update(OrderArchiveModel).execution_options(synchronize_session=False),
+        [
+            {
+                "order_id": order_id,
+                "customer_name": name,
+                "customer_email": email,
+                "updated_at": now,
+                "document": anonymize_document(document, name, email),
+            }
+            for order_id, document in rows
+        ],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivage des commandes terminées")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Archive les commandes livrées ou annulées anciennes"
+    )
+    run_parser.add_argument("--older-than-days", type=int, default=None)
+    run_parser.add_argument("--batch-size", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        for shard in range(shard_count()):
+            db = open_shard_session(shard)
+            try:
+                count = archive_orders(db, args.older_than_days, args.batch_size)
+                print(f"Shard {shard}: {count} orders archived")
+            finally:
+                db.close()
+
+
+if __name__ == "__main__":
+    main()
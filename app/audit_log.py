@@ -0,0 +1,545 @@
+# app/audit_log.py
+"""
+Maintenance du journal d'audit order_events :
+partitionnement mensuel (PostgreSQL) et archivage/rétention vers des
+fichiers JSON Lines compressés.
+
+Les partitions des prochains mois sont créées au démarrage puis
+périodiquement par le leader ; les lignes tombées entre-temps dans
+order_events_default sont déplacées dans la partition de leur mois.
+
+Une table order_events existante (non partitionnée) n'est pas convertie au
+démarrage : la migration se lance une fois, application en service, avec
+`python -m app.audit_log migrate`.
+
+Usage :
+    python -m app.audit_log migrate
+    python -m app.audit_log partitions
+    python -m app.audit_log archive [--retention-months N] [--archive-dir DIR]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.engine import Engine
+
+from app.db import engine as default_engine
+from app.models import OrderEventModel
+from app.sharding import all_engines
+
+load_dotenv()
+
+ORDER_EVENTS_RETENTION_MONTHS = int(os.getenv("ORDER_EVENTS_RETENTION_MONTHS", "12"))
+ORDER_EVENTS_ARCHIVE_DIR = os.getenv(
+    "ORDER_EVENTS_ARCHIVE_DIR", "archives/order_events"
+)
+ORDER_EVENTS_PREMAKE_MONTHS = int(os.getenv("ORDER_EVENTS_PREMAKE_MONTHS", "3"))
+
+ARCHIVE_BATCH_SIZE = 5000
+MIGRATION_BATCH_SIZE = 50000
+# Création périodique des partitions à venir (tâche du leader)
+ORDER_EVENTS_PARTITION_INTERVAL = 6 * 3600
+
+_LOCK_KEY = "hashtext('orders-api.order_events')"
+
+_BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def month_start(dt: datetime) -> datetime:
+    """Premier instant du mois (naïf, UTC)"""
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    """Ajoute un nombre de mois à un début de mois"""
+    index = dt.year * 12 + dt.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def partition_name(month: datetime) -> str:
+    return f"order_events_{month:%Y_%m}"
+
+
+def _is_partitioned(conn) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('order_events')")
+    ).scalar()
+    return relkind == "p"
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    value = value.strip().strip("'")
+    if value.upper() == "MINVALUE":
+        return None
+    return datetime.fromisoformat(value)
+
+
+def list_partitions(conn) -> List[Tuple[str, Optional[datetime], datetime]]:
+    """Liste les partitions (nom, borne basse, borne haute) hors partition DEFAULT"""
+    rows = conn.execute(text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'order_events'::regclass
+            """)).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_PATTERN.search(bound or "")
+        if not match:
+            continue
+        partitions.append(
+            (name, _parse_bound(match.group(1)), _parse_bound(match.group(2)))
+        )
+    return sorted(partitions, key=lambda p: p[2])
+
+
+def month_range(first: datetime, last: datetime) -> List[datetime]:
+    """Débuts de mois de `first` à `last` inclus"""
+    months, month = [], month_start(first)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _partition_bounds(month: datetime) -> str:
+    return (
+        f"FOR VALUES FROM ('{month.isoformat()}') "
+        f"TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def _create_event_indexes(conn, table: str):
+    """Clé primaire et index d'order_events, nommés d'après `table`"""
+    conn.execute(
+        text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey "
+            "PRIMARY KEY (id, created_at)"
+        )
+    )
+    conn.execute(
+        text(
+            f"CREATE INDEX ix_{table}_order_id_created_at "
+            f"ON {table} (order_id, created_at, id)"
+        )
+    )
+    conn.execute(text(f"CREATE INDEX ix_{table}_created_at ON {table} (created_at)"))
+
+
+def _attach_partition(conn, name: str, month: datetime):
+    """Attache une table comme partition d'un mois.
+
+    La contrainte CHECK posée avant l'ATTACH permet à PostgreSQL de ne pas
+    parcourir la table sous verrou pour valider les bornes.
+    """
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    conn.execute(
+        text(
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+            f"CHECK (created_at >= '{lower}' AND created_at < '{upper}')"
+        )
+    )
+    conn.execute(
+        text(
+            f"ALTER TABLE order_events ATTACH PARTITION {name} {_partition_bounds(month)}"
+        )
+    )
+    conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+
+
+def _snapshot(conn, table: str):
+    """(max(id), min(created_at), max(created_at)) d'une table d'événements"""
+    return conn.execute(
+        text(f"SELECT max(id), min(created_at), max(created_at) FROM {table}")
+    ).one()
+
+
+def _migrate_table(engine: Engine, premake_months: int):
+    """Copie la table order_events simple dans une table partitionnée par mois,
+    puis bascule"""
+    with engine.begin() as conn:
+        max_id, oldest, newest = _snapshot(conn, "order_events")
+        current = month_start(utc_now())
+        months = month_range(
+            min(oldest or current, current),
+            max(newest or current, add_months(current, premake_months)),
+        )
+
+        # Reste éventuel d'une migration interrompue
+        conn.execute(text("DROP TABLE IF EXISTS order_events_new CASCADE"))
+        conn.execute(
+            text(
+                "CREATE TABLE order_events_new (LIKE order_events INCLUDING DEFAULTS) "
+                "PARTITION BY RANGE (created_at)"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE order_events_new "
+                "ALTER COLUMN event_data TYPE JSONB USING event_data::jsonb"
+            )
+        )
+        _create_event_indexes(conn, "order_events_new")
+        for month in months:
+            conn.execute(
+                text(
+                    f"CREATE TABLE {partition_name(month)} "
+                    f"PARTITION OF order_events_new {_partition_bounds(month)}"
+                )
+            )
+        conn.execute(
+            text(
+                "CREATE TABLE order_events_default PARTITION OF order_events_new DEFAULT"
+            )
+        )
+
+    columns = [column.name for column in OrderEventModel.__table__.columns]
+    copy = (
+        f"INSERT INTO order_events_new ({', '.join(columns)}) SELECT "
+        + ", ".join(
+            "event_data::jsonb" if column == "event_data" else column
+            for column in columns
+        )
+        + " FROM order_events WHERE "
+    )
+
+    # Historique copié par lots d'identifiants (routés vers leur mois), sans
+    # verrou prolongé : order_events reste accessible en écriture
+    start = 0
+    while start < (max_id or 0):
+        with engine.begin() as conn:
+            conn.execute(
+                text(copy + "id > :start AND id <= :end"),
+                {"start": start, "end": min(start + MIGRATION_BATCH_SIZE, max_id)},
+            )
+        start += MIGRATION_BATCH_SIZE
+    print(f"Copied order events up to id {max_id or 0}")
+
+    # Bascule : seules les lignes arrivées pendant la copie restent à copier
+    with engine.begin() as conn:
+        conn.execute(text("LOCK TABLE order_events IN EXCLUSIVE MODE"))
+        conn.execute(text(copy + "id > :max_id"), {"max_id": max_id or 0})
+        conn.execute(text("ALTER TABLE order_events RENAME TO order_events_old"))
+        index_names = conn.execute(
+            text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'order_events_old'"
+            )
+        ).scalars()
+        for index_name in list(index_names):
+            conn.execute(
+                text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_old"')
+            )
+        conn.execute(text("ALTER TABLE order_events_new RENAME TO order_events"))
+        for old_name, new_name in (
+            ("order_events_new_pkey", "order_events_pkey"),
+            (
+                "ix_order_events_new_order_id_created_at",
+                "ix_order_events_order_id_created_at",
+            ),
+            ("ix_order_events_new_created_at", "ix_order_events_created_at"),
+        ):
+            conn.execute(text(f"ALTER INDEX {old_name} RENAME TO {new_name}"))
+        conn.execute(
+            text("ALTER SEQUENCE order_events_id_seq OWNED BY order_events.id")
+        )
+        conn.execute(text("DROP TABLE order_events_old"))
+    print("order_events migrated to a monthly partitioned table")
+
+
+def _split_legacy_partition(engine: Engine):
+    """Découpe par mois la partition order_events_legacy (MINVALUE) laissée par
+    l'ancienne conversion au démarrage, pour que la rétention s'y applique"""
+    with engine.begin() as conn:
+        max_id, oldest, newest = _snapshot(conn, "order_events_legacy")
+    months = month_range(oldest, newest) if oldest else []
+
+    # Une table par mois, remplie et indexée hors verrou
+    for month in months:
+        name = partition_name(month)
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            conn.execute(
+                text(f"CREATE TABLE {name} (LIKE order_events INCLUDING DEFAULTS)")
+            )
+            count = conn.execute(
+                text(
+                    f"INSERT INTO {name} SELECT * FROM order_events_legacy "
+                    "WHERE id <= :max_id AND created_at >= :lower AND created_at < :upper"
+                ),
+                {"max_id": max_id, "lower": month, "upper": add_months(month, 1)},
+            ).rowcount
+            _create_event_indexes(conn, name)
+        print(f"Copied {count} order events to {name}")
+
+    with engine.begin() as conn:
+        conn.execute(text("LOCK TABLE order_events_legacy IN EXCLUSIVE MODE"))
+        conn.execute(
+            text("ALTER TABLE order_events DETACH PARTITION order_events_legacy")
+        )
+        for month in months:
+            _attach_partition(conn, partition_name(month), month)
+        # Lignes arrivées pendant la copie : routées par la table parente
+        conn.execute(
+            text(
+                "INSERT INTO order_events SELECT * FROM order_events_legacy "
+                "WHERE id > :max_id"
+            ),
+            {"max_id": max_id or 0},
+        )
+        conn.execute(text("DROP TABLE order_events_legacy"))
+    print("order_events_legacy split into monthly partitions")
+
+
+def migrate_order_events(
+    engine: Optional[Engine] = None, premake_months: Optional[int] = None
+):
+    """Migration ponctuelle vers le partitionnement mensuel (PostgreSQL).
+
+    L'historique est copié mois par mois pendant que l'application continue
+    d'écrire ; seule la bascule finale verrouille la table. À lancer avec
+    `python -m app.audit_log migrate`, archivage des commandes arrêté.
+    """
+    engine = engine or default_engine
+    if engine.dialect.name != "postgresql":
+        return
+    if premake_months is None:
+        premake_months = ORDER_EVENTS_PREMAKE_MONTHS
+
+    with engine.connect() as lock_conn:
+        # Une seule migration à la fois (verrou de session)
+        lock_conn.execute(text(f"SELECT pg_advisory_lock({_LOCK_KEY})"))
+        try:
+            with engine.connect() as conn:
+                partitioned = _is_partitioned(conn)
+                legacy = conn.execute(
+                    text("SELECT to_regclass('order_events_legacy')")
+                ).scalar()
+            if not partitioned:
+                _migrate_table(engine, premake_months)
+            elif legacy is not None:
+                _split_legacy_partition(engine)
+            else:
+                print("order_events is already partitioned by month")
+        finally:
+            lock_conn.execute(text(f"SELECT pg_advisory_unlock({_LOCK_KEY})"))
+            lock_conn.commit()
+
+
+def ensure_order_events_partitions(conn, premake_months: Optional[int] = None):
+    """Crée à l'avance les partitions des prochains mois"""
+    if premake_months is None:
+        premake_months = ORDER_EVENTS_PREMAKE_MONTHS
+
+    current = month_start(utc_now())
+    partitions = list_partitions(conn)
+    month = max(current, partitions[-1][2]) if partitions else current
+
+    while month <= add_months(current, premake_months):
+        create_partition(conn, month)
+        month = add_months(month, 1)
+
+
+def create_partition(conn, month: datetime):
+    """Crée la partition d'un mois, en y déplaçant ses lignes de la partition DEFAULT.
+
+    Un CREATE TABLE ... PARTITION OF échoue si la partition DEFAULT contient
+    déjà des lignes du mois : la table est donc créée seule, remplie avec ces
+    lignes, puis attachée (voir _attach_partition).
+    """
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    exists = conn.execute(text(f"SELECT to_regclass('{name}')")).scalar()
+    if exists is not None:
+        return
+
+    conn.execute(text(f"CREATE TABLE {name} (LIKE order_events INCLUDING DEFAULTS)"))
+    moved = conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM order_events_default "
+            f"WHERE created_at >= '{lower}' AND created_at < '{upper}' RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        )
+    ).rowcount
+    _attach_partition(conn, name, month)
+    if moved:
+        print(f"Moved {moved} order events from order_events_default to {name}")
+
+
+def setup_order_events_storage(engine: Optional[Engine] = None):
+    """Crée les partitions à venir d'order_events (PostgreSQL uniquement).
+
+    Une table vide (nouvelle base) est partitionnée directement ; une table
+    existante doit être migrée avec `python -m app.audit_log migrate`, pour
+    ne pas bloquer le démarrage pendant la copie.
+    """
+    engine = engine or default_engine
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.connect() as conn:
+        partitioned = _is_partitioned(conn)
+        empty = (
+            partitioned
+            or not conn.execute(
+                text("SELECT EXISTS (SELECT 1 FROM order_events)")
+            ).scalar()
+        )
+    if not partitioned:
+        if not empty:
+            print(
+                "order_events is not partitioned: "
+                "run 'python -m app.audit_log migrate'"
+            )
+            return
+        migrate_order_events(engine)
+
+    with engine.begin() as conn:
+        # Une autre instance (ou une migration) s'en occupe déjà
+        if not conn.execute(
+            text(f"SELECT pg_try_advisory_xact_lock({_LOCK_KEY})")
+        ).scalar():
+            return
+        if not _is_partitioned(conn):
+            return
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_order_events_order_id_created_at "
+                "ON order_events (order_id, created_at, id)"
+            )
+        )
+        ensure_order_events_partitions(conn)
+
+
+def _export_rows(conn, stmt, path: str) -> int:
+    """Écrit les événements sélectionnés dans un fichier JSON Lines gzip"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    count = 0
+
+    result = conn.execution_options(
+        stream_results=True, yield_per=ARCHIVE_BATCH_SIZE
+    ).execute(stmt)
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            for row in result.mappings():
+                line = json.dumps(dict(row), default=str, ensure_ascii=False)
+                archive.write(f"{line}\n".encode("utf-8"))
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    os.replace(tmp_path, path)
+    return count
+
+
+def archive_order_events(
+    retention_months: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    engine: Optional[Engine] = None,
+) -> List[str]:
+    """Archive puis supprime les événements plus anciens que la rétention.
+
+    Un fichier `<archive_dir>/order_events_YYYY_MM.jsonl.gz` est écrit par
+    partition (ou par mois hors PostgreSQL) avant toute suppression.
+    """
+    engine = engine or default_engine
+    if retention_months is None:
+        retention_months = ORDER_EVENTS_RETENTION_MONTHS
+    archive_dir = archive_dir or ORDER_EVENTS_ARCHIVE_DIR
+
+    cutoff = add_months(month_start(utc_now()), -retention_months)
+    archived = []
+
+    with engine.connect() as conn:
+        partitioned = _is_partitioned(conn)
+
+    if partitioned:
+        with engine.connect() as conn:
+            partitions = [p for p in list_partitions(conn) if p[2] <= cutoff]
+
+        for name, _, _ in partitions:
+            path = os.path.join(archive_dir, f"{name}.jsonl.gz")
+            with engine.begin() as conn:
+                count = _export_rows(conn, text(f"SELECT * FROM {name}"), path)
+                conn.execute(text(f"ALTER TABLE order_events DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            print(f"Archived {count} order events from {name} to {path}")
+            archived.append(path)
+        return archived
+
+    table = OrderEventModel.__table__
+    with engine.connect() as conn:
+        oldest = conn.execute(
+            select(func.min(table.c.created_at)).where(table.c.created_at < cutoff)
+        ).scalar()
+
+    if oldest is None:
+        return archived
+
+    month = month_start(oldest)
+    while month < cutoff:
+        upper = add_months(month, 1)
+        in_month = (table.c.created_at >= month) & (table.c.created_at < upper)
+        path = os.path.join(archive_dir, f"{partition_name(month)}.jsonl.gz")
+
+        with engine.begin() as conn:
+            count = _export_rows(conn, select(table).where(in_month), path)
+            if count:
+                conn.execute(delete(table).where(in_month))
+
+        if count:
+            print(f"Archived {count} order events from {month:%Y-%m} to {path}")
+            archived.append(path)
+        else:
+            os.remove(path)
+        month = upper
+
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance du journal order_events")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("partitions", help="Crée les partitions à venir")
+    subparsers.add_parser(
+        "migrate", help="Partitionne par mois une table order_events existante"
+    )
+
+    archive_parser = subparsers.add_parser(
+        "archive", help="Archive les partitions au-delà de la rétention"
+    )
+    archive_parser.add_argument("--retention-months", type=int, default=None)
+    archive_parser.add_argument("--archive-dir", default=None)
+
+    args = parser.parse_args()
+
+    # order_events existe sur chaque shard (voir app/sharding.py)
+    archive_dir = getattr(args, "archive_dir", None) or ORDER_EVENTS_ARCHIVE_DIR
+    for shard, shard_engine in enumerate(all_engines()):
+        if args.command == "migrate":
+            migrate_order_events(shard_engine)
+        setup_order_events_storage(shard_engine)
+        if args.command == "archive":
+            shard_dir = os.path.join(archive_dir, f"shard_{shard}") if shard else None
+            archive_order_events(
+                args.retention_months, shard_dir or archive_dir, shard_engine
+            )
+
+
+if __name__ == "__main__":
+    main()
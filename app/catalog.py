@@ -0,0 +1,232 @@
+# app/catalog.py
+"""
+Cache local du catalogue produits, alimenté par les événements product.*.
+
+La table products_catalog est la copie persistante ; un LRU en mémoire
+(avec TTL, car un seul worker consomme les événements) évite de la relire
+à chaque commande. create_order valide et enrichit ses articles via
+`enrich_order_items`, en une seule requête pour les produits absents du LRU :
+le nom du catalogue est imposé, un prix différent de celui du catalogue est
+refusé (409).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.db import dialect_insert
+from app.models import ProductCatalogModel
+from app.schemas import OrderItemCreate
+
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "10000"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "60"))
+# En mode strict, un produit inconnu du catalogue est refusé
+PRODUCT_CATALOG_STRICT = os.getenv("PRODUCT_CATALOG_STRICT", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+
+class CachedProduct:
+    __slots__ = ("product_id", "name", "price", "sku", "description", "deleted")
+
+    def __init__(self, row: ProductCatalogModel):
+        self.product_id = row.product_id
+        self.name = row.name
+        self.price = row.price
+        self.sku = row.sku
+        self.description = row.description
+        self.deleted = row.deleted
+
+
+class ProductCache:
+    """LRU thread-safe ; une entrée None mémorise un produit absent du catalogue"""
+
+    def __init__(
+        self, max_size: int = PRODUCT_CACHE_SIZE, ttl: float = PRODUCT_CACHE_TTL
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, product_ids: Iterable[str]):
+        """Retourne (trouvés, manquants)"""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._entries.get(product_id)
+                if entry is None or entry[1] < now:
+                    missing.append(product_id)
+                    continue
+                self._entries.move_to_end(product_id)
+                found[product_id] = entry[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, products: Dict[str, Optional[CachedProduct]]):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for product_id, product in products.items():
+                self._entries[product_id] = (product, expires_at)
+                self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, product_id: str):
+        with self._lock:
+            self._entries.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+product_cache = ProductCache()
+
+
+def get_products(db: Session, product_ids: Iterable[str]) -> Dict[str, CachedProduct]:
+    """Lookup groupé : LRU d'abord, puis une seule requête pour le reste"""
+    product_ids = list(dict.fromkeys(product_ids))
+    found, missing = product_cache.get_many(product_ids)
+
+    if missing:
+        rows = (
+            db.query(ProductCatalogModel)
+            .filter(ProductCatalogModel.product_id.in_(missing))
+            .all()
+        )
+        loaded = {product_id: None for product_id in missing}
+        loaded.update({row.product_id: CachedProduct(row) for row in rows})
+        product_cache.put_many(loaded)
+        found.update(loaded)
+
+    return {pid: product for pid, product in found.items() if product is not None}
+
+
+def enrich_order_items(
+    db: Session, items: List[OrderItemCreate]
+) -> List[OrderItemCreate]:
+    """Valide les articles contre le catalogue (prix) et impose son nom"""
+    products = get_products(db, (item.product_id for item in items))
+
+    enriched = []
+    for item in items:
+        product = products.get(item.product_id)
+        if product is None:
+            if PRODUCT_CATALOG_STRICT:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Produit inconnu: {item.product_id}",
+                )
+            enriched.append(item)
+            continue
+
+        if product.deleted:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Produit indisponible: {item.product_id}",
+            )
+
+        if (
+            product.price is not None
+            and product.price > 0
+            and product.price != item.product_price
+        ):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Prix différent du catalogue pour {item.product_id}: "
+                f"{product.price}",
+            )
+
+        updates = {}
+        if product.name:
+            updates["product_name"] = product.name
+        if product.sku and not item.product_sku:
+            updates["product_sku"] = product.sku
+        if product.description and not item.product_description:
+            updates["product_description"] = product.description
+        try:
+            # Les valeurs du catalogue passent par les mêmes contrôles que
+            # celles du client
+            enriched.append(
+                OrderItemCreate.model_validate({**item.model_dump(), **updates})
+            )
+        except ValidationError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Produit invalide au catalogue: {item.product_id}",
+            )
+
+    return enriched
+
+
+def _parse_price(value) -> Optional[Decimal]:
+    """Prix positif, None sinon (un prix invalide n'est pas enregistré)"""
+    if value is None:
+        return None
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return price if price > 0 else None
+
+
+def upsert_product(
+    db: Session,
+    product_id: str,
+    product_data: dict,
+    event_at: datetime,
+    deleted: bool = False,
+):
+    """Applique un événement produit au catalogue local (un seul upsert).
+
+    L'appelant invalide l'entrée du LRU après le commit.
+    """
+    table = ProductCatalogModel.__table__
+    details = product_data.get("details") or {}
+
+    values = {}
+    if "name" in product_data:
+        values["name"] = product_data["name"]
+    price = _parse_price(product_data.get("price", details.get("price")))
+    if price is not None:
+        values["price"] = price
+    if "sku" in product_data:
+        values["sku"] = product_data["sku"]
+    description = product_data.get("description", details.get("description"))
+    if description is not None:
+        values["description"] = description
+
+    insert = dialect_insert(db)
+    stmt = insert(table).values(
+        product_id=product_id,
+        deleted=deleted,
+        source_updated_at=event_at,
+        updated_at=datetime.now(timezone.utc),
+        **values,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={
+            **{column: stmt.excluded[column] for column in values},
+            "deleted": stmt.excluded.deleted,
+            "source_updated_at": stmt.excluded.source_updated_at,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=table.c.source_updated_at <= stmt.excluded.source_updated_at,
+    )
+    db.execute(stmt)
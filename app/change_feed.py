@@ -0,0 +1,401 @@
+# app/change_feed.py
+"""
+Flux de modifications des commandes (table order_changes), exposé par
+GET /orders/changes.
+
+Chaque écriture sur une commande insère une ligne dans la même transaction ;
+la séquence `seq` de chaque shard sert de position. Le curseur renvoyé aux
+clients encode la dernière position lue sur chaque shard.
+
+Deux transactions concurrentes peuvent valider leurs lignes dans le désordre
+(seq 5 visible avant seq 4) : la lecture s'arrête avant un trou tant que la
+ligne suivante a moins de CHANGE_FEED_GAP_TIMEOUT secondes, au-delà le trou
+est considéré comme une transaction annulée.
+
+Un seul `ChangeFeedHub` par process interroge les shards (max(seq)) toutes
+les CHANGE_FEED_POLL_INTERVAL secondes, lit une seule fois les nouvelles
+modifications et les garde en mémoire (CHANGE_FEED_BUFFER_SIZE dernières) :
+les requêtes en attente (long-poll et Server-Sent Events) sont servies depuis
+ce tampon. Seul un curseur plus ancien que le tampon relit la table.
+
+Des modifications ont pu être manquées quand les positions lues ne se suivent
+pas : trou ignoré après CHANGE_FEED_GAP_TIMEOUT (une transaction très longue
+peut encore valider sa ligne) ou curseur antérieur à la rétention. La page
+renvoie alors `reset: true` (événement `reset` en SSE) : le client doit
+resynchroniser son état puis reprendre au curseur.
+"""
+
+import asyncio
+import base64
+import binascii
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import DateTime, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.models import OrderChangeModel, OrderModel
+from app.schemas import OrderChange
+from app.sharding import open_shard_session, shard_count
+
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "0.5"))
+CHANGE_FEED_MAX_WAIT = float(os.getenv("CHANGE_FEED_MAX_WAIT", "30"))
+CHANGE_FEED_GAP_TIMEOUT = float(os.getenv("CHANGE_FEED_GAP_TIMEOUT", "10"))
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv("CHANGE_FEED_RETENTION_DAYS", "7"))
+CHANGE_FEED_KEEPALIVE = float(os.getenv("CHANGE_FEED_KEEPALIVE", "15"))
+CHANGE_FEED_STREAM_TIMEOUT = float(os.getenv("CHANGE_FEED_STREAM_TIMEOUT", "300"))
+CHANGE_FEED_BUFFER_SIZE = int(os.getenv("CHANGE_FEED_BUFFER_SIZE", "10000"))
+CHANGE_FEED_PURGE_INTERVAL = 3600
+
+Positions = Dict[int, int]
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record_order_change(
+    db: Session, order_id: str, change_type: str, status: Optional[str] = None
+):
+    """Ajoute une modification au flux (dans la transaction de l'écriture)"""
+    record_order_changes(db, [(order_id, status)], change_type)
+
+
+def record_order_changes(
+    db: Session, changes: Iterable[Tuple[str, Optional[str]]], change_type: str
+):
+    """Ajoute plusieurs modifications (order_id, statut) en une requête"""
+    now = utc_now()
+    rows = [
+        {
+            "order_id": order_id,
+            "change_type": change_type,
+            "status": status,
+            "changed_at": now,
+        }
+        for order_id, status in changes
+    ]
+    if rows:
+        db.execute(insert(OrderChangeModel), rows)
+
+
+def record_customer_orders_changed(db: Session, customer_id: str, change_type: str):
+    """Ajoute une modification pour chaque commande d'un client (une requête)"""
+    db.execute(
+        insert(OrderChangeModel).from_select(
+            ["order_id", "change_type", "status", "changed_at"],
+            select(
+                OrderModel.order_id,
+                literal(change_type),
+                OrderModel.status,
+                literal(utc_now(), DateTime),
+            )
+            .where(OrderModel.customer_id == customer_id)
+            .order_by(OrderModel.id),
+        )
+    )
+
+
+def encode_position_cursor(positions: Positions) -> str:
+    payload = json.dumps({str(shard): seq for shard, seq in sorted(positions.items())})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_position_cursor(cursor: Optional[str]) -> Positions:
+    """Positions par shard d'un curseur ; toutes à 0 sans curseur"""
+    positions = {shard: 0 for shard in range(shard_count())}
+    if not cursor:
+        return positions
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        for shard, seq in payload.items():
+            if int(shard) in positions:
+                positions[int(shard)] = int(seq)
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    return positions
+
+
+def latest_positions() -> Positions:
+    """Dernière position de chaque shard"""
+    positions = {}
+    for shard in range(shard_count()):
+        db = open_shard_session(shard)
+        try:
+            positions[shard] = db.scalar(select(func.max(OrderChangeModel.seq))) or 0
+        finally:
+            db.close()
+    return positions
+
+
+def read_shard_changes(
+    db: Session, since: int, limit: int, now: datetime
+) -> List[OrderChangeModel]:
+    """Modifications après `since`, en s'arrêtant avant un trou récent"""
+    rows = db.scalars(
+        select(OrderChangeModel)
+        .where(OrderChangeModel.seq > since)
+        .order_by(OrderChangeModel.seq)
+        .limit(limit)
+    ).all()
+
+    gap_cutoff = now - timedelta(seconds=CHANGE_FEED_GAP_TIMEOUT)
+    expected = since + 1
+    visible = []
+    for row in rows:
+        if row.seq != expected and row.changed_at > gap_cutoff:
+            break
+        visible.append(row)
+        expected = row.seq + 1
+    return visible
+
+
+def read_changes(
+    positions: Positions, limit: int
+) -> Tuple[List[Tuple[int, OrderChangeModel]], Positions]:
+    """Modifications de tous les shards (ordre chronologique) et nouvelles positions"""
+    now = utc_now()
+    per_shard = []
+    for shard, since in positions.items():
+        db = open_shard_session(shard)
+        try:
+            rows = read_shard_changes(db, since, limit, now)
+            db.expunge_all()
+        finally:
+            db.close()
+        per_shard.append([(row.changed_at, row.seq, shard, row) for row in rows])
+
+    merged = [
+        (shard, row)
+        for _, _, shard, row in islice(
+            heapq.merge(*per_shard, key=lambda item: item[:2]), limit
+        )
+    ]
+    advanced = dict(positions)
+    for shard, row in merged:
+        advanced[shard] = max(advanced[shard], row.seq)
+    return merged, advanced
+
+
+def missed_changes(
+    positions: Positions, changes: List[Tuple[int, OrderChangeModel]]
+) -> bool:
+    """Vrai si les modifications ne suivent pas les positions (trou ignoré ou
+    purgé par la rétention)"""
+    expected = dict(positions)
+    for shard, row in changes:
+        if row.seq != expected[shard] + 1:
+            return True
+        expected[shard] = row.seq
+    return False
+
+
+def purge_order_changes(db: Session, retention_days: int = CHANGE_FEED_RETENTION_DAYS):
+    """Supprime les modifications anciennes (la plus récente est conservée)"""
+    cutoff = utc_now() - timedelta(days=retention_days)
+    latest = db.scalar(select(func.max(OrderChangeModel.seq)))
+    if latest is None:
+        return 0
+    result = db.execute(
+        delete(OrderChangeModel).where(
+            OrderChangeModel.changed_at < cutoff, OrderChangeModel.seq < latest
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+class ChangeFeedHub:
+    """Lit le flux pour toutes les requêtes en attente du process"""
+
+    def __init__(
+        self,
+        poll_interval: float = CHANGE_FEED_POLL_INTERVAL,
+        buffer_size: int = CHANGE_FEED_BUFFER_SIZE,
+    ):
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.version = 0
+        self.latest: Positions = {}
+        self.positions: Positions = {}
+        self._floor: Positions = {}
+        self._buffer: deque = deque()
+        self._condition: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Démarre le poller (à appeler depuis la boucle d'événements)"""
+        if self.running:
+            return
+        self._condition = asyncio.Condition()
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self.follow({})
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def _poll(self):
+        while True:
+            try:
+                self.latest = await asyncio.to_thread(latest_positions)
+                if not self._floor:
+                    self.follow(self.latest)
+                elif self.behind(self.positions):
+                    changes, advanced = await asyncio.to_thread(
+                        read_changes, dict(self.positions), self.buffer_size
+                    )
+                    if self.extend(changes, advanced):
+                        async with self._condition:
+                            self._condition.notify_all()
+            except Exception as e:
+                print(f"Error polling order changes: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def follow(self, positions: Positions):
+        """Repart d'un tampon vide, à partir de `positions`"""
+        self.positions = dict(positions)
+        self._floor = dict(positions)
+        self._buffer.clear()
+
+    def extend(
+        self, changes: List[Tuple[int, OrderChangeModel]], advanced: Positions
+    ) -> bool:
+        """Ajoute au tampon les modifications lues ; vrai s'il y en a"""
+        self._buffer.extend(changes)
+        while len(self._buffer) > self.buffer_size:
+            shard, row = self._buffer.popleft()
+            self._floor[shard] = row.seq
+        self.positions = advanced
+        if changes:
+            self.version += 1
+        return bool(changes)
+
+    def read(
+        self, positions: Positions, limit: int
+    ) -> Optional[Tuple[List[Tuple[int, OrderChangeModel]], Positions]]:
+        """Modifications après `positions` depuis le tampon ; None si le
+        curseur est plus ancien que le tampon"""
+        if not self._floor or any(
+            positions.get(shard, 0) < floor for shard, floor in self._floor.items()
+        ):
+            return None
+        changes = list(
+            islice(
+                (
+                    (shard, row)
+                    for shard, row in self._buffer
+                    if row.seq > positions.get(shard, 0)
+                ),
+                limit,
+            )
+        )
+        advanced = dict(positions)
+        for shard, row in changes:
+            advanced[shard] = max(advanced.get(shard, 0), row.seq)
+        return changes, advanced
+
+    def behind(self, positions: Positions) -> bool:
+        """Vrai si des modifications connues n'ont pas encore été lues"""
+        return any(positions.get(shard, 0) < seq for shard, seq in self.latest.items())
+
+    async def wait(self, version: int, timeout: float) -> bool:
+        """Attend une nouvelle version (ou `timeout`) ; vrai si elle a changé"""
+        if timeout <= 0:
+            return self.version != version
+        if not self.running:
+            # Pas de poller (tests, scripts) : simple attente avant relecture
+            await asyncio.sleep(min(timeout, self.poll_interval))
+            return True
+        try:
+            async with self._condition:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.version != version),
+                    timeout,
+                )
+        except asyncio.TimeoutError:
+            pass
+        return self.version != version
+
+
+change_feed_hub = ChangeFeedHub()
+
+
+async def wait_for_changes(
+    positions: Positions, limit: int, timeout: float, hub: ChangeFeedHub = None
+) -> Tuple[List[Tuple[int, OrderChangeModel]], Positions, bool]:
+    """Long-poll : modifications, nouvelles positions et indicateur de
+    resynchronisation ; attend jusqu'à `timeout` s'il n'y en a pas"""
+    hub = hub or change_feed_hub
+    deadline = time.monotonic() + timeout
+    while True:
+        version = hub.version
+        buffered = hub.read(positions, limit)
+        if buffered is not None:
+            changes, advanced = buffered
+        else:
+            changes, advanced = await asyncio.to_thread(read_changes, positions, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes, advanced, missed_changes(positions, changes)
+        if buffered is None and hub.behind(positions):
+            # Modifications bloquées derrière un trou : relecture au prochain tour
+            remaining = min(remaining, hub.poll_interval)
+        await hub.wait(version, remaining)
+
+
+def change_item(shard: int, row: OrderChangeModel) -> OrderChange:
+    return OrderChange(
+        seq=row.seq,
+        shard=shard,
+        order_id=row.order_id,
+        change_type=row.change_type,
+        status=row.status,
+        changed_at=row.changed_at,
+    )
+
+
+async def stream_changes(
+    request: Request,
+    positions: Positions,
+    limit: int,
+    keepalive: float = CHANGE_FEED_KEEPALIVE,
+    duration: float = CHANGE_FEED_STREAM_TIMEOUT,
+    hub: ChangeFeedHub = None,
+) -> AsyncIterator[str]:
+    """Server-Sent Events : un événement par modification, id = curseur de
+    reprise, précédé d'un événement `reset` si des modifications ont été manquées"""
+    deadline = time.monotonic() + duration
+    yield f"retry: {int(1000 * (hub or change_feed_hub).poll_interval * 2)}\n\n"
+    while time.monotonic() < deadline and not await request.is_disconnected():
+        timeout = min(keepalive, deadline - time.monotonic())
+        changes, _, reset = await wait_for_changes(positions, limit, timeout, hub)
+        if not changes:
+            yield ": keepalive\n\n"
+            continue
+        if reset:
+            # Des modifications ont pu être manquées : le client resynchronise
+            yield "event: reset\ndata: {}\n\n"
+        for shard, row in changes:
+            positions[shard] = max(positions[shard], row.seq)
+            yield (
+                f"id: {encode_position_cursor(positions)}\n"
+                "event: order_change\n"
+                f"data: {change_item(shard, row).model_dump_json()}\n\n"
+            )
@@ -0,0 +1,264 @@
+# app/compression.py
+"""
+Compression des réponses négociée via Accept-Encoding (zstd, br, gzip).
+
+Les réponses sous COMPRESSION_MIN_SIZE ne sont pas compressées ; au-delà de
+COMPRESSION_OFFLOAD_SIZE, la compression s'exécute dans un thread pour ne
+pas bloquer la boucle d'événements. Les réponses en streaming sont
+compressées morceau par morceau (avec flush à chaque envoi).
+
+brotli et zstandard sont optionnels : sans eux, seul gzip est proposé.
+Le niveau se règle globalement (COMPRESSION_LEVEL) ou par route
+(ROUTE_COMPRESSION_LEVELS, 0 désactive la compression de la route).
+"""
+
+import asyncio
+import gzip
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.admission import route_key
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_OFFLOAD_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "262144"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "5"))
+
+# Niveaux spécifiques : "METHODE /chemin" -> niveau (0 = pas de compression)
+ROUTE_COMPRESSION_LEVELS = {
+    "GET /orders": 6,
+    "GET /orders/search": 6,
+    "GET /orders/{order_id}/events": 6,
+    "POST /orders/batch-get": 6,
+}
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "text/",
+)
+
+
+class GzipCodec:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self.level = max(1, min(level, 9))
+        self._stream = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress_all(self, data: bytes) -> bytes:
+        return gzip.compress(data, self.level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._stream.compress(data) + self._stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._stream.flush(zlib.Z_FINISH)
+
+
+class BrotliCodec:
+    name = "br"
+
+    def __init__(self, level: int):
+        self.level = max(0, min(level, 11))
+        self._stream = None
+
+    def compress_all(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.level)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._stream is None:
+            self._stream = brotli.Compressor(quality=self.level)
+        return self._stream.process(data) + self._stream.flush()
+
+    def finish(self) -> bytes:
+        if self._stream is None:
+            self._stream = brotli.Compressor(quality=self.level)
+        return self._stream.finish()
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self.level = max(1, min(level, 22))
+        self._stream = None
+
+    def compress_all(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._stream is None:
+            self._stream = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return self._stream.compress(data) + self._stream.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        if self._stream is None:
+            self._stream = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return self._stream.flush()
+
+
+def available_codecs() -> Dict[str, type]:
+    """Codecs disponibles, par ordre de préférence du serveur"""
+    codecs = {}
+    if zstandard is not None:
+        codecs["zstd"] = ZstdCodec
+    if brotli is not None:
+        codecs["br"] = BrotliCodec
+    codecs["gzip"] = GzipCodec
+    return codecs
+
+
+def negotiate_encoding(accept_encoding: str, supported) -> Optional[str]:
+    """Encodage accepté par le client (q > 0), préférence serveur à q égal"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in supported:
+        q = weights.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def is_compressible(start_message: dict, headers: Headers) -> bool:
+    if start_message["status"] < 200 or start_message["status"] in (204, 304):
+        return False
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI compressant les réponses selon Accept-Encoding"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        offload_size: int = COMPRESSION_OFFLOAD_SIZE,
+        level: int = COMPRESSION_LEVEL,
+        route_levels: Optional[Dict[str, int]] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.level = level
+        self.route_levels = (
+            ROUTE_COMPRESSION_LEVELS if route_levels is None else route_levels
+        )
+        self.codecs = available_codecs()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.codecs)
+        level = self.route_levels.get(route_key(scope), self.level)
+        if encoding is None or level <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressingResponder(
+            send,
+            self.codecs[encoding](level),
+            self.minimum_size,
+            self.offload_size,
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class CompressingResponder:
+    """Intercepte les messages de réponse et compresse le corps"""
+
+    def __init__(self, send, codec, minimum_size: int, offload_size: int):
+        self._send = send
+        self.codec = codec
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self._start = None
+        self._mode = None  # "identity", "buffered" ou "stream"
+
+    async def _run(self, function, data: bytes) -> bytes:
+        if len(data) >= self.offload_size:
+            return await asyncio.to_thread(function, data)
+        return function(data)
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._mode is None:
+            headers = MutableHeaders(raw=self._start["headers"])
+            if not is_compressible(self._start, headers) or (
+                not more_body and len(body) < self.minimum_size
+            ):
+                self._mode = "identity"
+                await self._send(self._start)
+                await self._send(message)
+                return
+
+            headers["content-encoding"] = self.codec.name
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                self._mode = "stream"
+                del headers["content-length"]
+            else:
+                self._mode = "buffered"
+                body = await self._run(self.codec.compress_all, body)
+                headers["content-length"] = str(len(body))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            await self._send(self._start)
+
+        if self._mode == "stream":
+            chunk = await self._run(self.codec.compress, body) if body else b""
+            if not more_body:
+                chunk += self.codec.finish()
+            await self._send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+            return
+
+        await self._send(message)
@@ -0,0 +1,94 @@
+# app/customer_projection.py
+"""
+Projection locale des clients (table customers_projection).
+
+Chaque événement customer.* se traduit par un upsert d'une seule ligne ;
+les lectures de commandes joignent cette table pour afficher les données
+client à jour, tandis que les colonnes customer_name/customer_email des
+commandes conservent la valeur au moment de la commande.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.archive import anonymize_archived_orders
+from app.change_feed import record_customer_orders_changed
+from app.db import dialect_insert
+from app.models import CustomerProjectionModel, OrderModel
+
+ANONYMIZED_EMAIL = "client.supprime@anonyme.com"
+
+
+def parse_event_timestamp(timestamp: Optional[str]) -> datetime:
+    """Horodatage naïf UTC d'un événement (maintenant s'il est absent)"""
+    if timestamp:
+        try:
+            parsed = datetime.fromisoformat(timestamp)
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            return parsed
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def upsert_customer(
+    db: Session,
+    customer_id: str,
+    customer_data: dict,
+    event_at: datetime,
+    deleted: bool = False,
+):
+    """Applique un événement client à la projection (un seul upsert)"""
+    table = CustomerProjectionModel.__table__
+
+    values = {}
+    if "name" in customer_data:
+        values["name"] = customer_data["name"]
+    if "username" in customer_data:
+        values["email"] = customer_data.get("username", "")
+
+    insert = dialect_insert(db)
+    stmt = insert(table).values(
+        customer_id=customer_id,
+        deleted=deleted,
+        source_updated_at=event_at,
+        updated_at=datetime.now(timezone.utc),
+        **values,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.customer_id],
+        set_={
+            **{column: stmt.excluded[column] for column in values},
+            "deleted": stmt.excluded.deleted,
+            "source_updated_at": stmt.excluded.source_updated_at,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=table.c.source_updated_at <= stmt.excluded.source_updated_at,
+    )
+    db.execute(stmt)
+
+
+def delete_customer(db: Session, customer_id: str, event_at: datetime) -> int:
+    """Marque le client supprimé et anonymise ses commandes en une requête"""
+    anonymized_name = f"Client supprimé ({customer_id})"
+    upsert_customer(
+        db,
+        customer_id,
+        {"name": anonymized_name, "username": ANONYMIZED_EMAIL},
+        event_at,
+        deleted=True,
+    )
+    result = db.execute(
+        update(OrderModel)
+        .where(OrderModel.customer_id == customer_id)
+        .values(customer_name=anonymized_name, customer_email=ANONYMIZED_EMAIL)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        record_customer_orders_changed(db, customer_id, "anonymized")
+    anonymize_archived_orders(db, customer_id, anonymized_name, ANONYMIZED_EMAIL)
+    return result.rowcount
@@ -0,0 +1,449 @@
+# app/export.py
+"""
+Export colonnaire des commandes et de leurs articles pour l'analyse.
+
+Les lignes sont lues par curseur serveur (lots de EXPORT_BATCH_SIZE),
+converties en record batches Arrow et écrites en Parquet, partitionné par
+mois de création :
+
+    <dir>/orders/month=YYYY-MM/part-<run>-s<shard>.parquet
+    <dir>/order_items/month=YYYY-MM/part-<run>-s<shard>.parquet
+
+Chaque shard est lu dans l'ordre de created_at, un seul fichier est donc
+ouvert à la fois et la mémoire reste bornée par la taille d'un lot. Les
+commandes archivées (app/archive.py) sont incluses (colonne `archived`).
+
+L'export est incrémental : seules les commandes dont updated_at dépasse le
+watermark du shard (<dir>/_watermarks.json, moins EXPORT_WATERMARK_LAG
+secondes pour les transactions validées en retard) sont réécrites, avec
+tous leurs articles, dans de nouveaux fichiers. Une commande peut donc
+apparaître plusieurs fois : la ligne de plus grand updated_at fait foi. Les
+suppressions ne sont pas exportées (voir GET /orders/changes).
+
+GET /export/orders renvoie les mêmes lignes en flux Arrow IPC.
+
+pyarrow est optionnel : sans lui, l'export est désactivé.
+
+Usage :
+    python -m app.export parquet [--output DIR] [--full]
+"""
+
+import argparse
+import heapq
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.archive import decode_document, restore_columns
+from app.models import OrderArchiveModel, OrderItemModel, OrderModel
+from app.sharding import open_shard_session, shard_count
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    pa = None
+    pq = None
+
+load_dotenv()
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+EXPORT_WATERMARK_LAG = float(os.getenv("EXPORT_WATERMARK_LAG", "30"))
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+
+EXPORT_TABLES = ("orders", "order_items")
+WATERMARKS_FILE = "_watermarks.json"
+
+ORDER_COLUMNS = (
+    "order_id",
+    "customer_id",
+    "customer_name",
+    "customer_email",
+    "shipping_address",
+    "shipping_city",
+    "shipping_postal_code",
+    "shipping_country",
+    "currency",
+    "total_amount",
+    "status",
+    "created_at",
+    "updated_at",
+    "shipped_at",
+    "delivered_at",
+)
+ITEM_COLUMNS = (
+    "id",
+    "product_id",
+    "product_name",
+    "product_sku",
+    "product_price",
+    "quantity",
+    "total_price",
+)
+
+
+def export_available() -> bool:
+    return pa is not None
+
+
+def export_schema(table: str) -> "pa.Schema":
+    money = pa.decimal128(10, 2)
+    timestamp = pa.timestamp("us")
+    if table == "orders":
+        fields = [
+            ("order_id", pa.string()),
+            ("customer_id", pa.string()),
+            ("customer_name", pa.string()),
+            ("customer_email", pa.string()),
+            ("shipping_address", pa.string()),
+            ("shipping_city", pa.string()),
+            ("shipping_postal_code", pa.string()),
+            ("shipping_country", pa.string()),
+            ("currency", pa.string()),
+            ("total_amount", money),
+            ("status", pa.string()),
+            ("created_at", timestamp),
+            ("updated_at", timestamp),
+            ("shipped_at", timestamp),
+            ("delivered_at", timestamp),
+        ]
+    elif table == "order_items":
+        fields = [
+            ("order_id", pa.string()),
+            ("item_id", pa.int64()),
+            ("product_id", pa.string()),
+            ("product_name", pa.string()),
+            ("product_sku", pa.string()),
+            ("product_price", money),
+            ("quantity", pa.int64()),
+            ("total_price", money),
+            ("order_created_at", timestamp),
+            ("order_updated_at", timestamp),
+        ]
+    else:
+        raise ValueError(f"Table d'export inconnue: {table}")
+    return pa.schema(fields + [("shard", pa.int16()), ("archived", pa.bool_())])
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _money(value):
+    if value is None:
+        return None
+    return Decimal(value).quantize(Decimal("0.01"))
+
+
+def _order_row(values: dict) -> dict:
+    row = {name: _naive_utc(values[name]) for name in ORDER_COLUMNS}
+    row["total_amount"] = _money(row["total_amount"])
+    return row
+
+
+def _item_row(values: dict, order_id: str, created_at, updated_at) -> dict:
+    return {
+        "order_id": order_id,
+        "item_id": values["id"],
+        "product_id": values["product_id"],
+        "product_name": values["product_name"],
+        "product_sku": values["product_sku"],
+        "product_price": _money(values["product_price"]),
+        "quantity": values["quantity"],
+        "total_price": _money(values["total_price"]),
+        "order_created_at": _naive_utc(created_at),
+        "order_updated_at": _naive_utc(updated_at),
+    }
+
+
+def _hot_rows(db: Session, table: str, since: Optional[datetime]) -> Iterator[dict]:
+    if table == "orders":
+        stmt = select(*(getattr(OrderModel, name) for name in ORDER_COLUMNS))
+        order_by = (OrderModel.created_at, OrderModel.id)
+    else:
+        stmt = select(
+            *(getattr(OrderItemModel, name) for name in ITEM_COLUMNS),
+            OrderModel.order_id.label("order_key"),
+            OrderModel.created_at.label("order_created_at"),
+            OrderModel.updated_at.label("order_updated_at"),
+        ).join(OrderModel, OrderItemModel.order_id == OrderModel.id)
+        order_by = (OrderModel.created_at, OrderModel.id, OrderItemModel.id)
+    if since is not None:
+        stmt = stmt.where(OrderModel.updated_at > since)
+
+    result = db.execute(
+        stmt.order_by(*order_by).execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        )
+    )
+    for values in result.mappings():
+        if table == "orders":
+            row = _order_row(values)
+        else:
+            row = _item_row(
+                values,
+                values["order_key"],
+                values["order_created_at"],
+                values["order_updated_at"],
+            )
+        yield {**row, "archived": False}
+
+
+def _archived_rows(
+    db: Session, table: str, since: Optional[datetime]
+) -> Iterator[dict]:
+    stmt = select(
+        OrderArchiveModel.customer_name,
+        OrderArchiveModel.customer_email,
+        OrderArchiveModel.updated_at,
+        OrderArchiveModel.document,
+    )
+    if since is not None:
+        stmt = stmt.where(OrderArchiveModel.updated_at > since)
+    result = db.execute(
+        stmt.order_by(
+            OrderArchiveModel.created_at, OrderArchiveModel.order_id
+        ).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    for customer_name, customer_email, updated_at, document in result:
+        content = decode_document(document)
+        order = restore_columns(OrderModel, content["order"])
+        # Colonnes modifiables après archivage (anonymisation)
+        order["customer_name"] = customer_name
+        order["customer_email"] = customer_email
+        order["updated_at"] = updated_at
+        if table == "orders":
+            yield {**_order_row(order), "archived": True}
+            continue
+        for item in content["items"]:
+            yield {
+                **_item_row(
+                    restore_columns(OrderItemModel, item),
+                    order["order_id"],
+                    order["created_at"],
+                    order["updated_at"],
+                ),
+                "archived": True,
+            }
+
+
+def _created_at(row: dict) -> datetime:
+    return row.get("created_at") or row["order_created_at"]
+
+
+def iter_export_rows(
+    db: Session, table: str, shard: int, since: Optional[datetime] = None
+) -> Iterator[dict]:
+    """Lignes d'un shard (actives et archivées), dans l'ordre de created_at"""
+    for row in heapq.merge(
+        _hot_rows(db, table, since),
+        _archived_rows(db, table, since),
+        key=_created_at,
+    ):
+        row["shard"] = shard
+        yield row
+
+
+def iter_record_batches(
+    rows: Iterable[dict], schema: "pa.Schema", batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator["pa.RecordBatch"]:
+    """Regroupe des lignes en record batches d'au plus `batch_size` lignes"""
+    columns: Dict[str, list] = {name: [] for name in schema.names}
+    count = 0
+    for row in rows:
+        for name, values in columns.items():
+            values.append(row.get(name))
+        count += 1
+        if count >= batch_size:
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns = {name: [] for name in schema.names}
+            count = 0
+    if count:
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def _month_batches(rows: Iterable[dict], batch_size: int):
+    """(mois, lignes) : lots découpés aux changements de mois de création"""
+    month, batch = None, []
+    for row in rows:
+        row_month = f"{_created_at(row):%Y-%m}"
+        if batch and (row_month != month or len(batch) >= batch_size):
+            yield month, batch
+            batch = []
+        month = row_month
+        batch.append(row)
+    if batch:
+        yield month, batch
+
+
+def write_partitioned(
+    rows: Iterable[dict],
+    table: str,
+    output_dir: str,
+    file_name: str,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> List[str]:
+    """Écrit des lignes triées par created_at en Parquet partitionné par mois"""
+    schema = export_schema(table)
+    written = []
+    writer, current_month, tmp_path = None, None, None
+
+    try:
+        for month, batch in _month_batches(rows, batch_size):
+            if month != current_month:
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                    os.replace(tmp_path, tmp_path[: -len(".tmp")])
+                    written.append(tmp_path[: -len(".tmp")])
+                directory = os.path.join(output_dir, table, f"month={month}")
+                os.makedirs(directory, exist_ok=True)
+                tmp_path = os.path.join(directory, f"{file_name}.parquet.tmp")
+                writer = pq.ParquetWriter(
+                    tmp_path, schema, compression=EXPORT_COMPRESSION
+                )
+                current_month = month
+            for record_batch in iter_record_batches(batch, schema, batch_size):
+                writer.write_batch(record_batch)
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, tmp_path[: -len(".tmp")])
+            written.append(tmp_path[: -len(".tmp")])
+    finally:
+        # Échec en cours d'écriture : pas de fichier partiel
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+    return written
+
+
+def load_watermarks(output_dir: str) -> Dict[int, datetime]:
+    path = os.path.join(output_dir, WATERMARKS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {
+            int(shard): datetime.fromisoformat(value)
+            for shard, value in json.load(f).items()
+        }
+
+
+def save_watermarks(output_dir: str, watermarks: Dict[int, datetime]):
+    path = os.path.join(output_dir, WATERMARKS_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(
+            {str(shard): value.isoformat() for shard, value in watermarks.items()},
+            f,
+            indent=2,
+        )
+    os.replace(f"{path}.tmp", path)
+
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# Fin de flux Arrow IPC (continuation + longueur nulle)
+ARROW_STREAM_END = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def iter_arrow_stream(
+    table: str, since: Optional[datetime] = None, batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Flux Arrow IPC de tous les shards, un message par record batch"""
+    schema = export_schema(table)
+    yield schema.serialize().to_pybytes()
+    for shard in range(shard_count()):
+        db = open_shard_session(shard)
+        try:
+            rows = iter_export_rows(db, table, shard, since)
+            for record_batch in iter_record_batches(rows, schema, batch_size):
+                yield record_batch.serialize().to_pybytes()
+        finally:
+            db.close()
+    yield ARROW_STREAM_END
+
+
+def _track_updated_at(rows: Iterable[dict], latest: dict) -> Iterator[dict]:
+    for row in rows:
+        if latest.get("value") is None or row["updated_at"] > latest["value"]:
+            latest["value"] = row["updated_at"]
+        yield row
+
+
+def export_parquet(
+    output_dir: Optional[str] = None,
+    full: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> List[str]:
+    """Export Parquet de tous les shards ; incrémental sauf si `full`"""
+    if not export_available():
+        raise RuntimeError("pyarrow n'est pas installé")
+    output_dir = output_dir or EXPORT_DIR
+    watermarks = {} if full else load_watermarks(output_dir)
+    run_id = f"{utc_now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    written = []
+
+    for shard in range(shard_count()):
+        since = watermarks.get(shard)
+        if since is not None:
+            since -= timedelta(seconds=EXPORT_WATERMARK_LAG)
+        latest = {"value": watermarks.get(shard)}
+        file_name = f"part-{run_id}-s{shard}"
+
+        db = open_shard_session(shard)
+        try:
+            orders = _track_updated_at(
+                iter_export_rows(db, "orders", shard, since), latest
+            )
+            written += write_partitioned(
+                orders, "orders", output_dir, file_name, batch_size
+            )
+            items = iter_export_rows(db, "order_items", shard, since)
+            written += write_partitioned(
+                items, "order_items", output_dir, file_name, batch_size
+            )
+        finally:
+            db.close()
+
+        # Le watermark n'avance qu'une fois les fichiers du shard écrits
+        if latest["value"] is not None:
+            watermarks[shard] = latest["value"]
+            save_watermarks(output_dir, watermarks)
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export colonnaire des commandes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parquet_parser = subparsers.add_parser(
+        "parquet", help="Export Parquet partitionné par mois (incrémental)"
+    )
+    parquet_parser.add_argument("--output", default=None)
+    parquet_parser.add_argument(
+        "--full", action="store_true", help="Ignore le watermark (export complet)"
+    )
+    parquet_parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+
+    args = parser.parse_args()
+    if args.command == "parquet":
+        written = export_parquet(args.output, args.full, args.batch_size)
+        print(f"Exported {len(written)} Parquet files")
+
+
+if __name__ == "__main__":
+    main()
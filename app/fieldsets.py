@@ -0,0 +1,158 @@
+# app/fieldsets.py
+"""
+Sélection de champs (`fields=order_id,status,total_amount`) sur les routes de
+lecture des commandes.
+
+Seules les colonnes nécessaires sont chargées (load_only) ; les articles et
+la projection client ne sont chargés que si un champ les utilise. Le modèle
+de réponse est construit dynamiquement et mis en cache par ensemble de
+champs, puis sérialisé directement en JSON.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy.orm import load_only, noload, selectinload
+
+from app.models import OrderModel
+from app.schemas import Order
+
+# Colonnes chargées quel que soit le choix (identification et tri des listes)
+ALWAYS_LOADED = (OrderModel.id, OrderModel.order_id, OrderModel.created_at)
+
+# Champ exposé -> colonnes nécessaires
+FIELD_COLUMNS = {
+    "id": (OrderModel.id,),
+    "order_id": (OrderModel.order_id,),
+    "customer_id": (OrderModel.customer_id,),
+    "customer_name": (OrderModel.customer_id, OrderModel.customer_name),
+    "customer_email": (OrderModel.customer_id, OrderModel.customer_email),
+    "customer_name_at_order": (OrderModel.customer_name,),
+    "customer_email_at_order": (OrderModel.customer_email,),
+    "shipping_address": (OrderModel.shipping_address,),
+    "shipping_city": (OrderModel.shipping_city,),
+    "shipping_postal_code": (OrderModel.shipping_postal_code,),
+    "shipping_country": (OrderModel.shipping_country,),
+    "currency": (OrderModel.currency,),
+    "total_amount": (OrderModel.total_amount,),
+    "status": (OrderModel.status,),
+    "created_at": (OrderModel.created_at,),
+    "updated_at": (OrderModel.updated_at,),
+    "shipped_at": (OrderModel.shipped_at,),
+    "delivered_at": (OrderModel.delivered_at,),
+    "items": (),
+    "items_count": (),
+}
+ITEM_FIELDS = {"items", "items_count"}
+# Données client à jour : nécessitent la projection (relation customer)
+CUSTOMER_FIELDS = {"customer_name", "customer_email"}
+
+ORDER_FIELDS = tuple(FIELD_COLUMNS)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Champs demandés, dans l'ordre canonique ; None si aucun filtre"""
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(requested - set(FIELD_COLUMNS))
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Champs invalides: {', '.join(unknown) or '(aucun)'}. "
+                f"Champs disponibles: {', '.join(ORDER_FIELDS)}"
+            ),
+        )
+    return tuple(name for name in ORDER_FIELDS if name in requested)
+
+
+def apply_fields(query, fields: Optional[Tuple[str, ...]]):
+    """Ajoute à une requête ORM les options de chargement de `fields`"""
+    if fields is None:
+        return query
+    return query.options(*load_options(fields))
+
+
+def load_options(fields: Tuple[str, ...]) -> list:
+    """Options de chargement SQLAlchemy pour un ensemble de champs"""
+    columns = dict.fromkeys(ALWAYS_LOADED)
+    for name in fields:
+        columns.update(dict.fromkeys(FIELD_COLUMNS[name]))
+
+    options = [load_only(*columns)]
+    if ITEM_FIELDS.intersection(fields):
+        options.append(selectinload(OrderModel.items))
+    else:
+        options.append(noload(OrderModel.items))
+    if not CUSTOMER_FIELDS.intersection(fields):
+        options.append(noload(OrderModel.customer))
+    return options
+
+
+@lru_cache(maxsize=256)
+def fieldset_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Sous-modèle de Order limité à `fields` (mis en cache)"""
+    definitions = {}
+    for name in fields:
+        if name == "items_count":
+            definitions[name] = (int, 0)
+        else:
+            definitions[name] = (Order.model_fields[name].annotation, None)
+    return create_model(
+        "OrderFields_" + "_".join(fields),
+        __config__=ConfigDict(from_attributes=True),
+        **definitions,
+    )
+
+
+@lru_cache(maxsize=256)
+def fieldset_list_adapter(fields: Tuple[str, ...]) -> TypeAdapter:
+    return TypeAdapter(List[fieldset_model(fields)])
+
+
+def field_values(order: OrderModel, fields: Tuple[str, ...]) -> Dict[str, object]:
+    values = {}
+    for name in fields:
+        if name == "customer_name":
+            values[name] = order.current_customer_name
+        elif name == "customer_email":
+            values[name] = order.current_customer_email
+        elif name == "customer_name_at_order":
+            values[name] = order.customer_name
+        elif name == "customer_email_at_order":
+            values[name] = order.customer_email
+        elif name == "items_count":
+            values[name] = len(order.items)
+        else:
+            values[name] = getattr(order, name)
+    return values
+
+
+def fieldset_response(
+    data, fields: Tuple[str, ...], response: Optional[Response] = None
+) -> Response:
+    """Réponse JSON d'une commande ou d'une liste de commandes projetées"""
+    if isinstance(data, list):
+        adapter = fieldset_list_adapter(fields)
+        body = adapter.dump_json(
+            adapter.validate_python(
+                [field_values(order, fields) for order in data], from_attributes=True
+            )
+        )
+    else:
+        model = fieldset_model(fields)
+        body = model.model_validate(
+            field_values(data, fields), from_attributes=True
+        ).model_dump_json()
+
+    headers = {}
+    if response is not None:
+        headers = {
+            key: value
+            for key, value in response.headers.items()
+            if key != "content-length"
+        }
+    return Response(content=body, media_type="application/json", headers=headers)
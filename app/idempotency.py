@@ -0,0 +1,196 @@
+# app/idempotency.py
+"""
+Gestion de l'en-tête Idempotency-Key sur les routes d'écriture.
+
+La première requête réserve la clé, exécute la route puis enregistre sa
+réponse. Les rejeux reçoivent la réponse enregistrée sans ré-exécution ;
+un doublon concurrent attend la fin de la requête en cours.
+"""
+
+import asyncio
+import functools
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import IdempotencyKeyModel
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+# Durée de réservation d'une clé en cours, au-delà elle peut être reprise
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def request_fingerprint(request: Request) -> str:
+    """Empreinte de la requête (méthode, chemin, paramètres et corps)"""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.url.path.encode())
+    digest.update(request.url.query.encode())
+    digest.update(await request.body())
+    return digest.hexdigest()
+
+
+def replay_response(record: IdempotencyKeyModel) -> JSONResponse:
+    return JSONResponse(
+        content=record.response_body,
+        status_code=record.status_code,
+        headers={REPLAY_HEADER: "true"},
+    )
+
+
+def _claim_key(db: Session, key: str, fingerprint: str) -> bool:
+    """Réserve la clé ; retourne False si elle est déjà prise"""
+    now = utc_now()
+    db.query(IdempotencyKeyModel).filter(IdempotencyKeyModel.key == key).filter(
+        IdempotencyKeyModel.expires_at <= now
+    ).delete(synchronize_session=False)
+    try:
+        db.execute(
+            insert(IdempotencyKeyModel).values(
+                key=key,
+                request_hash=fingerprint,
+                created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+            )
+        )
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def _read_key(db: Session, key: str) -> Optional[IdempotencyKeyModel]:
+    """Relit la clé hors de toute transaction (objet détaché, déjà chargé)"""
+    db.expire_all()
+    record = db.get(IdempotencyKeyModel, key)
+    if record is not None:
+        # Détaché, il n'est pas expiré (ni relu) par le rollback
+        db.expunge(record)
+    db.rollback()
+    return record
+
+
+async def _wait_for_response(
+    db: Session, key: str, fingerprint: str
+) -> Optional[IdempotencyKeyModel]:
+    """Attend la réponse de la requête en cours ; None si la clé a été libérée"""
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_TIMEOUT
+    delay = 0.05
+
+    while True:
+        # Accès base hors de la boucle d'événements pendant l'attente
+        record = await asyncio.to_thread(_read_key, db, key)
+
+        if record is None or record.expires_at <= utc_now():
+            return None
+        if record.request_hash != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key déjà utilisée pour une autre requête",
+            )
+        if record.status_code is not None:
+            return record
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="Une requête avec cette Idempotency-Key est en cours",
+            )
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def _store_response(db: Session, key: str, status_code: int, body):
+    record = db.get(IdempotencyKeyModel, key)
+    if record is not None:
+        record.status_code = status_code
+        record.response_body = body
+        record.expires_at = utc_now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        db.commit()
+
+
+def _release_key(db: Session, key: str):
+    db.query(IdempotencyKeyModel).filter(IdempotencyKeyModel.key == key).delete(
+        synchronize_session=False
+    )
+    db.commit()
+
+
+def idempotent(response_model):
+    """Décorateur rendant une route idempotente via l'en-tête Idempotency-Key.
+
+    La route décorée doit déclarer les paramètres `request`, `db` et
+    `idempotency_key`. Les erreurs 4xx sont enregistrées comme réponses ;
+    les erreurs serveur libèrent la clé pour permettre un nouvel essai.
+    """
+
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            key = kwargs.get("idempotency_key")
+            if not key:
+                return await endpoint(*args, **kwargs)
+
+            if len(key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+                raise HTTPException(
+                    status_code=400, detail="Idempotency-Key trop longue"
+                )
+
+            request: Request = kwargs["request"]
+            db: Session = kwargs["db"]
+            fingerprint = await request_fingerprint(request)
+
+            while not _claim_key(db, key, fingerprint):
+                record = await _wait_for_response(db, key, fingerprint)
+                if record is not None:
+                    return replay_response(record)
+
+            try:
+                result = await endpoint(*args, **kwargs)
+            except HTTPException as e:
+                db.rollback()
+                if e.status_code >= 500:
+                    _release_key(db, key)
+                else:
+                    _store_response(db, key, e.status_code, {"detail": e.detail})
+                raise
+            except Exception:
+                db.rollback()
+                _release_key(db, key)
+                raise
+
+            body = jsonable_encoder(response_model.model_validate(result))
+            _store_response(db, key, 200, body)
+            return JSONResponse(content=body)
+
+        return wrapper
+
+    return decorator
+
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    """Supprime les clés dont la durée de vie est dépassée"""
+    deleted = (
+        db.query(IdempotencyKeyModel)
+        .filter(IdempotencyKeyModel.expires_at <= utc_now())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
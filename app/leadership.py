@@ -0,0 +1,165 @@
+# app/leadership.py
+"""
+Élection d'un worker « leader » parmi les process de l'API.
+
+Seul le leader consomme les événements externes et exécute les tâches
+périodiques globales (purge des clés d'idempotence) ; les autres workers ne
+servent que le HTTP.
+
+Sous PostgreSQL, le leader détient un verrou consultatif de session
+(pg_try_advisory_lock) sur une connexion dédiée hors pool : si le process
+meurt, la connexion se ferme, le verrou est libéré et un autre worker
+l'obtient au tour suivant (LEADER_POLL_INTERVAL). Pour les autres bases
+(SQLite en développement), un verrou flock sur LEADER_LOCK_FILE joue le même
+rôle entre les process d'une même machine.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - plateforme sans fcntl
+    fcntl = None
+
+LEADER_POLL_INTERVAL = float(os.getenv("LEADER_POLL_INTERVAL", "5"))
+LEADER_LOCK_FILE = os.getenv(
+    "LEADER_LOCK_FILE", os.path.join(tempfile.gettempdir(), "orders-api-leader.lock")
+)
+
+
+def advisory_lock_key(name: str) -> int:
+    """Clé bigint (signée) stable pour pg_advisory_lock"""
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class LeaderElection:
+    """Acquiert et surveille le verrou de leader pour ce process"""
+
+    def __init__(
+        self,
+        engine,
+        name: str,
+        on_elected: Optional[Callable[[], Awaitable[None]]] = None,
+        on_demoted: Optional[Callable[[], Awaitable[None]]] = None,
+        poll_interval: float = LEADER_POLL_INTERVAL,
+        lock_file: str = LEADER_LOCK_FILE,
+    ):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.poll_interval = poll_interval
+        self.lock_file = lock_file
+        self.is_leader = False
+        self._key = advisory_lock_key(name)
+        self._connection = None
+        self._lock_fd = None
+        # Connexion dédiée non poolée : la fermer libère réellement le verrou
+        self._engine = None
+        if engine.dialect.name == "postgresql":
+            self._engine = create_engine(engine.url, poolclass=NullPool)
+
+    def try_acquire(self) -> bool:
+        if self._engine is not None:
+            return self._try_advisory_lock()
+        return self._try_file_lock()
+
+    def _try_advisory_lock(self) -> bool:
+        if self._connection is None:
+            self._connection = self._engine.connect()
+        try:
+            acquired = self._connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self._key}
+            ).scalar()
+            self._connection.commit()
+        except Exception:
+            self._discard_connection()
+            raise
+        return bool(acquired)
+
+    def _try_file_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def still_held(self) -> bool:
+        """Vérifie que la connexion portant le verrou est toujours vivante"""
+        if self._engine is None:
+            return True
+        try:
+            self._connection.execute(text("SELECT 1"))
+            self._connection.commit()
+            return True
+        except Exception:
+            self._discard_connection()
+            return False
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                self._connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": self._key}
+                )
+                self._connection.commit()
+            except Exception as e:
+                print(f"Error releasing leader lock: {e}")
+            self._discard_connection()
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.is_leader = False
+
+    def _discard_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    async def _elected(self):
+        self.is_leader = True
+        print(f"Worker {os.getpid()} elected leader ({self.name})")
+        if self.on_elected:
+            await self.on_elected()
+
+    async def _demoted(self):
+        self.is_leader = False
+        print(f"Worker {os.getpid()} lost leadership ({self.name})")
+        if self.on_demoted:
+            await self.on_demoted()
+
+    async def run(self):
+        """Boucle d'élection : candidature, puis surveillance du verrou"""
+        try:
+            while True:
+                try:
+                    if not self.is_leader:
+                        if await asyncio.to_thread(self.try_acquire):
+                            await self._elected()
+                    elif not await asyncio.to_thread(self.still_held):
+                        await self._demoted()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error during leader election: {e}")
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            if self.is_leader and self.on_demoted:
+                await self.on_demoted()
+            await asyncio.to_thread(self.release)
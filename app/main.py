@@ -1,159 +1,415 @@
+import asyncio
 import os
 import json
 from contextlib import asynccontextmanager
+from datetime import datetime
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from dotenv import load_dotenv
 import aio_pika
 
-from app.db import Base, engine
+from app.admission import AdmissionControlMiddleware
+from app.analytics import (
+    ANALYTICS_REFRESH_INTERVAL,
+    ANALYTICS_SNAPSHOT_PATH,
+    order_snapshot,
+)
+from app.audit_log import (
+    ORDER_EVENTS_PARTITION_INTERVAL,
+    setup_order_events_storage,
+)
+from app.catalog import product_cache, upsert_product
+from app.change_feed import (
+    CHANGE_FEED_PURGE_INTERVAL,
+    change_feed_hub,
+    purge_order_changes,
+)
+from app.compression import CompressionMiddleware
+from app.customer_projection import (
+    delete_customer,
+    parse_event_timestamp,
+    upsert_customer,
+)
+from app.db import (
+    Base,
+    SessionLocal,
+    database_reachable,
+    engine,
+    pool_saturated,
+)
+from app.idempotency import purge_expired_idempotency_keys
+from app.leadership import LeaderElection
+from app.post_commit import post_commit_queue
 from app.routes import router as orders_router
-from app.messaging.broker import MessageBroker
+from app.sharding import (
+    all_engines,
+    open_shard_session,
+    shard_count,
+    shard_for_customer,
+)
+from app.sketches import SKETCH_FLUSH_INTERVAL, order_sketches
+from app.messaging.broker import MessageBroker, NonRetryableEventError
 
 load_dotenv()
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+READINESS_REQUIRES_BROKER = os.getenv("READINESS_REQUIRES_BROKER", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 SERVICE_NAME = "orders-api"
 
 broker = MessageBroker(RABBITMQ_URL, SERVICE_NAME)
 
 
 async def handle_external_events(message: aio_pika.IncomingMessage):
-    """Handler pour les événements provenant des autres services"""
-    async with message.process():
-        try:
-            event = json.loads(message.body.decode())
-            event_type = event.get("event_type")
-            data = event.get("data", {})
-
-            print(f"Received event: {event_type} from {event.get('service')}")
-
-            if event_type == "customer.updated":
-                customer_id = data.get("customer_id")
-                print(f"Customer updated: {customer_id}")
-                await update_customer_data_in_orders(customer_id, data)
-
-            elif event_type == "customer.deleted":
-                customer_id = data.get("customer_id")
-                print(f"Customer deleted: {customer_id}")
-                await handle_customer_deletion(customer_id)
-
-            elif event_type == "product.updated":
-                product_id = data.get("product_id")
-                print(f"Product updated: {product_id}")
-                await update_product_data_in_orders(product_id, data)
-
-            elif event_type == "product.deleted":
-                product_id = data.get("product_id")
-                print(f"Product deleted: {product_id}")
-                await handle_product_deletion(product_id)
-
-        except json.JSONDecodeError:
-            print("Error: Invalid JSON in message")
-        except Exception as e:
-            print(f"Error processing event: {str(e)}")
+    """Handler pour les événements provenant des autres services.
 
+    L'acquittement est géré par le broker : une exception déclenche un retry
+    différé, puis la mise en DLQ après épuisement des tentatives.
+    """
+    try:
+        event = json.loads(message.body.decode())
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise NonRetryableEventError("Invalid JSON in message")
+
+    event_type = event.get("event_type")
+    data = event.get("data", {})
+    event_at = parse_event_timestamp(event.get("timestamp"))
+
+    print(f"Received event: {event_type} from {event.get('service')}")
+
+    if event_type in ("customer.created", "customer.updated"):
+        customer_id = data.get("customer_id")
+        print(f"Customer upserted: {customer_id}")
+        await update_customer_projection(customer_id, data, event_at)
+
+    elif event_type == "customer.deleted":
+        customer_id = data.get("customer_id")
+        print(f"Customer deleted: {customer_id}")
+        await handle_customer_deletion(customer_id, event_at)
+
+    elif event_type in ("product.created", "product.updated"):
+        product_id = data.get("product_id")
+        print(f"Product upserted: {product_id}")
+        await update_product_catalog(product_id, data, event_at)
+
+    elif event_type == "product.deleted":
+        product_id = data.get("product_id")
+        print(f"Product deleted: {product_id}")
+        await handle_product_deletion(product_id, event_at)
+
+
+async def update_customer_projection(
+    customer_id: str, customer_data: dict, event_at: datetime
+):
+    """Met à jour la projection locale du client (les commandes ne sont pas réécrites)"""
+    db = open_shard_session(shard_for_customer(customer_id))
+    try:
+        upsert_customer(db, customer_id, customer_data, event_at)
+        db.commit()
+        print(f"Updated customer projection for {customer_id}")
 
-async def update_customer_data_in_orders(customer_id: str, customer_data: dict):
-    """Met à jour les données client dénormalisées dans les commandes"""
-    from app.db import SessionLocal
-    from app.models import OrderModel
+    except Exception as e:
+        print(f"Error updating customer projection: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
-    db = SessionLocal()
+
+async def handle_customer_deletion(customer_id: str, event_at: datetime):
+    """Gère la suppression d'un client (anonymise la projection et les commandes)"""
+    db = open_shard_session(shard_for_customer(customer_id))
     try:
-        orders = (
-            db.query(OrderModel).filter(OrderModel.customer_id == customer_id).all()
-        )
+        anonymized = delete_customer(db, customer_id, event_at)
+        db.commit()
+        print(f"Anonymized {anonymized} orders for deleted customer {customer_id}")
+
+    except Exception as e:
+        print(f"Error handling customer deletion: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
-        for order in orders:
-            if "name" in customer_data:
-                order.customer_name = customer_data["name"]
-            if "username" in customer_data:
-                order.customer_email = customer_data.get("username", "")
 
+async def update_product_catalog(
+    product_id: str, product_data: dict, event_at: datetime
+):
+    """Met à jour le catalogue local utilisé pour valider les futures commandes"""
+    db = SessionLocal()
+    try:
+        upsert_product(db, product_id, product_data, event_at)
         db.commit()
-        print(f"Updated customer data in {len(orders)} orders")
+        product_cache.invalidate(product_id)
+        print(f"Product {product_id} updated - historical orders preserved")
 
     except Exception as e:
-        print(f"Error updating customer data in orders: {e}")
+        print(f"Error updating product catalog: {e}")
         db.rollback()
+        raise
     finally:
         db.close()
 
 
-async def handle_customer_deletion(customer_id: str):
-    """Gère la suppression d'un client (anonymise les commandes)"""
-    from app.db import SessionLocal
-    from app.models import OrderModel
-
+async def handle_product_deletion(product_id: str, event_at: datetime):
+    """Gère la suppression d'un produit (refusé pour les nouvelles commandes)"""
     db = SessionLocal()
     try:
-        orders = (
-            db.query(OrderModel).filter(OrderModel.customer_id == customer_id).all()
-        )
+        upsert_product(db, product_id, {}, event_at, deleted=True)
+        db.commit()
+        product_cache.invalidate(product_id)
+        print(f"Product {product_id} deleted - historical orders preserved")
 
-        for order in orders:
-            order.customer_name = f"Client supprimé ({customer_id})"
-            order.customer_email = "client.supprime@anonyme.com"
+    except Exception as e:
+        print(f"Error handling product deletion: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+IDEMPOTENCY_PURGE_INTERVAL = 3600
 
-        db.commit()
-        print(f"Anonymized {len(orders)} orders for deleted customer {customer_id}")
 
+def purge_idempotency_keys():
+    db = SessionLocal()
+    try:
+        deleted = purge_expired_idempotency_keys(db)
+        if deleted:
+            print(f"Purged {deleted} expired idempotency keys")
     except Exception as e:
-        print(f"Error handling customer deletion: {e}")
+        print(f"Error purging idempotency keys: {e}")
         db.rollback()
     finally:
         db.close()
 
 
-async def update_product_data_in_orders(product_id: str, product_data: dict):
-    """Met à jour les données produit dans les futurs items de commande"""
-    print(f"Product {product_id} updated - historical orders preserved")
+async def purge_idempotency_keys_periodically():
+    """Purge périodique des clés d'idempotence expirées"""
+    while True:
+        await asyncio.to_thread(purge_idempotency_keys)
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
 
 
-async def handle_product_deletion(product_id: str):
-    """Gère la suppression d'un produit"""
-    print(f"Product {product_id} deleted - historical orders preserved")
+def purge_change_feed():
+    for shard in range(shard_count()):
+        db = open_shard_session(shard)
+        try:
+            deleted = purge_order_changes(db)
+            if deleted:
+                print(f"Purged {deleted} old order changes on shard {shard}")
+        except Exception as e:
+            print(f"Error purging order changes: {e}")
+            db.rollback()
+        finally:
+            db.close()
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("Starting Orders API...")
+async def purge_change_feed_periodically():
+    """Purge périodique du flux de modifications au-delà de la rétention"""
+    while True:
+        await asyncio.to_thread(purge_change_feed)
+        await asyncio.sleep(CHANGE_FEED_PURGE_INTERVAL)
+
+
+def maintain_order_events_partitions():
+    for shard_engine in all_engines():
+        try:
+            setup_order_events_storage(shard_engine)
+        except Exception as e:
+            print(f"Error creating order_events partitions: {e}")
 
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created")
 
+async def maintain_order_events_partitions_periodically():
+    """Création périodique des partitions mensuelles d'order_events"""
+    while True:
+        await asyncio.to_thread(maintain_order_events_partitions)
+        await asyncio.sleep(ORDER_EVENTS_PARTITION_INTERVAL)
+
+
+def flush_sketches():
+    db = SessionLocal()
     try:
-        print(f"🔗 Attempting to connect to RabbitMQ: {RABBITMQ_URL}")
+        flushed = order_sketches.flush(db)
+        if flushed:
+            print(f"Flushed order sketches for {flushed} days")
+    except Exception as e:
+        print(f"Error flushing order sketches: {e}")
+    finally:
+        db.close()
+
+
+async def flush_sketches_periodically():
+    """Écriture périodique des sketches accumulés en mémoire"""
+    while True:
+        await asyncio.sleep(SKETCH_FLUSH_INTERVAL)
+        await asyncio.to_thread(flush_sketches)
+
+
+def refresh_analytics_snapshot():
+    sessions = [open_shard_session(shard) for shard in range(shard_count())]
+    try:
+        order_snapshot.refresh(sessions, full=order_snapshot.needs_full_reload())
+        order_snapshot.save(ANALYTICS_SNAPSHOT_PATH)
+    except Exception as e:
+        print(f"Error refreshing analytics snapshot: {e}")
+    finally:
+        for db in sessions:
+            db.close()
 
-        await broker.connect()
-        print("Connected to message broker")
 
+async def refresh_analytics_snapshot_periodically():
+    """Rafraîchissement incrémental de l'instantané colonnaire (tâche du leader)"""
+    while True:
+        await asyncio.to_thread(refresh_analytics_snapshot)
+        await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+
+
+def load_analytics_snapshot(loaded_mtime: float) -> float:
+    """Recharge l'instantané écrit par le leader s'il a changé"""
+    try:
+        mtime = os.path.getmtime(ANALYTICS_SNAPSHOT_PATH)
+    except OSError:
+        return loaded_mtime
+    if mtime == loaded_mtime:
+        return loaded_mtime
+    try:
+        order_snapshot.load(ANALYTICS_SNAPSHOT_PATH)
+    except Exception as e:
+        print(f"Error loading analytics snapshot: {e}")
+        return loaded_mtime
+    return mtime
+
+
+async def load_analytics_snapshot_periodically():
+    """Instantané partagé : les workers non leaders relisent celui du leader"""
+    loaded_mtime = 0.0
+    while True:
+        if not leader_election.is_leader:
+            loaded_mtime = await asyncio.to_thread(
+                load_analytics_snapshot, loaded_mtime
+            )
+        await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+
+
+EXTERNAL_EVENT_PATTERNS = [
+    "customer.created",
+    "customer.updated",
+    "customer.deleted",
+    "product.created",
+    "product.updated",
+    "product.deleted",
+]
+
+leader_tasks = []
+
+
+async def subscribe_external_events():
+    """Abonne ce worker s'il est leader, connecté et pas encore abonné"""
+    if not (
+        leader_election.is_leader
+        and broker.is_connected
+        and broker.consumer_queue is None
+    ):
+        return
+    try:
         await broker.subscribe_to_events(
-            event_patterns=[
-                "customer.created",
-                "customer.updated",
-                "customer.deleted",
-                "product.created",
-                "product.updated",
-                "product.deleted",
-            ],
+            event_patterns=EXTERNAL_EVENT_PATTERNS,
             callback=handle_external_events,
         )
         print("Subscribed to external events")
+    except Exception as e:
+        print(f"Failed to subscribe to external events: {str(e)}")
+
+
+async def start_leader_duties():
+    """Consommation des événements et tâches globales, sur le seul leader"""
+    await subscribe_external_events()
+    leader_tasks.append(asyncio.create_task(purge_idempotency_keys_periodically()))
+    leader_tasks.append(asyncio.create_task(purge_change_feed_periodically()))
+    leader_tasks.append(
+        asyncio.create_task(maintain_order_events_partitions_periodically())
+    )
+    if order_snapshot is not None:
+        leader_tasks.append(
+            asyncio.create_task(refresh_analytics_snapshot_periodically())
+        )
+
 
+async def stop_leader_duties():
+    for task in leader_tasks:
+        task.cancel()
+    leader_tasks.clear()
+    try:
+        await broker.unsubscribe()
     except Exception as e:
-        print(f"Failed to connect to message broker: {str(e)}")
-        print(f"Debug: RABBITMQ_URL = {RABBITMQ_URL}")
+        print(f"Error stopping event consumer: {str(e)}")
+
+
+leader_election = LeaderElection(
+    engine,
+    f"{SERVICE_NAME}.leader",
+    on_elected=start_leader_duties,
+    on_demoted=stop_leader_duties,
+)
+
+
+def setup_storage():
+    """Crée les tables et partitions de chaque shard"""
+    for shard_engine in all_engines():
+        Base.metadata.create_all(bind=shard_engine)
+        try:
+            setup_order_events_storage(shard_engine)
+        except Exception as e:
+            print(f"Failed to set up order_events partitions: {str(e)}")
+    print(f"Database tables created ({shard_count()} shards)")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Starting Orders API...")
 
+    # Le serveur multi-workers prépare le schéma une fois avant le fork
+    if not getattr(app.state, "storage_ready", False):
+        setup_storage()
+        app.state.storage_ready = True
+
+    # Connexion au broker en tâche de fond : le HTTP est servi immédiatement
     app.state.broker = broker
+    post_commit_queue.start()
+    change_feed_hub.start()
+    broker_task = asyncio.create_task(
+        broker.supervise(on_connected=subscribe_external_events)
+    )
+    election_task = asyncio.create_task(leader_election.run())
+    # Volontairement sur chaque worker : chacun écrit les sketches de ses
+    # propres requêtes, et flush fusionne avec la ligne stockée (verrou de
+    # ligne) au lieu de l'écraser. Ce n'est donc pas une tâche du leader.
+    sketch_task = asyncio.create_task(flush_sketches_periodically())
+    analytics_task = None
+    if order_snapshot is not None:
+        analytics_task = asyncio.create_task(load_analytics_snapshot_periodically())
 
     yield
 
     print("Shutting down Orders API...")
-    if broker.connection and not broker.connection.is_closed:
-        await broker.connection.close()
-        print("Message broker connection closed")
+    broker_task.cancel()
+    election_task.cancel()
+    sketch_task.cancel()
+    if analytics_task:
+        analytics_task.cancel()
+    try:
+        await election_task
+    except asyncio.CancelledError:
+        pass
+    await change_feed_hub.stop()
+    await asyncio.to_thread(flush_sketches)
+    # Publie les événements des écritures déjà validées avant de fermer le broker
+    await post_commit_queue.drain()
+    await broker.close()
 
 
 app = FastAPI(
@@ -163,6 +419,8 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AdmissionControlMiddleware, pool_saturated=pool_saturated)
 app.include_router(orders_router)
 
 
@@ -174,8 +432,39 @@ async def health_check():
         if broker.connection and not broker.connection.is_closed
         else "disconnected"
     )
+    admission_control = getattr(app.state, "admission_control", None)
     return {
         "status": "healthy",
         "service": SERVICE_NAME,
         "message_broker": broker_status,
+        "worker": {"pid": os.getpid(), "leader": leader_election.is_leader},
+        "admission": admission_control.stats() if admission_control else {},
+        "post_commit": post_commit_queue.stats(),
+    }
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """Sonde de vivacité : le process répond, sans vérifier les dépendances"""
+    return {"status": "alive", "service": SERVICE_NAME}
+
+
+@app.get("/health/ready")
+async def readiness_check(response: Response):
+    """Sonde de disponibilité : schéma créé et base joignable"""
+    checks = {"storage": getattr(app.state, "storage_ready", False)}
+    checks["database"] = checks["storage"] and await asyncio.to_thread(
+        database_reachable
+    )
+    if READINESS_REQUIRES_BROKER:
+        checks["message_broker"] = broker.is_connected
+
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "not_ready",
+        "service": SERVICE_NAME,
+        "checks": checks,
+        "message_broker": "connected" if broker.is_connected else "disconnected",
     }
@@ -1,8 +1,9 @@
-from .broker import MessageBroker
+from .broker import MessageBroker, NonRetryableEventError
 from .events import *
 
 __all__ = [
     "MessageBroker",
+    "NonRetryableEventError",
     "ORDER_CREATED",
     "ORDER_UPDATED",
     "ORDER_STATUS_CHANGED",
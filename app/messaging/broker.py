@@ -1,10 +1,23 @@
 import aio_pika
 import json
-from typing import Dict, Any, List, Callable
+import os
+import random
+from typing import Awaitable, Dict, Any, List, Callable, Optional
 import uuid
 from datetime import datetime, timezone
 import asyncio
 
+RETRY_COUNT_HEADER = "x-retry-count"
+LAST_ERROR_HEADER = "x-last-error"
+
+BROKER_RECONNECT_BASE_DELAY = float(os.getenv("BROKER_RECONNECT_BASE_DELAY", "1"))
+BROKER_RECONNECT_MAX_DELAY = float(os.getenv("BROKER_RECONNECT_MAX_DELAY", "60"))
+BROKER_CHECK_INTERVAL = float(os.getenv("BROKER_CHECK_INTERVAL", "5"))
+
+
+class NonRetryableEventError(Exception):
+    """Erreur de traitement définitive : le message part directement en DLQ"""
+
 
 class MessageBroker:
     """Client pour la communication via message broker (RabbitMQ)"""
@@ -15,6 +28,39 @@ class MessageBroker:
         self.connection = None
         self.channel = None
         self.events_exchange = None
+        self.retry_queue_names: List[str] = []
+        self.dead_letter_queue_name = None
+        self.consumer_queue = None
+        self.consumer_tag = None
+
+    async def _open(self):
+        """Ouvre la connexion, le canal et l'exchange (une seule tentative)"""
+        connection = await aio_pika.connect_robust(
+            self.connection_url,
+            loop=asyncio.get_event_loop(),
+            connection_timeout=10.0,
+            heartbeat=60,
+        )
+        try:
+            channel = await connection.channel()
+
+            await channel.set_qos(prefetch_count=10)
+
+            events_exchange = await channel.declare_exchange(
+                "payetonkawa.events", aio_pika.ExchangeType.TOPIC, durable=True
+            )
+        except Exception:
+            await connection.close()
+            raise
+
+        self.connection = connection
+        self.channel = channel
+        self.events_exchange = events_exchange
+        # Un abonnement éventuel appartenait à la connexion précédente
+        self.consumer_queue = None
+        self.consumer_tag = None
+
+        print(f"🔗 Message broker connected for service: {self.service_name}")
 
     async def connect(self, max_retries: int = 5, retry_delay: float = 2.0):
         """Établit la connexion avec RabbitMQ avec retry logic"""
@@ -23,22 +69,7 @@ class MessageBroker:
                 print(
                     f"Attempting RabbitMQ connection (attempt {attempt + 1}/{max_retries})"
                 )
-
-                self.connection = await aio_pika.connect_robust(
-                    self.connection_url,
-                    loop=asyncio.get_event_loop(),
-                    connection_timeout=10.0,
-                    heartbeat=60,
-                )
-                self.channel = await self.connection.channel()
-
-                await self.channel.set_qos(prefetch_count=10)
-
-                self.events_exchange = await self.channel.declare_exchange(
-                    "payetonkawa.events", aio_pika.ExchangeType.TOPIC, durable=True
-                )
-
-                print(f"🔗 Message broker connected for service: {self.service_name}")
+                await self._open()
                 return
 
             except Exception as e:
@@ -54,6 +85,44 @@ class MessageBroker:
                     )
                     raise
 
+    async def supervise(
+        self,
+        on_connected: Optional[Callable[[], Awaitable[None]]] = None,
+        base_delay: float = BROKER_RECONNECT_BASE_DELAY,
+        max_delay: float = BROKER_RECONNECT_MAX_DELAY,
+        check_interval: float = BROKER_CHECK_INTERVAL,
+    ):
+        """Maintient la connexion en tâche de fond, sans limite de tentatives.
+
+        Attente exponentielle avec jitter complet entre deux échecs ;
+        `on_connected` est appelé après chaque nouvelle connexion (pour
+        rétablir les abonnements). Les coupures transitoires sont gérées par
+        la connexion robuste d'aio_pika.
+        """
+        failures = 0
+        while True:
+            if self.is_connected:
+                await asyncio.sleep(check_interval)
+                continue
+            try:
+                await self._open()
+            except Exception as e:
+                failures += 1
+                delay = random.uniform(0, min(max_delay, base_delay * 2**failures))
+                print(
+                    f"Message broker unavailable ({failures} failed attempts), "
+                    f"retrying in {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            failures = 0
+            if on_connected:
+                try:
+                    await on_connected()
+                except Exception as e:
+                    print(f"Error after message broker connection: {str(e)}")
+
     async def publish_event(self, event_type: str, data: Dict[str, Any]):
         """Publie un événement sur le message broker"""
         if not self.events_exchange:
@@ -86,8 +155,25 @@ class MessageBroker:
             print(f"Failed to publish event {event_type}: {str(e)}")
             raise
 
-    async def subscribe_to_events(self, event_patterns: List[str], callback: Callable):
-        """S'abonne aux événements spécifiés"""
+    async def publish_events(self, event_type: str, data_list: List[Dict[str, Any]]):
+        """Publie un lot d'événements du même type"""
+        await asyncio.gather(
+            *(self.publish_event(event_type, data) for data in data_list)
+        )
+
+    async def subscribe_to_events(
+        self,
+        event_patterns: List[str],
+        callback: Callable,
+        max_retries: int = 5,
+        retry_base_delay: float = 1.0,
+    ):
+        """S'abonne aux événements spécifiés.
+
+        Un message dont le traitement échoue est republié dans une file de
+        retry (délai exponentiel via TTL) puis revient dans la file principale ;
+        après `max_retries` tentatives il est parqué dans la file DLQ.
+        """
         if not self.channel:
             raise RuntimeError("Message broker not connected")
 
@@ -97,16 +183,87 @@ class MessageBroker:
                 queue_name, durable=True, exclusive=False
             )
 
+            self.retry_queue_names = []
+            for attempt in range(max_retries):
+                delay_ms = int(retry_base_delay * 1000 * 2**attempt)
+                retry_queue = await self.channel.declare_queue(
+                    f"{queue_name}.retry.{delay_ms}ms",
+                    durable=True,
+                    arguments={
+                        "x-message-ttl": delay_ms,
+                        "x-dead-letter-exchange": "",
+                        "x-dead-letter-routing-key": queue_name,
+                    },
+                )
+                self.retry_queue_names.append(retry_queue.name)
+
+            self.dead_letter_queue_name = f"{queue_name}.dlq"
+            await self.channel.declare_queue(self.dead_letter_queue_name, durable=True)
+
             for pattern in event_patterns:
                 await queue.bind(self.events_exchange, routing_key=pattern)
                 print(f"Subscribed to pattern: {pattern}")
 
-            await queue.consume(callback)
+            async def on_message(message: aio_pika.IncomingMessage):
+                await self.handle_message(message, callback)
+
+            self.consumer_tag = await queue.consume(on_message)
+            self.consumer_queue = queue
 
         except Exception as e:
             print(f"Failed to subscribe to events: {str(e)}")
             raise
 
+    async def handle_message(self, message: aio_pika.IncomingMessage, callback):
+        """Exécute le callback puis acquitte, planifie un retry ou parque en DLQ"""
+        try:
+            await callback(message)
+        except Exception as e:
+            retries = int((message.headers or {}).get(RETRY_COUNT_HEADER, 0))
+            retryable = not isinstance(e, NonRetryableEventError)
+
+            if retryable and retries < len(self.retry_queue_names):
+                target = self.retry_queue_names[retries]
+                print(f"Event processing failed, retry {retries + 1} via {target}: {e}")
+            else:
+                target = self.dead_letter_queue_name
+                print(f"Event processing failed, parked in {target}: {e}")
+
+            try:
+                await self.channel.default_exchange.publish(
+                    aio_pika.Message(
+                        message.body,
+                        headers={
+                            **(message.headers or {}),
+                            RETRY_COUNT_HEADER: retries + 1,
+                            LAST_ERROR_HEADER: str(e)[:500],
+                        },
+                        content_type=message.content_type,
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        message_id=message.message_id,
+                        timestamp=message.timestamp,
+                    ),
+                    routing_key=target,
+                )
+            except Exception as publish_error:
+                print(f"Failed to reschedule event: {publish_error}")
+                await message.nack(requeue=True)
+                return
+
+        await message.ack()
+
+    async def unsubscribe(self):
+        """Arrête la consommation (les messages non acquittés sont redistribués)"""
+        if self.consumer_queue is None:
+            return
+        try:
+            if self.channel and not self.channel.is_closed:
+                await self.consumer_queue.cancel(self.consumer_tag)
+                print(f"Stopped consuming {self.consumer_queue.name}")
+        finally:
+            self.consumer_queue = None
+            self.consumer_tag = None
+
     async def close(self):
         """Ferme la connexion proprement"""
         if self.connection and not self.connection.is_closed:
@@ -1,4 +1,17 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, Text, ForeignKey
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    String,
+    DECIMAL,
+    DateTime,
+    Text,
+    ForeignKey,
+    Index,
+    JSON,
+    LargeBinary,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.db import Base
@@ -33,6 +46,7 @@ class OrderModel(Base):
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
         nullable=False,
+        index=True,
     )
     shipped_at = Column(DateTime, nullable=True)
     delivered_at = Column(DateTime, nullable=True)
@@ -41,6 +55,27 @@ class OrderModel(Base):
         "OrderItemModel", back_populates="order", cascade="all, delete-orphan"
     )
 
+    # Projection locale du client, alimentée par les événements customer.*
+    customer = relationship(
+        "CustomerProjectionModel",
+        primaryjoin="foreign(OrderModel.customer_id) == CustomerProjectionModel.customer_id",
+        viewonly=True,
+        lazy="joined",
+        uselist=False,
+    )
+
+    @property
+    def current_customer_name(self):
+        if self.customer is not None and self.customer.name is not None:
+            return self.customer.name
+        return self.customer_name
+
+    @property
+    def current_customer_email(self):
+        if self.customer is not None and self.customer.email is not None:
+            return self.customer.email
+        return self.customer_email
+
 
 class OrderItemModel(Base):
     __tablename__ = "order_items"
@@ -71,14 +106,139 @@ class OrderItemModel(Base):
     order = relationship("OrderModel", back_populates="items")
 
 
+class CustomerProjectionModel(Base):
+    __tablename__ = "customers_projection"
+
+    customer_id = Column(String, primary_key=True)
+    name = Column(String, nullable=True)
+    email = Column(String, nullable=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    # Horodatage du dernier événement appliqué (ignore les événements en retard)
+    source_updated_at = Column(DateTime, nullable=False)
+    updated_at = Column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+
+
+class ProductCatalogModel(Base):
+    __tablename__ = "products_catalog"
+
+    product_id = Column(String, primary_key=True)
+    name = Column(String, nullable=True)
+    price = Column(DECIMAL(10, 2), nullable=True)
+    sku = Column(String, nullable=True)
+    description = Column(Text, nullable=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    source_updated_at = Column(DateTime, nullable=False)
+    updated_at = Column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+
+
+class OrderRollupModel(Base):
+    """Agrégats de commandes par période, maintenus par les routes d'écriture"""
+
+    __tablename__ = "order_rollups"
+
+    granularity = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    status = Column(String, primary_key=True)
+    currency = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+
+class CustomerOrderCountModel(Base):
+    """Nombre de commandes par client, maintenu avec order_rollups"""
+
+    __tablename__ = "customer_order_counts"
+
+    customer_id = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+
+
+class OrderSketchModel(Base):
+    """Sketches journaliers (t-digest des montants, HyperLogLog des clients)"""
+
+    __tablename__ = "order_sketches"
+
+    day = Column(DateTime, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    amount_digest = Column(LargeBinary, nullable=False)
+    customers_hll = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class OrderArchiveModel(Base):
+    """Commande terminée archivée (articles et événements compressés)"""
+
+    __tablename__ = "orders_archive"
+    __table_args__ = (
+        Index("ix_orders_archive_customer_created", "customer_id", "created_at"),
+    )
+
+    order_id = Column(String, primary_key=True)
+    customer_id = Column(String, nullable=False)
+    # Données client modifiables (anonymisation) hors du document compressé
+    customer_name = Column(String, nullable=True)
+    customer_email = Column(String, nullable=True)
+    status = Column(String, nullable=False)
+    currency = Column(String, nullable=True)
+    total_amount = Column(DECIMAL(10, 2), nullable=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+    # Export incrémental (app/export.py)
+    updated_at = Column(DateTime, nullable=False, index=True)
+    archived_at = Column(DateTime, nullable=False)
+    # JSON gzip : colonnes de la commande, articles et événements
+    document = Column(LargeBinary, nullable=False)
+
+
+class OrderChangeModel(Base):
+    """Flux de modifications des commandes (seq croissant, même transaction)"""
+
+    __tablename__ = "order_changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(String, nullable=False)
+    change_type = Column(String, nullable=False)
+    status = Column(String, nullable=True)
+    changed_at = Column(DateTime, nullable=False, index=True)
+
+
 class OrderEventModel(Base):
+    # Sous PostgreSQL, la table est partitionnée par mois sur created_at
+    # (voir app/audit_log.py ; une base existante se migre avec
+    # `python -m app.audit_log migrate`).
     __tablename__ = "order_events"
+    __table_args__ = (
+        Index("ix_order_events_order_id_created_at", "order_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(String, nullable=False, index=True)
+    order_id = Column(String, nullable=False)
     event_type = Column(String, nullable=False)
-    event_data = Column(Text, nullable=True)
+    event_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
     created_at = Column(
         DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True
     )
     created_by = Column(String, nullable=True)
+
+
+class IdempotencyKeyModel(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    # NULL tant que la requête d'origine est en cours
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+    created_at = Column(
+        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,124 @@
+# app/order_counts.py
+"""
+Nombre total de résultats pour les listes paginées (en-tête X-Total-Count).
+
+Les filtres simples utilisent des compteurs maintenus : order_rollups (total
+et par statut) et customer_order_counts (par client), dont on retire les
+commandes archivées sauf pour les listes qui relisent l'archive (commandes
+d'un client). Les filtres complexes utilisent l'estimation du planificateur
+PostgreSQL (EXPLAIN), ou un COUNT exact sur les autres bases. L'en-tête X-Total-Count-Type indique si le
+nombre est exact ou estimé.
+"""
+
+import json
+from typing import Callable, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy import case, func
+from sqlalchemy.orm import Query, Session
+
+from app.models import (
+    CustomerOrderCountModel,
+    OrderArchiveModel,
+    OrderModel,
+    OrderRollupModel,
+)
+from app.rollups import ARCHIVED_GRANULARITY
+from app.sharding import ShardSessions
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_COUNT_TYPE_HEADER = "X-Total-Count-Type"
+
+
+def count_from_rollups(
+    db: Session, status: Optional[str] = None, include_archived: bool = False
+) -> int:
+    """Total (ou par statut) depuis les agrégats mensuels"""
+    if include_archived:
+        order_count = OrderRollupModel.order_count
+        granularities = ["month"]
+    else:
+        # Part archivée retranchée : commandes encore dans orders
+        order_count = case(
+            (
+                OrderRollupModel.granularity == ARCHIVED_GRANULARITY,
+                -OrderRollupModel.order_count,
+            ),
+            else_=OrderRollupModel.order_count,
+        )
+        granularities = ["month", ARCHIVED_GRANULARITY]
+    query = db.query(func.sum(order_count)).filter(
+        OrderRollupModel.granularity.in_(granularities)
+    )
+    if status:
+        query = query.filter(OrderRollupModel.status == status)
+    return int(query.scalar() or 0)
+
+
+def count_for_customer(
+    db: Session, customer_id: str, include_archived: bool = False
+) -> int:
+    count = (
+        db.query(CustomerOrderCountModel.order_count)
+        .filter(CustomerOrderCountModel.customer_id == customer_id)
+        .scalar()
+    ) or 0
+    if not include_archived:
+        # Les commandes archivées d'un client sont peu nombreuses : COUNT indexé
+        count -= (
+            db.query(func.count(OrderArchiveModel.order_id))
+            .filter(OrderArchiveModel.customer_id == customer_id)
+            .scalar()
+        )
+    return int(count)
+
+
+def estimate_count(db: Session, query: Query) -> Tuple[int, bool]:
+    """Estimation du planificateur sous PostgreSQL, COUNT exact sinon"""
+    if db.get_bind().dialect.name != "postgresql":
+        return query.order_by(None).count(), True
+
+    compiled = query.order_by(None).statement.compile(dialect=db.get_bind().dialect)
+    plan = (
+        db.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled.string}", compiled.params)
+        .scalar()
+    )
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"]), False
+
+
+def total_count(
+    shards: ShardSessions,
+    status: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    build_query: Optional[Callable[[Session], Query]] = None,
+    include_archived: bool = False,
+) -> Tuple[int, bool]:
+    """Retourne (nombre, exact) pour les filtres d'une liste de commandes"""
+    if build_query is None and customer_id:
+        db = shards.for_customer(customer_id)
+        if not status:
+            return count_for_customer(db, customer_id, include_archived), True
+        # Les commandes d'un client sont peu nombreuses : COUNT indexé
+        count = (
+            db.query(func.count(OrderModel.id))
+            .filter(OrderModel.customer_id == customer_id, OrderModel.status == status)
+            .scalar()
+        )
+        return int(count), True
+
+    if build_query is None:
+        counts = shards.scatter(
+            lambda db: count_from_rollups(db, status, include_archived)
+        )
+        return sum(counts), True
+
+    estimates = shards.scatter(lambda db: estimate_count(db, build_query(db)))
+    return sum(count for count, _ in estimates), all(exact for _, exact in estimates)
+
+
+def set_total_count_headers(response: Response, count: int, exact: bool):
+    response.headers[TOTAL_COUNT_HEADER] = str(count)
+    response.headers[TOTAL_COUNT_TYPE_HEADER] = "exact" if exact else "estimate"
@@ -0,0 +1,177 @@
+# app/order_ids.py
+"""
+Générateur d'identifiants de commande ordonnés dans le temps (type Snowflake).
+
+Un identifiant est composé de 80 bits encodés en base32 Crockford
+(16 caractères, ordre lexicographique = ordre chronologique) :
+
+    48 bits  horodatage en millisecondes (epoch Unix)
+    20 bits  identifiant de nœud (ORDER_ID_NODE_ID, sinon aléatoire par process)
+    12 bits  séquence dans la milliseconde
+
+Quand les commandes sont réparties sur plusieurs bases (voir app/sharding.py),
+le numéro de shard est ajouté en suffixe (`ORD-<16 caractères>-<2 caractères>`).
+
+Avec app.server, chaque worker reçoit au fork son propre nœud : la base
+ORDER_ID_NODE_ID (aléatoire si absente) plus son numéro de worker. Plusieurs
+instances du serveur doivent donc avoir des bases espacées d'au moins leur
+nombre de workers.
+
+Les anciens identifiants `ORD-XXXXXXXX` restent valides : seul le format des
+nouveaux identifiants change.
+"""
+
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+ORDER_ID_PREFIX = "ORD-"
+
+TIMESTAMP_BITS = 48
+NODE_BITS = 20
+SEQUENCE_BITS = 12
+
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+ENCODED_LENGTH = 16
+SHARD_TAG_LENGTH = 2
+MAX_SHARD = (1 << (5 * SHARD_TAG_LENGTH)) - 1
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def encode_base32(value: int, length: int = ENCODED_LENGTH) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(CROCKFORD_ALPHABET[value & 0x1F])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def decode_base32(encoded: str) -> int:
+    value = 0
+    for char in encoded:
+        value = (value << 5) | CROCKFORD_ALPHABET.index(char)
+    return value
+
+
+def check_node_id(node_id: int) -> int:
+    if not 0 <= node_id <= MAX_NODE_ID:
+        raise ValueError(f"ORDER_ID_NODE_ID doit être entre 0 et {MAX_NODE_ID}")
+    return node_id
+
+
+def default_node_id() -> int:
+    """Identifiant de nœud : ORDER_ID_NODE_ID si défini, sinon aléatoire"""
+    configured = os.getenv("ORDER_ID_NODE_ID")
+    if configured is not None:
+        return check_node_id(int(configured))
+    return secrets.randbelow(MAX_NODE_ID + 1)
+
+
+def worker_node_ids(workers: int, base: Optional[int] = None) -> List[int]:
+    """Nœuds distincts des workers : base (ORDER_ID_NODE_ID) + numéro du worker"""
+    if base is None:
+        configured = os.getenv("ORDER_ID_NODE_ID")
+        if configured is not None:
+            base = int(configured)
+        else:
+            base = secrets.randbelow(max(1, MAX_NODE_ID + 2 - workers))
+    check_node_id(base)
+    if base + workers - 1 > MAX_NODE_ID:
+        raise ValueError(f"ORDER_ID_NODE_ID + nombre de workers dépasse {MAX_NODE_ID}")
+    return [base + index for index in range(workers)]
+
+
+class OrderIdGenerator:
+    """Générateur thread-safe, monotone au sein d'un process"""
+
+    def __init__(self, node_id: Optional[int] = None):
+        self._explicit_node_id = node_id
+        self._lock = threading.Lock()
+        self._reset()
+
+    def set_node_id(self, node_id: int):
+        """Fixe le nœud de ce process (appelé par le worker juste après le fork)"""
+        check_node_id(node_id)
+        with self._lock:
+            self._explicit_node_id = node_id
+            self._reset()
+
+    def _reset(self):
+        # Réinitialisé après un fork pour que chaque worker ait son propre nœud
+        self._pid = os.getpid()
+        self.node_id = (
+            self._explicit_node_id
+            if self._explicit_node_id is not None
+            else default_node_id()
+        )
+        self._last_timestamp = -1
+        self._sequence = 0
+
+    def _next_components(self):
+        timestamp = time.time_ns() // 1_000_000
+
+        # Horloge qui recule : on reste sur le dernier horodatage émis
+        if timestamp <= self._last_timestamp:
+            timestamp = self._last_timestamp
+            self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+            if self._sequence == 0:
+                # Séquence épuisée : on emprunte la milliseconde suivante
+                timestamp += 1
+        else:
+            self._sequence = 0
+
+        self._last_timestamp = timestamp
+        return timestamp, self._sequence
+
+    def next_id(self, shard: Optional[int] = None) -> str:
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._reset()
+            timestamp, sequence = self._next_components()
+            node_id = self.node_id
+
+        value = (
+            (timestamp << (NODE_BITS + SEQUENCE_BITS))
+            | (node_id << SEQUENCE_BITS)
+            | sequence
+        )
+        order_id = f"{ORDER_ID_PREFIX}{encode_base32(value)}"
+        if shard is not None:
+            order_id += f"-{encode_base32(shard, SHARD_TAG_LENGTH)}"
+        return order_id
+
+
+def parse_order_id(order_id: str):
+    """Décompose un identifiant ordonné ; None pour les anciens formats"""
+    if not order_id.startswith(ORDER_ID_PREFIX):
+        return None
+    encoded, _, shard_tag = order_id[len(ORDER_ID_PREFIX) :].partition("-")
+    if len(encoded) != ENCODED_LENGTH or len(shard_tag) not in (0, SHARD_TAG_LENGTH):
+        return None
+    try:
+        value = decode_base32(encoded)
+        shard = decode_base32(shard_tag) if shard_tag else None
+    except ValueError:
+        return None
+
+    timestamp = value >> (NODE_BITS + SEQUENCE_BITS)
+    return {
+        "created_at": datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc),
+        "node_id": (value >> SEQUENCE_BITS) & MAX_NODE_ID,
+        "sequence": value & MAX_SEQUENCE,
+        "shard": shard,
+    }
+
+
+def order_shard(order_id: str) -> Optional[int]:
+    """Shard indiqué dans l'identifiant, None s'il n'en porte pas"""
+    parsed = parse_order_id(order_id)
+    return parsed["shard"] if parsed else None
+
+
+order_id_generator = OrderIdGenerator()
@@ -0,0 +1,143 @@
+# app/post_commit.py
+"""
+Files bornées de tâches exécutées après le commit (publication d'événements,
+invalidations), traitées par un pool de workers asyncio.
+
+Les routes d'écriture y déposent leurs effets de bord et répondent sans les
+attendre. Chaque worker a sa propre file ; les tâches d'une même clé
+(l'identifiant de commande) vont toujours au même worker, ce qui conserve
+leur ordre (order.created avant order.status_changed). Quand la file est
+pleine, `submit` attend qu'une place se libère (contre-pression : la requête
+ralentit sans doubler les tâches déjà en file). Avant le démarrage des
+workers (tests, scripts), les tâches s'exécutent directement. Au shutdown,
+`drain` attend la fin des tâches en attente.
+"""
+
+import asyncio
+import os
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional
+
+POST_COMMIT_QUEUE_SIZE = int(os.getenv("POST_COMMIT_QUEUE_SIZE", "1000"))
+POST_COMMIT_WORKERS = int(os.getenv("POST_COMMIT_WORKERS", "4"))
+POST_COMMIT_DRAIN_TIMEOUT = float(os.getenv("POST_COMMIT_DRAIN_TIMEOUT", "10"))
+
+Job = Callable[[], Awaitable[None]]
+
+
+class PostCommitQueue:
+    def __init__(
+        self, maxsize: int = POST_COMMIT_QUEUE_SIZE, workers: int = POST_COMMIT_WORKERS
+    ):
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self._queues: List[asyncio.Queue] = []
+        self._workers = []
+        self._next_lane = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.overflowed = 0
+        self.max_depth = 0
+        self.dequeued = 0
+        self.total_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        """Démarre les workers (à appeler depuis la boucle d'événements)"""
+        if self.running:
+            return
+        # Capacité totale répartie entre les files des workers
+        lane_size = max(1, self.maxsize // self.worker_count)
+        self._queues = [
+            asyncio.Queue(maxsize=lane_size) for _ in range(self.worker_count)
+        ]
+        self._workers = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    def lane(self, key: Optional[str]) -> int:
+        """Worker chargé d'une clé ; sans clé, répartition tour à tour"""
+        if key is None:
+            self._next_lane = (self._next_lane + 1) % self.worker_count
+            return self._next_lane
+        return zlib.crc32(key.encode("utf-8")) % self.worker_count
+
+    async def submit(self, name: str, job: Job, key: Optional[str] = None):
+        """Dépose une tâche dans la file du worker de `key` ; attend une place
+        si cette file est pleine"""
+        if not self.running:
+            await self._run(name, job)
+            return
+        queue = self._queues[self.lane(key)]
+        item = (name, job, time.monotonic())
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            print(f"Post-commit queue full, waiting to enqueue {name}")
+            await queue.put(item)
+        self.max_depth = max(self.max_depth, self.depth)
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _run(self, name: str, job: Job):
+        self.in_flight += 1
+        try:
+            await job()
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Error in post-commit task {name}: {e}")
+        finally:
+            self.in_flight -= 1
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            name, job, queued_at = await queue.get()
+            self.dequeued += 1
+            self.total_wait += time.monotonic() - queued_at
+            try:
+                await self._run(name, job)
+            finally:
+                queue.task_done()
+
+    async def drain(self, timeout: float = POST_COMMIT_DRAIN_TIMEOUT):
+        """Attend la fin des tâches en attente puis arrête les workers"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"Post-commit queue drain timed out, {self.depth} tasks dropped")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "depth": self.depth,
+            "capacity": self.maxsize,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "overflowed": self.overflowed,
+            "avg_wait_ms": (
+                round(1000 * self.total_wait / self.dequeued, 3)
+                if self.dequeued
+                else 0.0
+            ),
+        }
+
+
+post_commit_queue = PostCommitQueue()
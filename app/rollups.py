@@ -0,0 +1,301 @@
+# app/rollups.py
+"""
+Agrégats de chiffre d'affaires et de nombre de commandes par heure, jour et
+mois (table order_rollups), ventilés par statut et devise, et nombre de
+commandes par client (table customer_order_counts).
+
+Les routes d'écriture appliquent des deltas dans la même transaction que la
+commande ; `python -m app.rollups rebuild` reconstruit la table à partir des
+tables orders et orders_archive.
+
+Les commandes archivées restent comptées dans les agrégats ; leur part est
+aussi enregistrée par mois sous la granularité "archived", ce qui donne le
+nombre de commandes encore dans orders (en-tête X-Total-Count).
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, dialect_insert
+from app.models import (
+    CustomerOrderCountModel,
+    OrderArchiveModel,
+    OrderModel,
+    OrderRollupModel,
+)
+from app.sharding import open_shard_session, shard_count
+
+GRANULARITIES = ("hour", "day", "month")
+ARCHIVED_GRANULARITY = "archived"
+
+REBUILD_BATCH_SIZE = 5000
+
+RollupKey = Tuple[str, datetime, str, str]
+
+
+def bucket_start(dt: datetime, granularity: str) -> datetime:
+    """Début de la période contenant `dt` (naïf, UTC)"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    if granularity == "hour":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "month":
+        return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Granularité inconnue: {granularity}")
+
+
+def _add_delta(
+    deltas: Dict[RollupKey, list],
+    created_at: datetime,
+    status: str,
+    currency: str,
+    count: int,
+    revenue: Decimal,
+):
+    for granularity in GRANULARITIES:
+        key = (granularity, bucket_start(created_at, granularity), status, currency)
+        deltas[key][0] += count
+        deltas[key][1] += revenue
+
+
+def _add_archived_delta(
+    deltas: Dict[RollupKey, list],
+    created_at: datetime,
+    status: str,
+    currency: str,
+    revenue: Decimal,
+):
+    key = (ARCHIVED_GRANULARITY, bucket_start(created_at, "month"), status, currency)
+    deltas[key][0] += 1
+    deltas[key][1] += revenue
+
+
+def _rollup_rows(deltas: Dict[RollupKey, list]) -> list:
+    # Ordre stable pour limiter les interblocages entre transactions
+    return [
+        {
+            "granularity": granularity,
+            "bucket_start": start,
+            "status": status,
+            "currency": currency,
+            "order_count": count,
+            "revenue": revenue,
+        }
+        for (granularity, start, status, currency), (count, revenue) in sorted(
+            deltas.items()
+        )
+        if count or revenue
+    ]
+
+
+def apply_rollup_deltas(db: Session, deltas: Dict[RollupKey, list]):
+    """Applique les deltas en un seul upsert multi-lignes"""
+    rows = _rollup_rows(deltas)
+    if not rows:
+        return
+
+    table = OrderRollupModel.__table__
+    stmt = dialect_insert(db)(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            table.c.granularity,
+            table.c.bucket_start,
+            table.c.status,
+            table.c.currency,
+        ],
+        set_={
+            "order_count": table.c.order_count + stmt.excluded.order_count,
+            "revenue": table.c.revenue + stmt.excluded.revenue,
+        },
+    )
+    db.execute(stmt)
+
+
+def apply_customer_count_delta(db: Session, customer_id: str, delta: int):
+    table = CustomerOrderCountModel.__table__
+    stmt = dialect_insert(db)(table).values(customer_id=customer_id, order_count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.customer_id],
+        set_={"order_count": table.c.order_count + stmt.excluded.order_count},
+    )
+    db.execute(stmt)
+
+
+def new_deltas() -> Dict[RollupKey, list]:
+    return defaultdict(lambda: [0, Decimal("0")])
+
+
+def record_order_created(
+    db: Session,
+    created_at: datetime,
+    status: str,
+    currency: str,
+    amount,
+    customer_id: Optional[str] = None,
+):
+    deltas = new_deltas()
+    _add_delta(deltas, created_at, status, currency, 1, Decimal(amount or 0))
+    apply_rollup_deltas(db, deltas)
+    if customer_id:
+        apply_customer_count_delta(db, customer_id, 1)
+
+
+def record_status_changes(
+    db: Session,
+    changes: Iterable[Tuple[datetime, str, str, str, Decimal]],
+):
+    """changes : (created_at, currency, ancien statut, nouveau statut, montant)"""
+    deltas = new_deltas()
+    for created_at, currency, old_status, new_status, amount in changes:
+        amount = Decimal(amount or 0)
+        _add_delta(deltas, created_at, old_status, currency, -1, -amount)
+        _add_delta(deltas, created_at, new_status, currency, 1, amount)
+    apply_rollup_deltas(db, deltas)
+
+
+def record_status_change(db: Session, order: OrderModel, old_status: str):
+    record_status_changes(
+        db,
+        [
+            (
+                order.created_at,
+                order.currency,
+                old_status,
+                order.status,
+                order.total_amount,
+            )
+        ],
+    )
+
+
+def record_order_deleted(db: Session, order: OrderModel):
+    deltas = new_deltas()
+    _add_delta(
+        deltas,
+        order.created_at,
+        order.status,
+        order.currency,
+        -1,
+        -Decimal(order.total_amount or 0),
+    )
+    apply_rollup_deltas(db, deltas)
+    apply_customer_count_delta(db, order.customer_id, -1)
+
+
+def record_orders_archived(
+    db: Session, orders: Iterable[Tuple[datetime, str, str, Decimal]]
+):
+    """orders : (created_at, statut, devise, montant) des commandes archivées"""
+    deltas = new_deltas()
+    for created_at, status, currency, amount in orders:
+        _add_archived_delta(deltas, created_at, status, currency, Decimal(amount or 0))
+    apply_rollup_deltas(db, deltas)
+
+
+def order_facts():
+    """Colonnes agrégeables des commandes actives et archivées (sous-requête)"""
+    columns = (
+        "customer_id",
+        "customer_name",
+        "status",
+        "currency",
+        "total_amount",
+        "created_at",
+    )
+    return union_all(
+        select(*(getattr(OrderModel, name) for name in columns)),
+        select(*(getattr(OrderArchiveModel, name) for name in columns)),
+    ).subquery("order_facts")
+
+
+def rebuild_rollups(db: Optional[Session] = None) -> int:
+    """Reconstruit les agrégats d'un shard (une transaction)"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            # Bloque les écritures concurrentes le temps de la reconstruction
+            db.execute(text("LOCK TABLE order_rollups IN EXCLUSIVE MODE"))
+            db.execute(text("LOCK TABLE customer_order_counts IN EXCLUSIVE MODE"))
+
+        db.execute(delete(OrderRollupModel))
+        db.execute(delete(CustomerOrderCountModel))
+
+        # Les commandes archivées restent comptées dans les agrégats
+        orders = order_facts()
+        deltas = new_deltas()
+        result = db.execute(
+            select(
+                orders.c.created_at,
+                orders.c.status,
+                orders.c.currency,
+                orders.c.total_amount,
+            ).execution_options(yield_per=REBUILD_BATCH_SIZE)
+        )
+        for created_at, status, currency, amount in result:
+            _add_delta(deltas, created_at, status, currency, 1, Decimal(amount or 0))
+        result = db.execute(
+            select(
+                OrderArchiveModel.created_at,
+                OrderArchiveModel.status,
+                OrderArchiveModel.currency,
+                OrderArchiveModel.total_amount,
+            ).execution_options(yield_per=REBUILD_BATCH_SIZE)
+        )
+        for created_at, status, currency, amount in result:
+            _add_archived_delta(
+                deltas, created_at, status, currency, Decimal(amount or 0)
+            )
+
+        rows = _rollup_rows(deltas)
+        if rows:
+            db.execute(insert(OrderRollupModel), rows)
+
+        db.execute(
+            insert(CustomerOrderCountModel).from_select(
+                ["customer_id", "order_count"],
+                select(orders.c.customer_id, func.count()).group_by(
+                    orders.c.customer_id
+                ),
+            )
+        )
+        db.commit()
+        print(f"Rebuilt {len(rows)} order rollup rows")
+        return len(rows)
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrégats de commandes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "rebuild", help="Reconstruit order_rollups depuis orders et orders_archive"
+    )
+
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        # Chaque shard porte les agrégats de ses propres commandes
+        for shard in range(shard_count()):
+            db = open_shard_session(shard)
+            try:
+                rebuild_rollups(db)
+            finally:
+                db.close()
+
+
+if __name__ == "__main__":
+    main()
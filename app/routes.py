@@ -1,25 +1,85 @@
 # app/routes.py
 
+import asyncio
+import base64
 import json
 import os
-import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from typing import List, Optional
-
-from fastapi import HTTPException, Depends, Security, APIRouter, Request, Query
+from typing import List, Literal, Optional
+
+from fastapi import (
+    HTTPException,
+    Depends,
+    Security,
+    APIRouter,
+    Request,
+    Query,
+    Header,
+    Response,
+)
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import func, or_
-from sqlalchemy.orm import Session
-
+from sqlalchemy import exists, func, or_, tuple_, select, update, insert
+from sqlalchemy.orm import Session, selectinload
+
+from app.analytics import GROUP_BY_FIELDS, order_snapshot
+from app.archive import (
+    archived_order_events,
+    locate_archived_orders,
+    merge_archived_orders,
+)
+from app.catalog import enrich_order_items
+from app.change_feed import (
+    CHANGE_FEED_MAX_WAIT,
+    change_item,
+    decode_position_cursor,
+    encode_position_cursor,
+    latest_positions,
+    record_order_change,
+    record_order_changes,
+    stream_changes,
+    wait_for_changes,
+)
 from app.db import get_db
+from app.export import ARROW_STREAM_MEDIA_TYPE, export_available, iter_arrow_stream
+from app.fieldsets import apply_fields, fieldset_response, load_options, parse_fields
+from app.idempotency import idempotent
+from app.order_counts import set_total_count_headers, total_count
+from app.order_ids import order_id_generator
+from app.post_commit import post_commit_queue
+from app.sharding import (
+    ShardSessions,
+    get_shards,
+    locate_order,
+    locate_orders,
+    order_shard_candidates,
+    scatter_orders,
+    shard_for_customer,
+    shard_for_order,
+    sharding_enabled,
+)
+from app.rollups import (
+    order_facts,
+    record_order_created,
+    record_order_deleted,
+    record_status_change,
+    record_status_changes,
+)
+from app.sketches import distribution, order_sketches
 from app.messaging.events import (
     ORDER_CREATED,
     ORDER_UPDATED,
     ORDER_STATUS_CHANGED,
     ORDER_CANCELLED,
 )
-from app.models import OrderModel, OrderItemModel, OrderEventModel
+from app.models import (
+    CustomerProjectionModel,
+    OrderModel,
+    OrderItemModel,
+    OrderEventModel,
+    OrderRollupModel,
+)
 from app.schemas import (
     Order,
     OrderCreate,
@@ -27,6 +87,18 @@ from app.schemas import (
     OrderStatusUpdate,
     OrderSummary,
     OrderStats,
+    OrderEvent,
+    OrderEventPage,
+    OrderBatchGet,
+    OrderBatchGetResult,
+    OrderBatchStatusUpdate,
+    OrderBatchStatusResult,
+    OrderStatusResult,
+    OrderTimeseries,
+    TimeseriesPoint,
+    OrderDistribution,
+    OrderAnalyticsResult,
+    OrderChangePage,
 )
 
 API_TOKEN = os.getenv("API_TOKEN")
@@ -51,23 +123,62 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
 
 
 async def publish_event_safe(request: Request, event_type: str, data: dict):
-    """Publier un événement de manière sécurisée"""
-    try:
-        broker = getattr(request.app.state, "broker", None)
-        if broker and broker.is_connected:
-            await broker.publish_event(event_type, data)
-            print(f"Event published: {event_type}")
-        else:
-            print(
-                f"Warning: Message broker not available, event {event_type} not published"
-            )
-    except Exception as e:
-        print(f"Error publishing event {event_type}: {str(e)}")
+    """Publier un événement de manière sécurisée (après commit, en arrière-plan)"""
+    broker = getattr(request.app.state, "broker", None)
+
+    async def publish():
+        try:
+            if broker and broker.is_connected:
+                await broker.publish_event(event_type, data)
+                print(f"Event published: {event_type}")
+            else:
+                print(
+                    f"Warning: Message broker not available, event {event_type} not published"
+                )
+        except Exception as e:
+            print(f"Error publishing event {event_type}: {str(e)}")
+
+    # Même worker pour tous les événements d'une commande : ordre conservé
+    await post_commit_queue.submit(event_type, publish, key=data.get("order_id"))
+
+
+async def publish_events_safe(request: Request, event_type: str, data_list: list):
+    """Publier un lot d'événements de manière sécurisée (en arrière-plan)"""
+    if not data_list:
+        return
+    # Un sous-lot par worker, pour rester ordonné avec les événements unitaires
+    lanes = {}
+    for data in data_list:
+        lane = post_commit_queue.lane(data.get("order_id"))
+        lanes.setdefault(lane, []).append(data)
+    for lane_data in lanes.values():
+        await _publish_batch(request, event_type, lane_data)
+
+
+async def _publish_batch(request: Request, event_type: str, data_list: list):
+    broker = getattr(request.app.state, "broker", None)
+
+    async def publish():
+        try:
+            if broker and broker.is_connected:
+                await broker.publish_events(event_type, data_list)
+                print(f"Events published: {event_type} x{len(data_list)}")
+            else:
+                print(
+                    f"Warning: Message broker not available, "
+                    f"{len(data_list)} {event_type} events not published"
+                )
+        except Exception as e:
+            print(f"Error publishing events {event_type}: {str(e)}")
+
+    await post_commit_queue.submit(
+        event_type, publish, key=data_list[0].get("order_id")
+    )
 
 
-def generate_order_id() -> str:
-    """Génère un ID unique pour la commande"""
-    return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+def generate_order_id(shard: int = 0) -> str:
+    """Génère un ID unique et ordonné dans le temps pour la commande"""
+    return order_id_generator.next_id(shard if sharding_enabled() else None)
 
 
 async def create_order_event(
@@ -78,7 +189,7 @@ async def create_order_event(
         db_event = OrderEventModel(
             order_id=order_id,
             event_type=event_type,
-            event_data=json.dumps(event_data, default=str),
+            event_data=json.loads(json.dumps(event_data, default=str)),
             created_at=datetime.now(timezone.utc),
             created_by="system",
         )
@@ -93,7 +204,7 @@ def create_order_summary(order: OrderModel) -> OrderSummary:
         id=order.id,
         order_id=order.order_id,
         customer_id=order.customer_id,
-        customer_name=order.customer_name,
+        customer_name=order.current_customer_name,
         total_amount=order.total_amount,
         status=order.status,
         items_count=len(order.items),
@@ -127,12 +238,33 @@ def parse_date(date_string: str, field_name: str) -> datetime:
         )
 
 
-def get_order_by_id(db: Session, order_id: str) -> OrderModel:
-    """Récupérer une commande par son ID avec gestion d'erreur"""
-    order = db.query(OrderModel).filter(OrderModel.order_id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Commande non trouvée")
-    return order
+def parse_datetime(value: str, field_name: str) -> datetime:
+    """Parser une date ou date-heure ISO 8601 (convertie en UTC naïf)"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format de date invalide pour {field_name} (ISO 8601)",
+        )
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def encode_cursor(created_at: datetime, event_id: int) -> str:
+    """Encoder un curseur de pagination (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), event_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Décoder un curseur de pagination avec gestion d'erreur"""
+    try:
+        created_at, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(event_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
 
 
 def build_search_query(
@@ -185,6 +317,7 @@ def read_root():
 
 @router.get("/orders/search", response_model=List[OrderSummary])
 def search_orders(
+    response: Response,
     q: Optional[str] = Query(default=None, description="Recherche textuelle"),
     min_amount: Optional[float] = Query(default=None, ge=0),
     max_amount: Optional[float] = Query(default=None, ge=0),
@@ -194,15 +327,43 @@ def search_orders(
     date_to: Optional[str] = Query(default=None, description="Date fin (YYYY-MM-DD)"),
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=100, le=1000, ge=1),
-    db: Session = Depends(get_db),
+    include_total: bool = Query(
+        default=False, description="Ajoute l'en-tête X-Total-Count"
+    ),
+    fields: Optional[str] = Query(
+        default=None, description="Champs à renvoyer, séparés par des virgules"
+    ),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Rechercher des commandes avec différents critères"""
     try:
-        query = build_search_query(db, q, min_amount, max_amount, date_from, date_to)
-        orders = (
-            query.order_by(OrderModel.created_at.desc()).offset(skip).limit(limit).all()
+        selected = parse_fields(fields)
+
+        def build_query(session: Session):
+            return build_search_query(
+                session, q, min_amount, max_amount, date_from, date_to
+            )
+
+        orders = scatter_orders(
+            shards,
+            lambda session: apply_fields(build_query(session), selected),
+            skip,
+            limit,
         )
+
+        if include_total:
+            simple = all(
+                value is None
+                for value in (q, min_amount, max_amount, date_from, date_to)
+            )
+            count, exact = total_count(
+                shards, build_query=None if simple else build_query
+            )
+            set_total_count_headers(response, count, exact)
+
+        if selected:
+            return fieldset_response(orders, selected, response)
         return create_order_summaries_list(orders)
     except HTTPException:
         raise
@@ -214,109 +375,373 @@ def search_orders(
 @router.get("/orders/status/{status}", response_model=List[OrderSummary])
 def get_orders_by_status(
     status: str,
+    response: Response,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=100, le=1000, ge=1),
-    db: Session = Depends(get_db),
+    include_total: bool = Query(
+        default=False, description="Ajoute l'en-tête X-Total-Count"
+    ),
+    fields: Optional[str] = Query(
+        default=None, description="Champs à renvoyer, séparés par des virgules"
+    ),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Récupérer toutes les commandes avec un statut donné"""
     validate_status(status)
-
-    orders = (
-        db.query(OrderModel)
-        .filter(OrderModel.status == status)
-        .order_by(OrderModel.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    selected = parse_fields(fields)
+
+    if include_total:
+        set_total_count_headers(response, *total_count(shards, status=status))
+
+    orders = scatter_orders(
+        shards,
+        lambda session: apply_fields(
+            session.query(OrderModel).filter(OrderModel.status == status), selected
+        ),
+        skip,
+        limit,
     )
 
+    if selected:
+        return fieldset_response(orders, selected, response)
     return create_order_summaries_list(orders)
 
 
 @router.get("/orders", response_model=List[OrderSummary])
 def list_orders(
+    response: Response,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=100, le=1000, ge=1),
     customer_id: Optional[str] = Query(default=None),
     status: Optional[str] = Query(default=None),
-    db: Session = Depends(get_db),
+    include_total: bool = Query(
+        default=False, description="Ajoute l'en-tête X-Total-Count"
+    ),
+    fields: Optional[str] = Query(
+        default=None, description="Champs à renvoyer, séparés par des virgules"
+    ),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Lister les commandes avec filtres optionnels"""
-    query = build_search_query(db, customer_id=customer_id, status=status)
-    orders = (
-        query.order_by(OrderModel.created_at.desc()).offset(skip).limit(limit).all()
-    )
+    selected = parse_fields(fields)
+    if include_total:
+        set_total_count_headers(
+            response, *total_count(shards, status=status, customer_id=customer_id)
+        )
+
+    if customer_id:
+        query = apply_fields(
+            build_search_query(
+                shards.for_customer(customer_id), customer_id=customer_id, status=status
+            ),
+            selected,
+        )
+        orders = (
+            query.order_by(OrderModel.created_at.desc()).offset(skip).limit(limit).all()
+        )
+    else:
+        orders = scatter_orders(
+            shards,
+            lambda session: apply_fields(
+                build_search_query(session, status=status), selected
+            ),
+            skip,
+            limit,
+        )
+
+    if selected:
+        return fieldset_response(orders, selected, response)
     return create_order_summaries_list(orders)
 
 
+@router.get("/orders/changes", response_model=OrderChangePage)
+async def get_order_changes(
+    request: Request,
+    since: Optional[str] = Query(
+        default=None,
+        description="Curseur de reprise (next_cursor), ou 'latest' pour ne "
+        "recevoir que les modifications à venir",
+    ),
+    limit: int = Query(default=100, le=1000, ge=1),
+    wait: float = Query(
+        default=0,
+        ge=0,
+        le=CHANGE_FEED_MAX_WAIT,
+        description="Long-poll : secondes d'attente si aucune modification",
+    ),
+    stream: bool = Query(default=False, description="Server-Sent Events"),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    accept: Optional[str] = Header(default=None),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Flux des modifications de commandes (long-poll ou Server-Sent Events)"""
+    cursor = last_event_id or since
+    if cursor == "latest":
+        positions = await asyncio.to_thread(latest_positions)
+    else:
+        positions = decode_position_cursor(cursor)
+
+    if stream or "text/event-stream" in (accept or ""):
+        return StreamingResponse(
+            stream_changes(request, positions, limit),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    changes, positions, reset = await wait_for_changes(positions, limit, wait)
+    return OrderChangePage(
+        changes=[change_item(shard, row) for shard, row in changes],
+        next_cursor=encode_position_cursor(positions),
+        reset=reset,
+    )
+
+
 @router.get("/orders/{order_id}", response_model=Order)
 def get_order(
     order_id: str,
-    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(
+        default=None, description="Champs à renvoyer, séparés par des virgules"
+    ),
+    shards: ShardSessions = Depends(get_shards),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Récupérer une commande par son ID (y compris archivée)"""
+    selected = parse_fields(fields)
+    try:
+        _, order = locate_order(
+            shards, order_id, load_options(selected) if selected else ()
+        )
+    except HTTPException as e:
+        order = locate_archived_orders(shards, [order_id]).get(order_id)
+        if order is None:
+            raise e
+    if selected:
+        return fieldset_response(order, selected)
+    return order
+
+
+@router.post("/orders/batch-get", response_model=OrderBatchGetResult)
+def get_orders_batch(
+    batch: OrderBatchGet,
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
-    """Récupérer une commande par son ID"""
-    return get_order_by_id(db, order_id)
+    """Récupérer plusieurs commandes par leurs IDs (une requête par shard)"""
+    order_ids = list(dict.fromkeys(batch.order_ids))
+    found = locate_orders(shards, order_ids, [selectinload(OrderModel.items)])
+    missing = [order_id for order_id in order_ids if order_id not in found]
+    if missing:
+        found.update(locate_archived_orders(shards, missing))
+    return OrderBatchGetResult(
+        orders={
+            order_id: Order.model_validate(found[order_id])
+            for order_id in order_ids
+            if order_id in found
+        },
+        not_found=[order_id for order_id in order_ids if order_id not in found],
+    )
+
+
+@router.get("/orders/{order_id}/events", response_model=OrderEventPage)
+def get_order_events(
+    order_id: str,
+    cursor: Optional[str] = Query(default=None, description="Curseur de page"),
+    limit: int = Query(default=100, le=1000, ge=1),
+    event_type: Optional[str] = Query(default=None),
+    shards: ShardSessions = Depends(get_shards),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Récupérer l'historique d'audit d'une commande (pagination par curseur)"""
+    filters = [OrderEventModel.order_id == order_id]
+    if event_type:
+        filters.append(OrderEventModel.event_type == event_type)
+    if cursor:
+        created_at, event_id = decode_cursor(cursor)
+        filters.append(
+            tuple_(OrderEventModel.created_at, OrderEventModel.id)
+            > tuple_(created_at, event_id)
+        )
+
+    # Un ancien identifiant est cherché sur tous les shards, archive comprise
+    for shard in order_shard_candidates(order_id, shards.count):
+        db = shards.session(shard)
+        events = (
+            db.query(OrderEventModel)
+            .filter(*filters)
+            .order_by(OrderEventModel.created_at, OrderEventModel.id)
+            .limit(limit + 1)
+            .all()
+        )
+        if events:
+            break
+        archived = archived_order_events(db, order_id)
+        if archived is not None:
+            events = filter_archived_events(archived, cursor, event_type, limit)
+            break
+        # Page vide à cause des filtres : la commande existe-t-elle ?
+        if (cursor or event_type) and db.query(
+            exists().where(OrderEventModel.order_id == order_id)
+        ).scalar():
+            break
+    else:
+        raise HTTPException(status_code=404, detail="Commande non trouvée")
+
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1].created_at, events[-1].id)
+
+    return OrderEventPage(
+        events=[OrderEvent.model_validate(event) for event in events],
+        next_cursor=next_cursor,
+    )
+
+
+def filter_archived_events(
+    events: List[OrderEventModel],
+    cursor: Optional[str],
+    event_type: Optional[str],
+    limit: int,
+) -> List[OrderEventModel]:
+    """Page d'historique d'une commande archivée (mêmes règles que la table)"""
+    if event_type:
+        events = [event for event in events if event.event_type == event_type]
+    if cursor:
+        position = decode_cursor(cursor)
+        events = [event for event in events if (event.created_at, event.id) > position]
+    return sorted(events, key=lambda event: (event.created_at, event.id))[: limit + 1]
+
+
+def to_cents(amount) -> Decimal:
+    return Decimal(amount).quantize(Decimal("0.01"))
+
+
+def insert_order(db: Session, order_row: dict, item_rows: List[dict]) -> Order:
+    """Insère la commande et ses articles (deux requêtes, avec RETURNING).
+
+    La réponse est construite à partir des valeurs insérées ; les données
+    client à jour sont lues dans la projection par la même requête.
+    """
+    customer_id = order_row["customer_id"]
+    projection = CustomerProjectionModel.customer_id == customer_id
+    order_pk, projected_name, projected_email = db.execute(
+        insert(OrderModel)
+        .values(order_row)
+        .returning(
+            OrderModel.id,
+            select(CustomerProjectionModel.name).where(projection).scalar_subquery(),
+            select(CustomerProjectionModel.email).where(projection).scalar_subquery(),
+        )
+    ).one()
+
+    for row in item_rows:
+        row["order_id"] = order_pk
+    item_ids = db.scalars(
+        insert(OrderItemModel).returning(
+            OrderItemModel.id, sort_by_parameter_order=True
+        ),
+        item_rows,
+    ).all()
+
+    return Order.model_validate(
+        {
+            **order_row,
+            "id": order_pk,
+            "current_customer_name": (
+                order_row["customer_name"] if projected_name is None else projected_name
+            ),
+            "current_customer_email": (
+                order_row["customer_email"]
+                if projected_email is None
+                else projected_email
+            ),
+            "customer_name_at_order": order_row["customer_name"],
+            "customer_email_at_order": order_row["customer_email"],
+            "items": [
+                {**row, "id": item_id} for row, item_id in zip(item_rows, item_ids)
+            ],
+        }
+    )
 
 
 @router.post("/orders", response_model=Order)
+@idempotent(Order)
 async def create_order(
     order: OrderCreate,
     request: Request,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Créer une nouvelle commande"""
+    shard = shard_for_customer(order.customer_id, shards.count)
+    order_db = shards.session(shard)
+
     try:
-        order_id = generate_order_id()
-        total_amount = sum(item.product_price * item.quantity for item in order.items)
+        # Lecture du catalogue : ses erreurs base passent par le rollback
+        items = enrich_order_items(db, order.items)
+        order_id = generate_order_id(shard)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        item_rows = [
+            {
+                "product_id": item.product_id,
+                "product_name": item.product_name,
+                "product_price": to_cents(item.product_price),
+                "quantity": item.quantity,
+                "total_price": to_cents(item.product_price * item.quantity),
+                "product_sku": item.product_sku,
+                "product_description": item.product_description,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for item in items
+        ]
+        total_amount = sum((row["total_price"] for row in item_rows), Decimal("0.00"))
 
-        db_order = OrderModel(
-            order_id=order_id,
+        order_row = {
+            "order_id": order_id,
+            "customer_id": order.customer_id,
+            "customer_name": order.customer_name,
+            "customer_email": order.customer_email,
+            "shipping_address": order.shipping_address,
+            "shipping_city": order.shipping_city,
+            "shipping_postal_code": order.shipping_postal_code,
+            "shipping_country": order.shipping_country,
+            "currency": order.currency,
+            "total_amount": total_amount,
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now,
+        }
+        created = insert_order(order_db, order_row, item_rows)
+
+        record_order_created(
+            order_db,
+            now,
+            "pending",
+            order.currency,
+            total_amount,
             customer_id=order.customer_id,
-            customer_name=order.customer_name,
-            customer_email=order.customer_email,
-            shipping_address=order.shipping_address,
-            shipping_city=order.shipping_city,
-            shipping_postal_code=order.shipping_postal_code,
-            shipping_country=order.shipping_country,
-            currency=order.currency,
-            total_amount=total_amount,
-            status="pending",
-        )
-
-        db.add(db_order)
-        db.flush()
-
-        for item_data in order.items:
-            item_total = item_data.product_price * item_data.quantity
-            db_item = OrderItemModel(
-                order_id=db_order.id,
-                product_id=item_data.product_id,
-                product_name=item_data.product_name,
-                product_price=item_data.product_price,
-                quantity=item_data.quantity,
-                total_price=item_total,
-                product_sku=item_data.product_sku,
-                product_description=item_data.product_description,
-            )
-            db.add(db_item)
+        )
 
         await create_order_event(
-            db,
+            order_db,
             order_id,
             "order_created",
             {
                 "customer_id": order.customer_id,
                 "total_amount": str(total_amount),
-                "items_count": len(order.items),
+                "items_count": len(items),
             },
         )
+        record_order_change(order_db, order_id, "created", "pending")
+
+        order_db.commit()
 
-        db.commit()
-        db.refresh(db_order)
+        order_sketches.record(now, total_amount, order.customer_id)
 
         await publish_event_safe(
             request,
@@ -333,16 +758,19 @@ async def create_order(
                         "quantity": item.quantity,
                         "price": str(item.product_price),
                     }
-                    for item in order.items
+                    for item in items
                 ],
                 "created_at": datetime.now(timezone.utc).isoformat(),
             },
         )
 
-        return db_order
+        return created
 
+    except HTTPException:
+        shards.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        shards.rollback()
         print(f"Error creating order: {str(e)}")
         raise HTTPException(
             status_code=500, detail="Erreur lors de la création de la commande"
@@ -354,12 +782,12 @@ async def update_order(
     order_id: str,
     updated_order: OrderUpdate,
     request: Request,
-    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Mettre à jour une commande"""
     try:
-        order = get_order_by_id(db, order_id)
+        order_db, order = locate_order(shards, order_id)
 
         old_values = {
             "customer_name": order.customer_name,
@@ -377,14 +805,15 @@ async def update_order(
         order.updated_at = datetime.now(timezone.utc)
 
         await create_order_event(
-            db,
+            order_db,
             order_id,
             "order_updated",
             {"old_values": old_values, "changes": changes},
         )
+        record_order_change(order_db, order_id, "updated", order.status)
 
-        db.commit()
-        db.refresh(order)
+        order_db.commit()
+        order_db.refresh(order)
 
         await publish_event_safe(
             request,
@@ -402,7 +831,7 @@ async def update_order(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        shards.rollback()
         print(f"Error updating order: {str(e)}")
         raise HTTPException(
             status_code=500, detail="Erreur lors de la mise à jour de la commande"
@@ -410,16 +839,19 @@ async def update_order(
 
 
 @router.put("/orders/{order_id}/status", response_model=Order)
+@idempotent(Order)
 async def update_order_status(
     order_id: str,
     status_update: OrderStatusUpdate,
     request: Request,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Mettre à jour le statut d'une commande"""
     try:
-        order = get_order_by_id(db, order_id)
+        order_db, order = locate_order(shards, order_id)
         old_status = order.status
         new_status = status_update.status
 
@@ -434,8 +866,10 @@ async def update_order_status(
         elif new_status == "delivered":
             order.delivered_at = datetime.now(timezone.utc)
 
+        record_status_change(order_db, order, old_status)
+
         await create_order_event(
-            db,
+            order_db,
             order_id,
             "status_changed",
             {
@@ -444,9 +878,10 @@ async def update_order_status(
                 "notes": status_update.notes,
             },
         )
+        record_order_change(order_db, order_id, "status_changed", new_status)
 
-        db.commit()
-        db.refresh(order)
+        order_db.commit()
+        order_db.refresh(order)
 
         await publish_event_safe(
             request,
@@ -466,24 +901,197 @@ async def update_order_status(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        shards.rollback()
         print(f"Error updating order status: {str(e)}")
         raise HTTPException(
             status_code=500, detail="Erreur lors de la mise à jour du statut"
         )
 
 
+def apply_status_batch(
+    db: Session, order_ids: List[str], new_status: str, notes: Optional[str], now
+) -> list:
+    """Transition de statut sur les commandes d'un shard ; retourne les modifiées"""
+    conditions = [
+        OrderModel.order_id.in_(order_ids),
+        OrderModel.status != new_status,
+    ]
+    if new_status == "cancelled":
+        conditions.append(OrderModel.status.notin_(NON_CANCELLABLE_STATUSES))
+
+    # Verrouille les lignes éligibles pour connaître leur ancien statut
+    candidates = {
+        row.id: row
+        for row in db.execute(
+            select(
+                OrderModel.id,
+                OrderModel.order_id,
+                OrderModel.customer_id,
+                OrderModel.status,
+                OrderModel.created_at,
+                OrderModel.currency,
+                OrderModel.total_amount,
+            )
+            .where(*conditions)
+            .with_for_update()
+        )
+    }
+
+    values = {"status": new_status, "updated_at": now}
+    if new_status == "shipped":
+        values["shipped_at"] = now
+    elif new_status == "delivered":
+        values["delivered_at"] = now
+
+    updated_ids = []
+    if candidates:
+        updated_ids = db.execute(
+            update(OrderModel)
+            .where(OrderModel.id.in_(list(candidates)), *conditions[1:])
+            .values(**values)
+            .returning(OrderModel.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()
+    updated = [candidates[pk] for pk in updated_ids]
+
+    if updated:
+        record_status_changes(
+            db,
+            [
+                (
+                    row.created_at,
+                    row.currency,
+                    row.status,
+                    new_status,
+                    row.total_amount,
+                )
+                for row in updated
+            ],
+        )
+        db.execute(
+            insert(OrderEventModel),
+            [
+                {
+                    "order_id": row.order_id,
+                    "event_type": "status_changed",
+                    "event_data": {
+                        "old_status": row.status,
+                        "new_status": new_status,
+                        "notes": notes,
+                    },
+                    "created_at": now,
+                    "created_by": "system",
+                }
+                for row in updated
+            ],
+        )
+        record_order_changes(
+            db, [(row.order_id, new_status) for row in updated], "status_changed"
+        )
+
+    return [(row.order_id, row.customer_id, row.status) for row in updated]
+
+
+@router.post("/orders/status/batch", response_model=OrderBatchStatusResult)
+async def update_orders_status_batch(
+    batch: OrderBatchStatusUpdate,
+    request: Request,
+    shards: ShardSessions = Depends(get_shards),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Appliquer une transition de statut à un lot de commandes"""
+    order_ids = list(dict.fromkeys(batch.order_ids))
+    new_status = batch.status
+    now = datetime.now(timezone.utc)
+
+    # Une transaction par shard concerné
+    ids_by_shard = {}
+    for order_id in order_ids:
+        ids_by_shard.setdefault(shard_for_order(order_id), []).append(order_id)
+
+    updated_rows = []
+    for shard, shard_order_ids in sorted(ids_by_shard.items()):
+        db = shards.session(shard)
+        try:
+            updated_rows += apply_status_batch(
+                db, shard_order_ids, new_status, batch.notes, now
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error updating orders status in batch: {str(e)}")
+            raise HTTPException(
+                status_code=500, detail="Erreur lors de la mise à jour des statuts"
+            )
+
+    results = {
+        order_id: OrderStatusResult(
+            order_id=order_id, result="updated", old_status=old_status
+        )
+        for order_id, _, old_status in updated_rows
+    }
+
+    for shard, shard_order_ids in sorted(ids_by_shard.items()):
+        skipped_ids = [
+            order_id for order_id in shard_order_ids if order_id not in results
+        ]
+        if not skipped_ids:
+            continue
+        current_statuses = dict(
+            shards.session(shard)
+            .query(OrderModel.order_id, OrderModel.status)
+            .filter(OrderModel.order_id.in_(skipped_ids))
+            .all()
+        )
+        for order_id in skipped_ids:
+            current = current_statuses.get(order_id)
+            if current is None:
+                result = "not_found"
+            elif current == new_status:
+                result = "unchanged"
+            else:
+                result = "not_allowed"
+            results[order_id] = OrderStatusResult(
+                order_id=order_id, result=result, old_status=current
+            )
+
+    await publish_events_safe(
+        request,
+        ORDER_STATUS_CHANGED,
+        [
+            {
+                "order_id": order_id,
+                "customer_id": customer_id,
+                "old_status": old_status,
+                "new_status": new_status,
+                "notes": batch.notes,
+                "updated_at": now.isoformat(),
+            }
+            for order_id, customer_id, old_status in updated_rows
+        ],
+    )
+
+    return OrderBatchStatusResult(
+        status=new_status,
+        updated_count=len(updated_rows),
+        results=[results[order_id] for order_id in order_ids],
+    )
+
+
 @router.post("/orders/{order_id}/cancel", response_model=Order)
+@idempotent(Order)
 async def cancel_order(
     order_id: str,
     request: Request,
     reason: Optional[str] = Query(default=None),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Annuler une commande"""
     try:
-        order = get_order_by_id(db, order_id)
+        order_db, order = locate_order(shards, order_id)
 
         if order.status in NON_CANCELLABLE_STATUSES:
             raise HTTPException(
@@ -494,16 +1102,18 @@ async def cancel_order(
         old_status = order.status
         order.status = "cancelled"
         order.updated_at = datetime.now(timezone.utc)
+        record_status_change(order_db, order, old_status)
 
         await create_order_event(
-            db,
+            order_db,
             order_id,
             "order_cancelled",
             {"old_status": old_status, "reason": reason},
         )
+        record_order_change(order_db, order_id, "cancelled", "cancelled")
 
-        db.commit()
-        db.refresh(order)
+        order_db.commit()
+        order_db.refresh(order)
 
         await publish_event_safe(
             request,
@@ -521,7 +1131,7 @@ async def cancel_order(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        shards.rollback()
         print(f"Error cancelling order: {str(e)}")
         raise HTTPException(
             status_code=500, detail="Erreur lors de l'annulation de la commande"
@@ -532,20 +1142,22 @@ async def cancel_order(
 async def delete_order(
     order_id: str,
     request: Request,
-    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Supprimer une commande"""
     try:
-        order = get_order_by_id(db, order_id)
-        db.delete(order)
-        db.commit()
+        order_db, order = locate_order(shards, order_id)
+        record_order_deleted(order_db, order)
+        record_order_change(order_db, order_id, "deleted")
+        order_db.delete(order)
+        order_db.commit()
         return {"message": "Commande supprimée avec succès", "order_id": order_id}
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        shards.rollback()
         print(f"Error deleting order: {str(e)}")
         raise HTTPException(
             status_code=500, detail="Erreur lors de la suppression de la commande"
@@ -555,61 +1167,249 @@ async def delete_order(
 @router.get("/customers/{customer_id}/orders", response_model=List[OrderSummary])
 def get_customer_orders(
     customer_id: str,
+    response: Response,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=100, le=1000, ge=1),
-    db: Session = Depends(get_db),
+    include_total: bool = Query(
+        default=False, description="Ajoute l'en-tête X-Total-Count"
+    ),
+    fields: Optional[str] = Query(
+        default=None, description="Champs à renvoyer, séparés par des virgules"
+    ),
+    shards: ShardSessions = Depends(get_shards),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
     """Récupérer les commandes d'un client"""
+    selected = parse_fields(fields)
+    if include_total:
+        set_total_count_headers(
+            response,
+            *total_count(shards, customer_id=customer_id, include_archived=True),
+        )
+
+    db = shards.for_customer(customer_id)
+    query = db.query(OrderModel).filter(OrderModel.customer_id == customer_id)
     orders = (
-        db.query(OrderModel)
-        .filter(OrderModel.customer_id == customer_id)
+        apply_fields(query, selected)
         .order_by(OrderModel.created_at.desc())
-        .offset(skip)
-        .limit(limit)
+        .limit(skip + limit)
         .all()
     )
+    orders = merge_archived_orders(db, customer_id, orders, skip, limit)
 
+    if selected:
+        return fieldset_response(orders, selected, response)
     return create_order_summaries_list(orders)
 
 
-@router.get("/stats", response_model=OrderStats)
-def get_order_statistics(
+@router.get("/stats/timeseries", response_model=OrderTimeseries)
+def get_order_timeseries(
+    granularity: Literal["hour", "day", "month"] = Query(default="day"),
+    date_from: str = Query(..., alias="from", description="Début inclus (ISO 8601)"),
+    date_to: str = Query(..., alias="to", description="Fin exclue (ISO 8601)"),
+    by_status: bool = Query(default=False),
+    by_currency: bool = Query(default=False),
+    shards: ShardSessions = Depends(get_shards),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Chiffre d'affaires et nombre de commandes par période (lit les agrégats)"""
+    start = parse_datetime(date_from, "from")
+    end = parse_datetime(date_to, "to")
+
+    group_columns = [OrderRollupModel.bucket_start]
+    if by_status:
+        group_columns.append(OrderRollupModel.status)
+    if by_currency:
+        group_columns.append(OrderRollupModel.currency)
+
+    def fetch(session: Session):
+        return (
+            session.query(
+                *group_columns,
+                func.sum(OrderRollupModel.order_count).label("order_count"),
+                func.sum(OrderRollupModel.revenue).label("revenue"),
+            )
+            .filter(
+                OrderRollupModel.granularity == granularity,
+                OrderRollupModel.bucket_start >= start,
+                OrderRollupModel.bucket_start < end,
+            )
+            .group_by(*group_columns)
+            .all()
+        )
+
+    # Chaque shard a ses propres agrégats : on somme par clé de regroupement
+    totals = {}
+    for rows in shards.scatter(fetch):
+        for row in rows:
+            key = tuple(row[: len(group_columns)])
+            count, revenue = totals.get(key, (0, Decimal("0")))
+            totals[key] = (
+                count + row.order_count,
+                revenue + Decimal(str(row.revenue or 0)),
+            )
+
+    names = [column.key for column in group_columns]
+    points = [
+        TimeseriesPoint(**dict(zip(names, key)), order_count=count, revenue=revenue)
+        for key, (count, revenue) in sorted(totals.items())
+        if count or revenue
+    ]
+
+    return OrderTimeseries(granularity=granularity, points=points)
+
+
+@router.get("/stats/distribution", response_model=OrderDistribution)
+def get_order_distribution(
+    date_from: str = Query(..., alias="from", description="Début inclus (ISO 8601)"),
+    date_to: str = Query(..., alias="to", description="Fin exclue (ISO 8601)"),
+    percentiles: str = Query(
+        default="50,90,95,99", description="Percentiles séparés par des virgules"
+    ),
     db: Session = Depends(get_db),
     _: HTTPAuthorizationCredentials = Security(verify_token),
 ):
-    """Obtenir les statistiques des commandes"""
+    """Percentiles du montant et clients distincts (approximatifs, par jour)"""
+    start = parse_datetime(date_from, "from")
+    end = parse_datetime(date_to, "to")
+
     try:
-        total_orders = db.query(OrderModel).count()
-        total_revenue = db.query(func.sum(OrderModel.total_amount)).scalar() or 0
-        avg_order_value = db.query(func.avg(OrderModel.total_amount)).scalar() or 0
+        requested = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Percentiles invalides")
+    if not requested or any(p < 0 or p > 100 for p in requested):
+        raise HTTPException(
+            status_code=400, detail="Les percentiles doivent être entre 0 et 100"
+        )
 
-        status_counts = (
-            db.query(OrderModel.status, func.count(OrderModel.id))
-            .group_by(OrderModel.status)
-            .all()
+    sketch = distribution(db, start, end)
+    return OrderDistribution(
+        order_count=sketch.order_count,
+        distinct_customers=sketch.customers.count() if sketch.order_count else 0,
+        percentiles={f"p{p:g}": sketch.amounts.quantile(p / 100) for p in requested},
+    )
+
+
+@router.get("/stats/query", response_model=OrderAnalyticsResult)
+def query_order_analytics(
+    group_by: str = Query(
+        default="status", description=f"Parmi: {', '.join(GROUP_BY_FIELDS)}"
+    ),
+    status: Optional[List[str]] = Query(default=None),
+    shipping_country: Optional[List[str]] = Query(default=None),
+    currency: Optional[List[str]] = Query(default=None),
+    customer_id: Optional[List[str]] = Query(default=None),
+    date_from: Optional[str] = Query(default=None, alias="from"),
+    date_to: Optional[str] = Query(default=None, alias="to"),
+    bucket_size: Decimal = Query(default=Decimal("50"), gt=0),
+    limit: int = Query(default=100, ge=1, le=10000),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Agrégats ad hoc sur l'instantané en mémoire (sans requête en base)"""
+    if order_snapshot is None or not order_snapshot.loaded:
+        raise HTTPException(
+            status_code=503, detail="Instantané analytique indisponible"
         )
-        orders_by_status = {status: count for status, count in status_counts}
 
-        from datetime import timedelta
+    fields = [field.strip() for field in group_by.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in GROUP_BY_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Champs de regroupement invalides: {', '.join(unknown)}",
+        )
 
-        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        recent_orders = (
-            db.query(OrderModel).filter(OrderModel.created_at >= seven_days_ago).count()
+    filters = {
+        name: values
+        for name, values in (
+            ("status", status),
+            ("shipping_country", shipping_country),
+            ("currency", currency),
+            ("customer_id", customer_id),
         )
+        if values
+    }
+
+    return order_snapshot.query(
+        group_by=fields,
+        filters=filters,
+        date_from=parse_datetime(date_from, "from") if date_from else None,
+        date_to=parse_datetime(date_to, "to") if date_to else None,
+        bucket_size_cents=int(bucket_size * 100),
+        limit=limit,
+    )
 
-        top_customers = (
-            db.query(
-                OrderModel.customer_id,
-                OrderModel.customer_name,
-                func.count(OrderModel.id).label("order_count"),
-                func.sum(OrderModel.total_amount).label("total_spent"),
-            )
-            .group_by(OrderModel.customer_id, OrderModel.customer_name)
-            .order_by(func.count(OrderModel.id).desc())
-            .limit(10)
-            .all()
+
+def shard_statistics(db: Session) -> dict:
+    """Statistiques partielles d'un shard, fusionnées par get_order_statistics"""
+    seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    # Commandes actives et archivées
+    orders = order_facts()
+
+    total_orders, total_revenue = db.query(
+        func.count(), func.sum(orders.c.total_amount)
+    ).one()
+
+    status_counts = (
+        db.query(orders.c.status, func.count()).group_by(orders.c.status).all()
+    )
+
+    recent_orders = (
+        db.query(func.count())
+        .select_from(orders)
+        .filter(orders.c.created_at >= seven_days_ago)
+        .scalar()
+    )
+
+    # Les commandes d'un client sont sur un seul shard : le top 10 de chaque
+    # shard suffit pour le top 10 global
+    top_customers = (
+        db.query(
+            orders.c.customer_id,
+            orders.c.customer_name,
+            func.count().label("order_count"),
+            func.sum(orders.c.total_amount).label("total_spent"),
         )
+        .group_by(orders.c.customer_id, orders.c.customer_name)
+        .order_by(func.count().desc())
+        .limit(10)
+        .all()
+    )
+
+    return {
+        "total_orders": total_orders,
+        "total_revenue": Decimal(str(total_revenue or 0)),
+        "orders_by_status": dict(status_counts),
+        "recent_orders": recent_orders,
+        "top_customers": top_customers,
+    }
+
+
+@router.get("/stats", response_model=OrderStats)
+def get_order_statistics(
+    shards: ShardSessions = Depends(get_shards),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Obtenir les statistiques des commandes"""
+    try:
+        partials = shards.scatter(shard_statistics)
+
+        total_orders = sum(p["total_orders"] for p in partials)
+        total_revenue = sum((p["total_revenue"] for p in partials), Decimal("0"))
+        avg_order_value = total_revenue / total_orders if total_orders else 0
+
+        orders_by_status = {}
+        for partial in partials:
+            for status, count in partial["orders_by_status"].items():
+                orders_by_status[status] = orders_by_status.get(status, 0) + count
+
+        recent_orders = sum(p["recent_orders"] for p in partials)
+
+        top_customers = sorted(
+            (row for p in partials for row in p["top_customers"]),
+            key=lambda row: row.order_count,
+            reverse=True,
+        )[:10]
 
         top_customers_list = [
             {
@@ -623,7 +1423,7 @@ def get_order_statistics(
 
         return OrderStats(
             total_orders=total_orders,
-            total_revenue=Decimal(str(total_revenue)),
+            total_revenue=total_revenue,
             average_order_value=Decimal(str(avg_order_value)),
             orders_by_status=orders_by_status,
             recent_orders_count=recent_orders,
@@ -637,6 +1437,27 @@ def get_order_statistics(
         )
 
 
+@router.get("/export/orders")
+def export_orders(
+    table: Literal["orders", "order_items"] = Query(default="orders"),
+    since: Optional[str] = Query(
+        default=None, description="Uniquement les commandes modifiées après (ISO 8601)"
+    ),
+    _: HTTPAuthorizationCredentials = Security(verify_token),
+):
+    """Exporter les commandes ou leurs articles en flux Arrow IPC"""
+    if not export_available():
+        raise HTTPException(status_code=503, detail="Export colonnaire indisponible")
+    since_dt = parse_datetime(since, "since") if since else None
+    return StreamingResponse(
+        iter_arrow_stream(table, since_dt),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{table}.arrows"',
+        },
+    )
+
+
 @router.get("/health/messaging")
 async def check_messaging_health(request: Request):
     """Vérifier l'état du système de messagerie"""
@@ -1,5 +1,5 @@
-from typing import Optional, List, Literal
-from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import Dict, Optional, List, Literal, Union
+from pydantic import AliasChoices, BaseModel, Field, ConfigDict, field_validator
 from decimal import Decimal
 from datetime import datetime
 
@@ -77,7 +77,51 @@ class OrderStatusUpdate(BaseModel):
     notes: Optional[str] = None
 
 
+class OrderBatchStatusUpdate(OrderStatusUpdate):
+    """Transition de statut appliquée à un lot de commandes"""
+
+    order_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class OrderBatchGet(BaseModel):
+    """Identifiants des commandes à récupérer en une requête"""
+
+    order_ids: List[str] = Field(..., min_length=1, max_length=5000)
+
+
+class OrderStatusResult(BaseModel):
+    order_id: str
+    result: Literal["updated", "unchanged", "not_found", "not_allowed"]
+    old_status: Optional[str] = None
+
+
+class OrderBatchStatusResult(BaseModel):
+    """Résultat d'une transition de statut par lot"""
+
+    status: str
+    updated_count: int
+    results: List[OrderStatusResult]
+
+
 class Order(OrderBase):
+    # Données client à jour (projection), avec repli sur la valeur de la commande
+    customer_name: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("current_customer_name", "customer_name"),
+    )
+    customer_email: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("current_customer_email", "customer_email"),
+    )
+    # Données client figées au moment de la commande
+    customer_name_at_order: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("customer_name_at_order", "customer_name"),
+    )
+    customer_email_at_order: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("customer_email_at_order", "customer_email"),
+    )
     id: Optional[int] = None
     order_id: Optional[str] = None
     total_amount: Optional[Decimal] = None
@@ -89,6 +133,13 @@ class Order(OrderBase):
     items: List[OrderItem] = []
 
 
+class OrderBatchGetResult(BaseModel):
+    """Commandes trouvées (par identifiant) et identifiants introuvables"""
+
+    orders: Dict[str, Order]
+    not_found: List[str]
+
+
 class OrderSummary(BaseModel):
     """Résumé d'une commande pour les listes"""
 
@@ -113,3 +164,88 @@ class OrderStats(BaseModel):
     orders_by_status: dict
     recent_orders_count: int
     top_customers: List[dict]
+
+
+class OrderEvent(BaseModel):
+    """Événement du journal d'audit d'une commande"""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    order_id: str
+    event_type: str
+    event_data: Optional[dict] = None
+    created_at: datetime
+    created_by: Optional[str] = None
+
+
+class OrderEventPage(BaseModel):
+    """Page d'événements avec curseur vers la page suivante"""
+
+    events: List[OrderEvent]
+    next_cursor: Optional[str] = None
+
+
+class OrderChange(BaseModel):
+    """Modification d'une commande dans le flux /orders/changes"""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    seq: int
+    shard: int = 0
+    order_id: str
+    change_type: str
+    status: Optional[str] = None
+    changed_at: datetime
+
+
+class OrderChangePage(BaseModel):
+    """Modifications depuis un curseur, et curseur de reprise"""
+
+    changes: List[OrderChange]
+    next_cursor: str
+    reset: bool = Field(
+        default=False,
+        description="Des modifications ont pu être manquées (trou ignoré ou "
+        "curseur antérieur à la rétention) : resynchroniser l'état avant de "
+        "reprendre au curseur",
+    )
+
+
+class TimeseriesPoint(BaseModel):
+    bucket_start: datetime
+    status: Optional[str] = None
+    currency: Optional[str] = None
+    order_count: int
+    revenue: Decimal
+
+
+class OrderTimeseries(BaseModel):
+    """Série temporelle du chiffre d'affaires et du nombre de commandes"""
+
+    granularity: str
+    points: List[TimeseriesPoint]
+
+
+class OrderDistribution(BaseModel):
+    """Distribution approximative des commandes sur une période"""
+
+    order_count: int
+    distinct_customers: int
+    percentiles: Dict[str, Optional[float]]
+
+
+class AnalyticsGroup(BaseModel):
+    key: Dict[str, Optional[Union[str, float]]]
+    order_count: int
+    revenue: float
+    avg_order_value: float
+
+
+class OrderAnalyticsResult(BaseModel):
+    """Agrégats calculés sur l'instantané colonnaire des commandes"""
+
+    snapshot_rows: int
+    matched_orders: int
+    watermark: Optional[datetime] = None
+    groups: List[AnalyticsGroup]
@@ -0,0 +1,118 @@
+# app/server.py
+"""
+Point d'entrée de production : plusieurs workers uvicorn sur une même socket.
+
+L'application est importée et le schéma créé une seule fois dans le process
+parent, puis les workers sont forkés (ils partagent la socket d'écoute) ; un
+worker qui s'arrête est remplacé. Un seul worker, élu par app.leadership,
+consomme les événements externes. Chaque worker a son propre identifiant de
+nœud pour les identifiants de commande (voir app.order_ids), conservé par
+le worker qui le remplace.
+
+    python -m app.server --workers 4
+"""
+
+import argparse
+import os
+import signal
+import time
+import traceback
+
+import uvicorn
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8003"))
+WORKER_RESTART_DELAY = 1.0
+
+
+def dispose_engines(close: bool):
+    from app.sharding import all_engines
+
+    for shard_engine in all_engines():
+        shard_engine.dispose(close=close)
+
+
+class Supervisor:
+    """Process parent : fork des workers, remplacement et arrêt propre"""
+
+    def __init__(self, config: uvicorn.Config, workers: int):
+        from app.order_ids import worker_node_ids
+
+        self.config = config
+        self.workers = workers
+        self.node_ids = worker_node_ids(workers)
+        self.pids = {}
+        self.stopping = False
+        self.socket = config.bind_socket()
+
+    def spawn(self, index: int):
+        node_id = self.node_ids[index]
+        if index in self.pids.values():
+            raise RuntimeError(f"Order id node {node_id} already used by a worker")
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                from app.order_ids import order_id_generator
+
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                order_id_generator.set_node_id(node_id)
+                # Les connexions héritées du parent ne doivent pas être partagées
+                dispose_engines(close=False)
+                uvicorn.Server(self.config).run(sockets=[self.socket])
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.pids[pid] = index
+        print(f"Started worker {pid} (order id node {node_id})")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.pids:
+            pid, status = os.wait()
+            index = self.pids.pop(pid, None)
+            if not self.stopping and index is not None:
+                print(f"Worker {pid} exited (status {status}), restarting")
+                time.sleep(WORKER_RESTART_DELAY)
+                self.spawn(index)
+
+        self.socket.close()
+        print("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur multi-workers de l'API")
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    # Préchargement : import, schéma et partitions une seule fois avant le fork
+    from app.main import app, setup_storage
+
+    setup_storage()
+    app.state.storage_ready = True
+    dispose_engines(close=True)
+
+    config = uvicorn.Config(app, host=args.host, port=args.port)
+    Supervisor(config, max(1, args.workers)).run()
+
+
+if __name__ == "__main__":
+    main()
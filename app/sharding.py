@@ -0,0 +1,256 @@
+# app/sharding.py
+"""
+Répartition optionnelle des commandes (orders, order_items, order_events et
+les données qui leur sont liées : agrégats, projection client) sur plusieurs
+bases, par hash de customer_id.
+
+Le shard 0 est la base principale (DATABASE_URL), qui conserve aussi les
+tables globales (catalogue, clés d'idempotence, sketches). ORDER_SHARD_URLS
+liste les bases supplémentaires (shards 1..N) ; sans elle, tout reste dans
+la base principale.
+
+Les routes centrées sur un client n'interrogent qu'un shard, celles sur une
+commande utilisent le shard inscrit dans son identifiant, et les listes ou
+statistiques globales interrogent tous les shards en parallèle.
+
+Le nombre de shards détermine le placement des clients : le modifier, ou
+activer le sharding sur une base existante, suppose de redistribuer les
+commandes.
+"""
+
+import hashlib
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SessionLocal,
+    engine,
+    get_db,
+)
+from app.models import OrderModel
+from app.order_ids import order_shard
+
+ORDER_SHARD_URLS = [
+    url.strip() for url in os.getenv("ORDER_SHARD_URLS", "").split(",") if url.strip()
+]
+SHARD_SCATTER_WORKERS = int(os.getenv("SHARD_SCATTER_WORKERS", "8"))
+
+T = TypeVar("T")
+
+shard_engines = [
+    create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    for url in ORDER_SHARD_URLS
+]
+# Fabriques de sessions des shards 1..N (le shard 0 utilise get_db/SessionLocal)
+shard_session_factories = [sessionmaker(bind=e) for e in shard_engines]
+
+_executor = ThreadPoolExecutor(
+    max_workers=SHARD_SCATTER_WORKERS, thread_name_prefix="shard-scatter"
+)
+
+
+def shard_count() -> int:
+    return 1 + len(shard_session_factories)
+
+
+def sharding_enabled() -> bool:
+    return shard_count() > 1
+
+
+def all_engines() -> list:
+    return [engine] + [factory.kw["bind"] for factory in shard_session_factories]
+
+
+def shard_for_customer(customer_id: str, count: Optional[int] = None) -> int:
+    """Shard d'un client (hash stable, indépendant du process)"""
+    count = count or shard_count()
+    if count == 1:
+        return 0
+    digest = hashlib.blake2b(customer_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def shard_for_order(order_id: str) -> int:
+    """Shard d'une commande ; les identifiants sans suffixe sont sur le shard 0"""
+    shard = order_shard(order_id)
+    if shard is None or shard >= shard_count():
+        return 0
+    return shard
+
+
+def open_shard_session(shard: int) -> Session:
+    """Nouvelle session hors requête HTTP (consommateurs, tâches, CLI)"""
+    if shard == 0:
+        return SessionLocal()
+    return shard_session_factories[shard - 1]()
+
+
+class ShardSessions:
+    """Sessions ouvertes à la demande sur chaque shard pour une requête"""
+
+    def __init__(self, primary: Session):
+        self.primary = primary
+        self.count = shard_count()
+        self._sessions: Dict[int, Session] = {0: primary}
+
+    def session(self, shard: int) -> Session:
+        session = self._sessions.get(shard)
+        if session is None:
+            session = shard_session_factories[shard - 1]()
+            self._sessions[shard] = session
+        return session
+
+    def for_customer(self, customer_id: str) -> Session:
+        return self.session(shard_for_customer(customer_id, self.count))
+
+    def for_order(self, order_id: str) -> Session:
+        return self.session(shard_for_order(order_id))
+
+    def all(self) -> List[Session]:
+        return [self.session(shard) for shard in range(self.count)]
+
+    def scatter(self, query: Callable[[Session], T]) -> List[T]:
+        """Exécute `query` sur chaque shard, en parallèle s'il y en a plusieurs"""
+        sessions = self.all()
+        if len(sessions) == 1:
+            return [query(sessions[0])]
+        return list(_executor.map(query, sessions))
+
+    def rollback(self):
+        for session in self._sessions.values():
+            session.rollback()
+
+    def close(self):
+        for shard, session in self._sessions.items():
+            if shard != 0:
+                session.close()
+
+
+def get_shards(db: Session = Depends(get_db)):
+    shards = ShardSessions(db)
+    try:
+        yield shards
+    finally:
+        shards.close()
+
+
+def order_shard_candidates(order_id: str, count: int) -> List[int]:
+    """Shards où chercher une commande : tous pour un ancien identifiant"""
+    candidates = [shard_for_order(order_id)]
+    if order_shard(order_id) is None:
+        candidates += [shard for shard in range(count) if shard != 0]
+    return candidates
+
+
+def locate_order(
+    shards: ShardSessions, order_id: str, options: Sequence = ()
+) -> Tuple[Session, OrderModel]:
+    """Session et commande ; un ancien identifiant est cherché sur tous les shards"""
+    for shard in order_shard_candidates(order_id, shards.count):
+        session = shards.session(shard)
+        order = (
+            session.query(OrderModel)
+            .options(*options)
+            .filter(OrderModel.order_id == order_id)
+            .first()
+        )
+        if order:
+            return session, order
+    raise HTTPException(status_code=404, detail="Commande non trouvée")
+
+
+def locate_orders(
+    shards: ShardSessions, order_ids: Sequence[str], options: Sequence = ()
+) -> Dict[str, OrderModel]:
+    """Commandes trouvées par identifiant : une requête IN par shard concerné"""
+    ids_by_shard: Dict[int, List[str]] = {}
+    legacy_ids = []
+    for order_id in order_ids:
+        ids_by_shard.setdefault(shard_for_order(order_id), []).append(order_id)
+        if order_shard(order_id) is None:
+            legacy_ids.append(order_id)
+
+    def fetch(shard: int, shard_order_ids: List[str]) -> List[OrderModel]:
+        return (
+            shards.session(shard)
+            .query(OrderModel)
+            .options(*options)
+            .filter(OrderModel.order_id.in_(shard_order_ids))
+            .all()
+        )
+
+    def fetch_all(batches: Dict[int, List[str]]) -> Dict[str, OrderModel]:
+        # Sessions ouvertes avant la répartition sur les threads
+        for shard in batches:
+            shards.session(shard)
+        if len(batches) == 1:
+            results = [fetch(*next(iter(batches.items())))]
+        else:
+            results = list(_executor.map(fetch, batches, batches.values()))
+        return {order.order_id: order for orders in results for order in orders}
+
+    found = fetch_all(ids_by_shard)
+
+    # Anciens identifiants sans shard absents du shard 0 : cherchés partout
+    missing_legacy = [order_id for order_id in legacy_ids if order_id not in found]
+    if missing_legacy and shards.count > 1:
+        found.update(
+            fetch_all({shard: missing_legacy for shard in range(1, shards.count)})
+        )
+    return found
+
+
+def merge_by_created_at(
+    results: Iterable[List[OrderModel]], skip: int, limit: int
+) -> List[OrderModel]:
+    """Fusion k-voies de listes triées par created_at décroissant"""
+    merged = heapq.merge(*results, key=lambda order: order.created_at, reverse=True)
+    return list(islice(merged, skip, skip + limit))
+
+
+def scatter_orders(shards: ShardSessions, build_query, skip: int, limit: int):
+    """Liste globale : chaque shard renvoie ses skip+limit premières commandes"""
+
+    def fetch(session: Session) -> List[OrderModel]:
+        return (
+            build_query(session)
+            .order_by(OrderModel.created_at.desc())
+            .limit(skip + limit)
+            .all()
+        )
+
+    if shards.count == 1:
+        return (
+            build_query(shards.primary)
+            .order_by(OrderModel.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+    return merge_by_created_at(shards.scatter(fetch), skip, limit)
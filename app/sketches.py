@@ -0,0 +1,398 @@
+# app/sketches.py
+"""
+Sketches fusionnables pour l'analyse des commandes, conservés par jour dans
+la table order_sketches :
+
+- TDigest : percentiles du montant des commandes ;
+- HyperLogLog : nombre approximatif de clients distincts.
+
+Les commandes créées sont accumulées en mémoire puis fusionnées en base
+périodiquement (`flush`). Les sketches ne supportent pas la suppression :
+ils décrivent toutes les commandes créées ; `python -m app.sketches rebuild`
+les recalcule depuis les tables orders et orders_archive.
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, dialect_insert
+from app.models import OrderSketchModel
+from app.rollups import order_facts
+from app.sharding import open_shard_session, shard_count
+
+TDIGEST_COMPRESSION = int(os.getenv("TDIGEST_COMPRESSION", "100"))
+HLL_PRECISION = int(os.getenv("HLL_PRECISION", "12"))
+SKETCH_FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "5"))
+SKETCH_DECODE_CACHE_SIZE = 1000
+
+
+class TDigest:
+    """t-digest « merging » (fonction d'échelle k1)"""
+
+    def __init__(self, compression: int = TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []
+        self._buffer: List[Tuple[float, float]] = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: float = 1.0):
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest"):
+        if not other.count:
+            return
+        self._buffer.extend(other.centroids)
+        self._buffer.extend(other._buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k: float) -> float:
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+
+        total = self.count
+        merged = []
+        mean, weight = points[0]
+        cumulative = 0.0
+        q_limit = self._k_inverse(self._k(0.0) + 1)
+
+        for point_mean, point_weight in points[1:]:
+            if (cumulative + weight + point_weight) / total <= q_limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                q_limit = self._k_inverse(
+                    min(self._k(cumulative / total) + 1, self._k(1.0))
+                )
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        target = q * self.count
+        # Position (poids cumulé) du centre de chaque centroïde
+        previous_mean, previous_position = self.min, 0.0
+        cumulative = 0.0
+        for mean, weight in self.centroids:
+            position = cumulative + weight / 2
+            if target < position:
+                span = position - previous_position
+                if span <= 0:
+                    return mean
+                ratio = (target - previous_position) / span
+                return previous_mean + ratio * (mean - previous_mean)
+            previous_mean, previous_position = mean, position
+            cumulative += weight
+
+        span = self.count - previous_position
+        if span <= 0:
+            return self.max
+        ratio = (target - previous_position) / span
+        return previous_mean + ratio * (self.max - previous_mean)
+
+    def to_bytes(self) -> bytes:
+        self._compress()
+        values = [self.count, self.min, self.max]
+        for mean, weight in self.centroids:
+            values.extend((mean, weight))
+        return struct.pack(f"<{len(values)}d", *values)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, compression: int = TDIGEST_COMPRESSION):
+        digest = cls(compression)
+        if not data:
+            return digest
+        values = struct.unpack(f"<{len(data) // 8}d", data)
+        digest.count, digest.min, digest.max = values[:3]
+        digest.centroids = list(zip(values[3::2], values[4::2]))
+        return digest
+
+
+class HyperLogLog:
+    """HyperLogLog (hash 64 bits, 2^p registres)"""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytes = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers or bytes(self.size))
+
+    def add(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rest = hashed & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size**2 / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, precision: int = HLL_PRECISION):
+        return cls(precision, data or None)
+
+
+class DaySketch:
+    __slots__ = ("order_count", "amounts", "customers")
+
+    def __init__(self, order_count=0, amounts=None, customers=None):
+        self.order_count = order_count
+        self.amounts = amounts or TDigest()
+        self.customers = customers or HyperLogLog()
+
+    def add(self, amount, customer_id: str):
+        self.order_count += 1
+        self.amounts.add(float(amount or 0))
+        self.customers.add(customer_id)
+
+    def merge(self, other: "DaySketch"):
+        self.order_count += other.order_count
+        self.amounts.merge(other.amounts)
+        self.customers.merge(other.customers)
+
+
+def day_of(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class SketchAccumulator:
+    """Sketches en attente d'écriture, par jour, pour ce process"""
+
+    def __init__(self):
+        self._pending: Dict[datetime, DaySketch] = {}
+        self._lock = threading.Lock()
+
+    def record(self, created_at: datetime, amount, customer_id: str):
+        day = day_of(created_at)
+        with self._lock:
+            self._pending.setdefault(day, DaySketch()).add(amount, customer_id)
+
+    def pending(self, start: datetime, end: datetime) -> DaySketch:
+        merged = DaySketch()
+        with self._lock:
+            for day, sketch in self._pending.items():
+                if start <= day < end:
+                    merged.merge(
+                        DaySketch(
+                            sketch.order_count,
+                            TDigest.from_bytes(sketch.amounts.to_bytes()),
+                            HyperLogLog.from_bytes(sketch.customers.to_bytes()),
+                        )
+                    )
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+
+    def flush(self, db: Session) -> int:
+        """Fusionne les sketches en attente dans order_sketches"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            merge_day_sketches(db, pending)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for day, sketch in pending.items():
+                    self._pending.setdefault(day, DaySketch()).merge(sketch)
+            raise
+        return len(pending)
+
+
+def merge_day_sketches(db: Session, sketches: Dict[datetime, DaySketch]):
+    table = OrderSketchModel.__table__
+    now = datetime.now(timezone.utc)
+    for day, sketch in sorted(sketches.items()):
+        db.execute(
+            dialect_insert(db)(table)
+            .values(
+                day=day,
+                order_count=0,
+                amount_digest=b"",
+                customers_hll=b"",
+                updated_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=[table.c.day])
+        )
+        row = (
+            db.query(OrderSketchModel)
+            .filter(OrderSketchModel.day == day)
+            .with_for_update()
+            .one()
+        )
+        stored = decode_row(row)
+        stored.merge(sketch)
+        row.order_count = stored.order_count
+        row.amount_digest = stored.amounts.to_bytes()
+        row.customers_hll = stored.customers.to_bytes()
+        row.updated_at = now
+
+
+_decode_cache: "OrderedDict[tuple, DaySketch]" = OrderedDict()
+_decode_lock = threading.Lock()
+
+
+def decode_row(row: OrderSketchModel) -> DaySketch:
+    return DaySketch(
+        row.order_count,
+        TDigest.from_bytes(row.amount_digest),
+        HyperLogLog.from_bytes(row.customers_hll),
+    )
+
+
+def _cached_day(day, updated_at, order_count, amount_digest, customers_hll):
+    """Désérialise un jour une seule fois par version (day, updated_at)"""
+    key = (day, updated_at)
+    with _decode_lock:
+        cached = _decode_cache.get(key)
+        if cached is not None:
+            _decode_cache.move_to_end(key)
+            return cached
+
+    sketch = DaySketch(
+        order_count,
+        TDigest.from_bytes(amount_digest),
+        HyperLogLog.from_bytes(customers_hll),
+    )
+    with _decode_lock:
+        _decode_cache[key] = sketch
+        while len(_decode_cache) > SKETCH_DECODE_CACHE_SIZE:
+            _decode_cache.popitem(last=False)
+    return sketch
+
+
+def distribution(db: Session, start: datetime, end: datetime) -> DaySketch:
+    """Fusionne les sketches journaliers de [start, end) et ceux en attente"""
+    merged = DaySketch()
+    rows = db.execute(
+        select(
+            OrderSketchModel.day,
+            OrderSketchModel.updated_at,
+            OrderSketchModel.order_count,
+            OrderSketchModel.amount_digest,
+            OrderSketchModel.customers_hll,
+        ).where(OrderSketchModel.day >= start, OrderSketchModel.day < end)
+    )
+    for row in rows:
+        # La fusion ne modifie pas les sketches en cache
+        day_sketch = _cached_day(*row)
+        merged.order_count += day_sketch.order_count
+        merged.amounts.merge(day_sketch.amounts)
+        merged.customers.merge(day_sketch.customers)
+
+    merged.merge(order_sketches.pending(start, end))
+    return merged
+
+
+order_sketches = SketchAccumulator()
+
+
+def rebuild_sketches(db: Optional[Session] = None) -> int:
+    """Recalcule tous les sketches journaliers depuis orders et orders_archive
+    (tous les shards)"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        sketches: Dict[datetime, DaySketch] = {}
+        for shard in range(shard_count()):
+            source = db if shard == 0 else open_shard_session(shard)
+            try:
+                orders = order_facts()
+                result = source.execute(
+                    select(
+                        orders.c.created_at,
+                        orders.c.total_amount,
+                        orders.c.customer_id,
+                    ).execution_options(yield_per=5000)
+                )
+                for created_at, amount, customer_id in result:
+                    sketches.setdefault(day_of(created_at), DaySketch()).add(
+                        amount, customer_id
+                    )
+            finally:
+                if source is not db:
+                    source.close()
+
+        db.execute(delete(OrderSketchModel))
+        merge_day_sketches(db, sketches)
+        db.commit()
+        print(f"Rebuilt order sketches for {len(sketches)} days")
+        return len(sketches)
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sketches d'analyse des commandes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "rebuild", help="Recalcule order_sketches depuis orders et orders_archive"
+    )
+
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        rebuild_sketches()
+
+
+if __name__ == "__main__":
+    main()
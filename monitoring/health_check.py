@@ -1,35 +1,308 @@
 #!/usr/bin/env python3
 """
 Script de monitoring pour l'API Commandes MSPR4
+
+Sondes synthétiques exécutées en parallèle toutes les MONITOR_INTERVAL
+secondes, via un client HTTP asynchrone partagé :
+
+- health : GET /health
+- messaging : GET /health/messaging
+- read : GET /orders (authentifié)
+- write : création puis suppression d'une commande de test (authentifié,
+  désactivée par défaut, MONITOR_WRITE_PROBE=true pour l'activer). La
+  commande est traitée comme une vraie commande (événements, flux de
+  modifications, statistiques) : à réserver aux environnements de test ; avec
+  PRODUCT_CATALOG_STRICT, MONITOR_PROBE_PRODUCT_ID doit exister au catalogue
+  (au prix de 1.00, sinon la commande est refusée).
+
+Pour chaque sonde, les percentiles de latence et le budget d'erreur (SLO de
+disponibilité et de latence) sont calculés sur les MONITOR_WINDOW derniers
+résultats et exportés au format texte Prometheus sur
+http://0.0.0.0:MONITOR_METRICS_PORT/metrics.
+
+    python monitoring/health_check.py          # démon
+    python monitoring/health_check.py --once   # une passe, code retour 1 si échec
 """
-import requests
-import json
-import time
+
+import argparse
+import asyncio
 import os
+import time
+from collections import deque
 from datetime import datetime
+from typing import Dict, List, Optional
 
+import httpx
 
-def check_api_health():
-    """Vérifie la santé de l'API"""
-    api_url = os.getenv("API_URL", "http://localhost:8001")
-    token = os.getenv("API_TOKEN")
-
-    try:
-        # Health check
-        response = requests.get(f"{api_url}/", timeout=10)
-        if response.status_code == 200:
-            print(f"✅ [{datetime.now()}] API Health OK")
-            return True
-        else:
-            print(
-                f"❌ [{datetime.now()}] API Health FAILED - Status: {response.status_code}"
-            )
+API_URL = os.getenv("API_URL", "http://localhost:8001")
+API_TOKEN = os.getenv("API_TOKEN")
+MONITOR_INTERVAL = float(os.getenv("MONITOR_INTERVAL", "15"))
+MONITOR_TIMEOUT = float(os.getenv("MONITOR_TIMEOUT", "10"))
+MONITOR_WINDOW = int(os.getenv("MONITOR_WINDOW", "1000"))
+MONITOR_METRICS_PORT = int(os.getenv("MONITOR_METRICS_PORT", "9108"))
+MONITOR_WRITE_PROBE = os.getenv("MONITOR_WRITE_PROBE", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+MONITOR_PROBE_CUSTOMER_ID = os.getenv("MONITOR_PROBE_CUSTOMER_ID", "monitoring-probe")
+MONITOR_PROBE_PRODUCT_ID = os.getenv("MONITOR_PROBE_PRODUCT_ID", "monitoring-probe")
+# Objectifs : part de résultats réussis et sous le seuil de latence
+SLO_AVAILABILITY = float(os.getenv("SLO_AVAILABILITY", "0.995"))
+SLO_LATENCY_SECONDS = {
+    "health": 0.2,
+    "messaging": 0.2,
+    "read": 0.5,
+    "write": 1.0,
+}
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class ProbeStats:
+    """Fenêtre glissante des derniers résultats d'une sonde"""
+
+    def __init__(self, name: str, latency_slo: float, window: int = MONITOR_WINDOW):
+        self.name = name
+        self.latency_slo = latency_slo
+        self.samples = deque(maxlen=window)  # (latence en secondes, succès)
+        self.total = 0
+        self.failures = 0
+        self.latency_sum = 0.0
+        self.last_success: Optional[bool] = None
+
+    def record(self, latency: float, success: bool):
+        self.samples.append((latency, success))
+        self.total += 1
+        self.latency_sum += latency
+        if not success:
+            self.failures += 1
+        self.last_success = success
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        latencies = sorted(latency for latency, _ in self.samples)
+        index = min(len(latencies) - 1, int(q * len(latencies)))
+        return latencies[index]
+
+    def bad_events(self) -> int:
+        """Résultats hors SLO : échec ou latence au-delà du seuil"""
+        return sum(
+            1
+            for latency, success in self.samples
+            if not success or latency > self.latency_slo
+        )
+
+    def error_budget_remaining(self, target: float = SLO_AVAILABILITY) -> float:
+        """Part du budget d'erreur restante sur la fenêtre (négative si dépassé)"""
+        if not self.samples:
+            return 1.0
+        allowed = (1 - target) * len(self.samples)
+        if allowed <= 0:
+            return 1.0 if not self.bad_events() else 0.0
+        return 1 - self.bad_events() / allowed
+
+
+class Monitor:
+    """Exécute les sondes et conserve leurs statistiques"""
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        token: Optional[str] = API_TOKEN,
+        write_probe: bool = MONITOR_WRITE_PROBE,
+    ):
+        self.client = client
+        self.token = token
+        self.probes = {"health": self.probe_health, "messaging": self.probe_messaging}
+        if token:
+            self.probes["read"] = self.probe_read
+            if write_probe:
+                self.probes["write"] = self.probe_write
+        self.stats: Dict[str, ProbeStats] = {
+            name: ProbeStats(name, SLO_LATENCY_SECONDS[name]) for name in self.probes
+        }
+
+    @property
+    def auth_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def probe_health(self) -> bool:
+        response = await self.client.get("/health")
+        return response.status_code == 200
+
+    async def probe_messaging(self) -> bool:
+        response = await self.client.get("/health/messaging")
+        return response.status_code == 200 and response.json().get("status") in (
+            "healthy",
+            "warning",
+        )
+
+    async def probe_read(self) -> bool:
+        response = await self.client.get(
+            "/orders", params={"limit": 1}, headers=self.auth_headers
+        )
+        return response.status_code == 200
+
+    async def probe_write(self) -> bool:
+        response = await self.client.post(
+            "/orders",
+            headers=self.auth_headers,
+            json={
+                "customer_id": MONITOR_PROBE_CUSTOMER_ID,
+                "items": [
+                    {
+                        "product_id": MONITOR_PROBE_PRODUCT_ID,
+                        "product_name": "Monitoring probe",
+                        "product_price": "1.00",
+                        "quantity": 1,
+                    }
+                ],
+            },
+        )
+        if response.status_code != 200:
             return False
+        order_id = response.json()["order_id"]
+        response = await self.client.delete(
+            f"/orders/{order_id}", headers=self.auth_headers
+        )
+        return response.status_code == 200
+
+    async def run_probe(self, name: str) -> bool:
+        started = time.perf_counter()
+        try:
+            success = await self.probes[name]()
+            error = None
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            success = False
+            error = e
+        self.stats[name].record(time.perf_counter() - started, success)
+        if error is not None:
+            print(f"❌ [{datetime.now()}] Probe {name} FAILED - Error: {error}")
+        elif not success:
+            print(f"❌ [{datetime.now()}] Probe {name} FAILED")
+        return success
+
+    async def run_once(self) -> bool:
+        results = await asyncio.gather(*(self.run_probe(name) for name in self.probes))
+        return all(results)
+
+    async def run_forever(self, interval: float = MONITOR_INTERVAL):
+        while True:
+            started = time.monotonic()
+            if await self.run_once():
+                print(f"✅ [{datetime.now()}] API Health OK")
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def render_metrics(self) -> str:
+        """Statistiques au format texte Prometheus"""
+        up, failures, latency, slo, budget = [], [], [], [], []
+        for name, stats in self.stats.items():
+            label = f'probe="{name}"'
+            if stats.last_success is not None:
+                up.append((label, int(stats.last_success)))
+            failures.append((label, stats.failures))
+            for q in QUANTILES:
+                value = stats.quantile(q)
+                if value is not None:
+                    latency.append((f'{label},quantile="{q}"', f"{value:.6f}"))
+            slo.append((label, stats.latency_slo))
+            budget.append((label, f"{stats.error_budget_remaining():.4f}"))
+
+        output = []
+        output += prometheus_metric(
+            "orders_probe_up", "gauge", "Dernier résultat (1 = succès)", up
+        )
+        output += prometheus_metric(
+            "orders_probe_failures_total", "counter", "Sondes en échec", failures
+        )
+        output += prometheus_metric(
+            "orders_probe_latency_seconds",
+            "summary",
+            "Latence sur la fenêtre glissante",
+            latency,
+        )
+        for name, stats in self.stats.items():
+            label = f'probe="{name}"'
+            output.append(
+                f"orders_probe_latency_seconds_sum{{{label}}} {stats.latency_sum:.6f}"
+            )
+            output.append(
+                f"orders_probe_latency_seconds_count{{{label}}} {stats.total}"
+            )
+        output += prometheus_metric(
+            "orders_probe_latency_slo_seconds", "gauge", "Seuil de latence du SLO", slo
+        )
+        output += prometheus_metric(
+            "orders_probe_error_budget_remaining",
+            "gauge",
+            "Budget d'erreur restant (1 = intact, < 0 = dépassé)",
+            budget,
+        )
+        return "\n".join(output) + "\n"
+
+
+def prometheus_metric(name: str, kind: str, help_text: str, samples) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{{{labels}}} {value}" for labels, value in samples]
+    return lines
 
-    except requests.RequestException as e:
-        print(f"❌ [{datetime.now()}] API UNREACHABLE - Error: {e}")
-        return False
+
+async def serve_metrics(monitor: Monitor, port: int = MONITOR_METRICS_PORT):
+    """Serveur HTTP minimal exposant /metrics"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", monitor.render_metrics().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "0.0.0.0", port)
+    print(f"Serving probe metrics on :{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+def build_client(api_url: str = API_URL) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=api_url,
+        timeout=MONITOR_TIMEOUT,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+    )
+
+
+async def check_api_health() -> bool:
+    """Vérifie la santé de l'API (une passe de toutes les sondes)"""
+    async with build_client() as client:
+        return await Monitor(client).run_once()
+
+
+async def run_daemon():
+    async with build_client() as client:
+        monitor = Monitor(client)
+        await asyncio.gather(serve_metrics(monitor), monitor.run_forever())
 
 
 if __name__ == "__main__":
-    check_api_health()
+    parser = argparse.ArgumentParser(description="Monitoring de l'API Commandes")
+    parser.add_argument("--once", action="store_true", help="Une seule passe")
+    args = parser.parse_args()
+
+    if args.once:
+        raise SystemExit(0 if asyncio.run(check_api_health()) else 1)
+    asyncio.run(run_daemon())
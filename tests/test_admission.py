@@ -0,0 +1,64 @@
+# tests/test_admission.py
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from app.admission import (
+    AdmissionControlMiddleware,
+    AdmissionRejected,
+    ConcurrencyBudget,
+)
+
+
+def build_app(**kwargs):
+    app = FastAPI()
+    app.add_middleware(AdmissionControlMiddleware, **kwargs)
+
+    @app.get("/orders")
+    def list_orders():
+        return []
+
+    return app
+
+
+def test_pool_saturation_sheds_load():
+    client = TestClient(build_app(pool_saturated=lambda: True))
+
+    response = client.get("/orders")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    # Les sondes ne passent pas par le contrôle d'admission
+    assert client.get("/health").status_code == 404
+
+
+def test_requests_admitted_when_pool_available():
+    client = TestClient(build_app(pool_saturated=lambda: False))
+
+    response = client.get("/orders")
+    assert response.status_code == 200
+
+
+def test_budget_rejects_when_queue_full():
+    async def scenario():
+        budget = ConcurrencyBudget("write", limit=1, queue_size=1, queue_timeout=0.05)
+        await budget.acquire()
+
+        waiter = asyncio.create_task(budget.acquire())
+        await asyncio.sleep(0)
+        assert budget.waiting == 1
+
+        with pytest.raises(AdmissionRejected):
+            await budget.acquire()
+
+        with pytest.raises(AdmissionRejected):
+            await waiter
+        assert budget.rejected == 2
+
+        budget.release()
+        await budget.acquire()
+        assert budget.in_flight == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+# tests/test_analytics.py
+import pytest
+
+pytest.importorskip("numpy")
+
+from app import routes  # noqa: E402
+from app.analytics import OrderSnapshot  # noqa: E402
+from tests import test_api  # noqa: E402
+
+
+def test_snapshot_refreshes_incrementally(client, auth_headers, db_session):
+    snapshot = OrderSnapshot()
+    first_id = test_api.test_create_order(client, auth_headers)
+    assert snapshot.refresh(db_session) == 1
+
+    test_api.test_create_order(client, auth_headers)
+    client.post(f"/orders/{first_id}/cancel", headers=auth_headers)
+    snapshot.refresh(db_session)
+
+    assert snapshot.size == 2
+    result = snapshot.query(group_by=["status"])
+    by_status = {g["key"]["status"]: g["order_count"] for g in result["groups"]}
+    assert by_status == {"pending": 1, "cancelled": 1}
+
+
+def test_stats_query_disabled_by_default(client, auth_headers):
+    response = client.get("/stats/query", headers=auth_headers)
+    assert response.status_code == 503
+
+
+def test_stats_query(client, auth_headers, db_session, monkeypatch):
+    # ANALYTICS_SNAPSHOT_ENABLED=true
+    order_snapshot = OrderSnapshot()
+    monkeypatch.setattr(routes, "order_snapshot", order_snapshot)
+    test_api.test_create_order(client, auth_headers)
+    test_api.test_create_order(client, auth_headers)
+    order_snapshot.refresh(db_session, full=True)
+
+    response = client.get(
+        "/stats/query",
+        params={"group_by": "shipping_country,amount_bucket", "status": "pending"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["matched_orders"] == 2
+    assert data["groups"] == [
+        {
+            "key": {"shipping_country": "France", "amount_bucket": 50.0},
+            "order_count": 2,
+            "revenue": 101.0,
+            "avg_order_value": 50.5,
+        }
+    ]
+
+    response = client.get(
+        "/stats/query", params={"status": "shipped"}, headers=auth_headers
+    )
+    assert response.json()["matched_orders"] == 0
+
+    response = client.get(
+        "/stats/query", params={"group_by": "order_id"}, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_snapshot_is_shared_through_a_file(client, auth_headers, db_session, tmp_path):
+    test_api.test_create_order(client, auth_headers)
+    leader = OrderSnapshot()
+    leader.refresh(db_session)
+    path = str(tmp_path / "snapshot.npz")
+    leader.save(path)
+
+    follower = OrderSnapshot()
+    follower.load(path)
+
+    assert follower.loaded and follower.size == 1
+    assert follower.watermarks == leader.watermarks
+    assert follower.query(group_by=["status"]) == leader.query(group_by=["status"])
+
+    # Le leader élu repart de l'instantané chargé
+    test_api.test_create_order(client, auth_headers)
+    assert follower.refresh(db_session) >= 1
+    assert follower.size == 2
@@ -1,4 +1,39 @@
 # tests/test_api.py
+import asyncio
+import functools
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, func, update
+from sqlalchemy.exc import OperationalError
+
+from app import routes
+from app.archive import archive_orders, decode_document
+from app.catalog import product_cache, upsert_product
+from app.change_feed import (
+    ChangeFeedHub,
+    encode_position_cursor,
+    purge_order_changes,
+    read_changes,
+    stream_changes,
+    wait_for_changes,
+)
+from app.customer_projection import delete_customer, upsert_customer
+from app.export import export_parquet
+from app.idempotency import _wait_for_response
+from app.main import app
+from app.models import (
+    IdempotencyKeyModel,
+    OrderArchiveModel,
+    OrderChangeModel,
+    OrderModel,
+    OrderRollupModel,
+    OrderSketchModel,
+)
+from app.rollups import rebuild_rollups
+from app.routes import encode_cursor
+from app.sketches import order_sketches, rebuild_sketches
 
 
 def test_read_root(client):
@@ -7,6 +42,20 @@ def test_read_root(client):
     assert response.json() == {"message": "Orders API is running"}
 
 
+def test_liveness_and_readiness_probes(client, monkeypatch):
+    assert client.get("/health/live").json()["status"] == "alive"
+
+    monkeypatch.setattr(app.state, "storage_ready", False, raising=False)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["storage"] is False
+
+    monkeypatch.setattr(app.state, "storage_ready", True)
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["checks"] == {"storage": True, "database": True}
+
+
 def test_create_order(client, auth_headers):
     order_data = {
         "customer_id": "CUST_001",
@@ -238,3 +287,784 @@ def test_workflow_complete(client, auth_headers):
     data = response.json()
     assert data["status"] == "delivered"
     assert data["delivered_at"] is not None
+
+
+def test_get_order_events(client, auth_headers):
+    order_id = test_create_order(client, auth_headers)
+
+    for status in ["confirmed", "processing"]:
+        response = client.put(
+            f"/orders/{order_id}/status", json={"status": status}, headers=auth_headers
+        )
+        assert response.status_code == 200
+
+    response = client.get(f"/orders/{order_id}/events?limit=2", headers=auth_headers)
+    assert response.status_code == 200
+
+    data = response.json()
+    assert [event["event_type"] for event in data["events"]] == [
+        "order_created",
+        "status_changed",
+    ]
+    assert data["events"][0]["event_data"]["items_count"] == 2
+    assert data["next_cursor"] is not None
+
+    response = client.get(
+        f"/orders/{order_id}/events",
+        params={"limit": 2, "cursor": data["next_cursor"]},
+        headers=auth_headers,
+    )
+    data = response.json()
+    assert len(data["events"]) == 1
+    assert data["events"][0]["event_data"]["new_status"] == "processing"
+    assert data["next_cursor"] is None
+
+    response = client.get(
+        f"/orders/{order_id}/events?event_type=status_changed", headers=auth_headers
+    )
+    assert len(response.json()["events"]) == 2
+
+    response = client.get(
+        f"/orders/{order_id}/events?event_type=order_cancelled", headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["events"] == []
+
+
+def test_get_order_events_not_found(client, auth_headers):
+    response = client.get("/orders/NON_EXISTENT_ORDER/events", headers=auth_headers)
+    assert response.status_code == 404
+
+    # Commande inconnue, quels que soient les filtres
+    response = client.get(
+        "/orders/NON_EXISTENT_ORDER/events?event_type=status_changed",
+        headers=auth_headers,
+    )
+    assert response.status_code == 404
+    response = client.get(
+        "/orders/NON_EXISTENT_ORDER/events",
+        params={"cursor": encode_cursor(datetime(2020, 1, 1), 1)},
+        headers=auth_headers,
+    )
+    assert response.status_code == 404
+
+    response = client.get("/orders/ORD-1/events?cursor=invalid", headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_create_order_idempotency_key(client, auth_headers):
+    order_data = {
+        "customer_id": "CUST_IDEMPOTENT",
+        "items": [
+            {
+                "product_id": "PROD_001",
+                "product_name": "Café Colombien",
+                "product_price": 16,
+                "quantity": 1,
+            }
+        ],
+    }
+    headers = {**auth_headers, "Idempotency-Key": "checkout-123"}
+
+    first = client.post("/orders", json=order_data, headers=headers)
+    assert first.status_code == 200
+
+    replay = client.post("/orders", json=order_data, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json() == first.json()
+
+    response = client.get("/customers/CUST_IDEMPOTENT/orders", headers=auth_headers)
+    assert len(response.json()) == 1
+
+    order_data["items"][0]["quantity"] = 2
+    response = client.post("/orders", json=order_data, headers=headers)
+    assert response.status_code == 422
+
+
+def test_cancel_order_idempotency_key(client, auth_headers):
+    order_id = test_create_order(client, auth_headers)
+    headers = {**auth_headers, "Idempotency-Key": f"cancel-{order_id}"}
+
+    response = client.post(f"/orders/{order_id}/cancel", headers=headers)
+    assert response.status_code == 200
+
+    response = client.post(f"/orders/{order_id}/cancel", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+
+def test_wait_for_idempotent_response(db_session):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    db_session.add(
+        IdempotencyKeyModel(
+            key="wait-1",
+            request_hash="abc",
+            status_code=200,
+            response_body={"order_id": "ORD-1"},
+            expires_at=now + timedelta(hours=1),
+        )
+    )
+    db_session.commit()
+
+    record = asyncio.run(_wait_for_response(db_session, "wait-1", "abc"))
+    # Lu dans un thread puis détaché : les attributs restent chargés
+    assert record.status_code == 200
+    assert record.response_body == {"order_id": "ORD-1"}
+
+    assert asyncio.run(_wait_for_response(db_session, "unknown", "abc")) is None
+
+
+def test_update_orders_status_batch(client, auth_headers):
+    first_id = test_create_order(client, auth_headers)
+    second_id = test_create_order(client, auth_headers)
+    client.put(
+        f"/orders/{second_id}/status", json={"status": "shipped"}, headers=auth_headers
+    )
+
+    response = client.post(
+        "/orders/status/batch",
+        json={
+            "order_ids": [first_id, second_id, "NON_EXISTENT_ORDER"],
+            "status": "shipped",
+            "notes": "Expédition entrepôt",
+        },
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["updated_count"] == 1
+    assert [r["result"] for r in data["results"]] == [
+        "updated",
+        "unchanged",
+        "not_found",
+    ]
+    assert data["results"][0]["old_status"] == "pending"
+
+    order = client.get(f"/orders/{first_id}", headers=auth_headers).json()
+    assert order["status"] == "shipped"
+    assert order["shipped_at"] is not None
+
+    events = client.get(
+        f"/orders/{first_id}/events?event_type=status_changed", headers=auth_headers
+    ).json()["events"]
+    assert events[-1]["event_data"]["notes"] == "Expédition entrepôt"
+
+
+def test_customer_projection_overrides_order_snapshot(client, auth_headers, db_session):
+    order_id = test_create_order(client, auth_headers)
+
+    upsert_customer(
+        db_session, "CUST_001", {"name": "Jean Martin"}, datetime(2030, 1, 1)
+    )
+    # Un événement plus ancien ne doit pas écraser la projection
+    upsert_customer(
+        db_session, "CUST_001", {"name": "Ancien Nom"}, datetime(2020, 1, 1)
+    )
+    db_session.commit()
+    db_session.expire_all()
+
+    data = client.get(f"/orders/{order_id}", headers=auth_headers).json()
+    assert data["customer_name"] == "Jean Martin"
+    assert data["customer_name_at_order"] == "Jean Dupont"
+    assert data["customer_email"] == "jean.dupont@example.com"
+
+    summaries = client.get("/customers/CUST_001/orders", headers=auth_headers).json()
+    assert summaries[0]["customer_name"] == "Jean Martin"
+
+
+def test_create_order_uses_product_catalog(client, auth_headers, db_session):
+    upsert_product(
+        db_session,
+        "PROD_CATALOG_1",
+        {"name": "Café Catalogue", "price": "12.50", "sku": "CAT001"},
+        datetime(2030, 1, 1),
+    )
+    upsert_product(db_session, "PROD_CATALOG_2", {}, datetime(2030, 1, 1), deleted=True)
+    db_session.commit()
+    product_cache.invalidate("PROD_CATALOG_1")
+    product_cache.invalidate("PROD_CATALOG_2")
+
+    order_data = {
+        "customer_id": "CUST_CATALOG",
+        "items": [
+            {
+                "product_id": "PROD_CATALOG_1",
+                "product_name": "Nom client",
+                "product_price": 1,
+                "quantity": 2,
+            }
+        ],
+    }
+    response = client.post("/orders", json=order_data, headers=auth_headers)
+    assert response.status_code == 409
+    assert "12.50" in response.json()["detail"]
+
+    order_data["items"][0]["product_price"] = "12.5"
+    response = client.post("/orders", json=order_data, headers=auth_headers)
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["items"][0]["product_name"] == "Café Catalogue"
+    assert data["items"][0]["product_sku"] == "CAT001"
+    assert float(data["total_amount"]) == 25.0
+
+    order_data["items"][0]["product_id"] = "PROD_CATALOG_2"
+    response = client.post("/orders", json=order_data, headers=auth_headers)
+    assert response.status_code == 400
+
+    # Un prix catalogue invalide n'est pas enregistré
+    upsert_product(
+        db_session,
+        "PROD_CATALOG_3",
+        {"name": "Gratuit", "price": "0"},
+        datetime(2030, 1, 1),
+    )
+    db_session.commit()
+    product_cache.invalidate("PROD_CATALOG_3")
+    order_data["items"][0]["product_id"] = "PROD_CATALOG_3"
+    response = client.post("/orders", json=order_data, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["items"][0]["product_price"] == "12.50"
+
+
+def test_create_order_catalog_error_is_mapped(client, auth_headers, monkeypatch):
+    def failing_enrich(db, items):
+        raise OperationalError("SELECT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(routes, "enrich_order_items", failing_enrich)
+    order_data = {
+        "customer_id": "CUST_CATALOG",
+        "items": [
+            {
+                "product_id": "PROD_001",
+                "product_name": "Café",
+                "product_price": 16,
+                "quantity": 1,
+            }
+        ],
+    }
+    response = client.post("/orders", json=order_data, headers=auth_headers)
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Erreur lors de la création de la commande"
+
+
+def test_order_timeseries(client, auth_headers):
+    first_id = test_create_order(client, auth_headers)
+    test_create_order(client, auth_headers)
+    client.post(f"/orders/{first_id}/cancel", headers=auth_headers)
+
+    today = datetime.now(timezone.utc).date()
+    params = {
+        "granularity": "day",
+        "from": today.isoformat(),
+        "to": (today + timedelta(days=1)).isoformat(),
+    }
+
+    response = client.get("/stats/timeseries", params=params, headers=auth_headers)
+    assert response.status_code == 200
+    points = response.json()["points"]
+    assert len(points) == 1
+    assert points[0]["order_count"] == 2
+    assert float(points[0]["revenue"]) == 2 * 50.5
+
+    response = client.get(
+        "/stats/timeseries", params={**params, "by_status": True}, headers=auth_headers
+    )
+    by_status = {p["status"]: p["order_count"] for p in response.json()["points"]}
+    assert by_status == {"pending": 1, "cancelled": 1}
+
+
+def test_rebuild_rollups_matches_incremental(client, auth_headers, db_session):
+    test_create_order(client, auth_headers)
+
+    incremental = db_session.query(
+        OrderRollupModel.granularity, OrderRollupModel.order_count
+    ).all()
+    rebuild_rollups(db_session)
+    rebuilt = db_session.query(
+        OrderRollupModel.granularity, OrderRollupModel.order_count
+    ).all()
+
+    assert sorted(incremental) == sorted(rebuilt)
+
+
+def test_order_distribution(client, auth_headers, db_session):
+    order_sketches.reset()
+    test_create_order(client, auth_headers)
+    test_create_order(client, auth_headers)
+
+    today = datetime.now(timezone.utc).date()
+    params = {
+        "from": today.isoformat(),
+        "to": (today + timedelta(days=1)).isoformat(),
+        "percentiles": "50,99",
+    }
+
+    # Sketches encore en mémoire, puis après écriture en base
+    for _ in range(2):
+        response = client.get(
+            "/stats/distribution", params=params, headers=auth_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["order_count"] == 2
+        assert data["distinct_customers"] == 1
+        assert data["percentiles"] == {"p50": 50.5, "p99": 50.5}
+        order_sketches.flush(db_session)
+
+    response = client.get(
+        "/stats/distribution",
+        params={**params, "percentiles": "150"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_listing_total_counts(client, auth_headers, db_engine):
+    first_id = test_create_order(client, auth_headers)
+    test_create_order(client, auth_headers)
+    client.post(f"/orders/{first_id}/cancel", headers=auth_headers)
+
+    def total(url, **params):
+        response = client.get(
+            url, params={**params, "include_total": True}, headers=auth_headers
+        )
+        assert response.status_code == 200
+        return (
+            int(response.headers["X-Total-Count"]),
+            response.headers["X-Total-Count-Type"],
+        )
+
+    assert total("/orders", limit=1) == (2, "exact")
+    assert total("/orders", status="pending") == (1, "exact")
+    assert total("/orders", customer_id="CUST_001", status="cancelled") == (1, "exact")
+    assert total("/orders/status/cancelled") == (1, "exact")
+    assert total("/customers/CUST_001/orders") == (2, "exact")
+    # La recherche est estimée par le planificateur sur PostgreSQL
+    count, count_type = total("/orders/search", q="Jean")
+    if db_engine.dialect.name == "postgresql":
+        assert count_type == "estimate"
+    else:
+        assert (count, count_type) == (2, "exact")
+
+    response = client.get("/orders", headers=auth_headers)
+    assert "X-Total-Count" not in response.headers
+
+
+def test_sparse_fieldsets(client, auth_headers, db_engine):
+    order_id = test_create_order(client, auth_headers)
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        response = client.get(
+            "/orders",
+            params={"fields": "status,order_id,total_amount", "include_total": True},
+            headers=auth_headers,
+        )
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == "1"
+    assert response.json() == [
+        {"order_id": order_id, "total_amount": "50.50", "status": "pending"}
+    ]
+    order_queries = [s for s in statements if "FROM orders" in s]
+    assert order_queries and all("shipping_address" not in s for s in order_queries)
+    assert not any("FROM order_items" in s for s in statements)
+
+    response = client.get(
+        f"/orders/{order_id}",
+        params={"fields": "order_id,items_count,items,customer_name"},
+        headers=auth_headers,
+    )
+    data = response.json()
+    assert set(data) == {"order_id", "customer_name", "items", "items_count"}
+    assert data["items_count"] == 2
+    assert data["items"][0]["product_id"] == "PROD_001"
+    assert data["customer_name"] == "Jean Dupont"
+
+    response = client.get(
+        f"/customers/CUST_001/orders?fields=order_id,shipping_city",
+        headers=auth_headers,
+    )
+    assert response.json() == [{"order_id": order_id, "shipping_city": "Paris"}]
+
+    response = client.get("/orders?fields=order_id,secret", headers=auth_headers)
+    assert response.status_code == 400
+    assert "secret" in response.json()["detail"]
+
+
+def test_create_order_round_trips(client, auth_headers, db_engine, db_session):
+    # Premier appel : remplit le cache du catalogue
+    test_create_order(client, auth_headers)
+    upsert_customer(
+        db_session, "CUST_002", {"username": "jean@example.org"}, datetime(2030, 1, 1)
+    )
+    db_session.commit()
+
+    order_data = {
+        "customer_id": "CUST_002",
+        "customer_name": "Jean Dupont",
+        "customer_email": "jean.dupont@example.com",
+        "items": [
+            {
+                "product_id": "PROD_001",
+                "product_name": "Café Colombien",
+                "product_price": 16,
+                "quantity": 2,
+            },
+            {
+                "product_id": "PROD_002",
+                "product_name": "Café Éthiopien",
+                "product_price": 18.5,
+                "quantity": 1,
+            },
+        ],
+    }
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        response = client.post("/orders", json=order_data, headers=auth_headers)
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+
+    # Aucune relecture : uniquement les INSERT de la transaction
+    assert all(statement.startswith("INSERT INTO") for statement in statements)
+    # SQLite ne garantit pas l'ordre d'un RETURNING multi-lignes : une
+    # requête par article ; PostgreSQL insère tous les articles en une fois
+    item_inserts = 2 if db_engine.dialect.name == "sqlite" else 1
+    assert [statement.split()[2] for statement in statements] == [
+        "orders",
+        *["order_items"] * item_inserts,
+        "order_rollups",
+        "customer_order_counts",
+        "order_changes",
+        "order_events",
+    ]
+
+    created = response.json()
+    assert created["customer_email"] == "jean@example.org"
+    assert created["customer_email_at_order"] == "jean.dupont@example.com"
+    assert created["total_amount"] == "50.50"
+    assert [item["total_price"] for item in created["items"]] == ["32.00", "18.50"]
+
+    db_session.expire_all()
+    reloaded = client.get(f"/orders/{created['order_id']}", headers=auth_headers)
+    assert reloaded.json() == created
+
+
+def test_order_changes_feed(client, auth_headers, db_session, monkeypatch):
+    response = client.get("/orders/changes", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["changes"] == []
+    start = response.json()["next_cursor"]
+
+    test_create_order(client, auth_headers)
+    order_id = client.get("/orders", headers=auth_headers).json()[0]["order_id"]
+    client.put(
+        f"/orders/{order_id}/status",
+        json={"status": "confirmed"},
+        headers=auth_headers,
+    )
+
+    page = client.get(
+        "/orders/changes", params={"since": start, "limit": 1}, headers=auth_headers
+    ).json()
+    assert [change["change_type"] for change in page["changes"]] == ["created"]
+    page = client.get(
+        "/orders/changes", params={"since": page["next_cursor"]}, headers=auth_headers
+    ).json()
+    assert [
+        (c["order_id"], c["change_type"], c["status"]) for c in page["changes"]
+    ] == [(order_id, "status_changed", "confirmed")]
+
+    # Long-poll sans nouvelle modification : réponse vide après l'attente
+    cursor = page["next_cursor"]
+    response = client.get(
+        "/orders/changes", params={"since": cursor, "wait": 0.2}, headers=auth_headers
+    )
+    assert response.json() == {"changes": [], "next_cursor": cursor, "reset": False}
+
+    delete_customer(db_session, "CUST_001", datetime(2030, 1, 1))
+    db_session.commit()
+
+    # Server-Sent Events, repris depuis Last-Event-ID
+    monkeypatch.setattr(
+        "app.routes.stream_changes",
+        functools.partial(stream_changes, duration=0.3, keepalive=0.1),
+    )
+    response = client.get(
+        "/orders/changes",
+        headers={
+            **auth_headers,
+            "Accept": "text/event-stream",
+            "Last-Event-ID": cursor,
+        },
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        block for block in response.text.split("\n\n") if block.startswith("id: ")
+    ]
+    assert len(events) == 1
+    data = json.loads(events[0].split("data: ", 1)[1])
+    assert (data["order_id"], data["change_type"]) == (order_id, "anonymized")
+
+    response = client.get(
+        "/orders/changes", params={"since": "not-a-cursor"}, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_order_changes_hub_and_reset(client, auth_headers, db_session, monkeypatch):
+    test_create_order(client, auth_headers)
+    test_create_order(client, auth_headers)
+
+    # Le hub lit une fois le flux et sert les curseurs couverts par son tampon
+    hub = ChangeFeedHub(buffer_size=1)
+    hub.follow({0: 0})
+    hub.extend(*read_changes({0: 0}, 10))
+    assert [row.seq for _, row in hub.read({0: 1}, 10)[0]] == [2]
+    assert hub.read({0: 0}, 10) is None
+    changes, positions, reset = asyncio.run(wait_for_changes({0: 1}, 10, 0, hub))
+    assert ([row.seq for _, row in changes], positions, reset) == ([2], {0: 2}, False)
+
+    # Trou ignoré après CHANGE_FEED_GAP_TIMEOUT : le client doit resynchroniser
+    db_session.add(
+        OrderChangeModel(
+            seq=5,
+            order_id="ORD-GAP",
+            change_type="updated",
+            changed_at=datetime.now(timezone.utc).replace(tzinfo=None)
+            - timedelta(minutes=5),
+        )
+    )
+    db_session.commit()
+    cursor = encode_position_cursor({0: 2})
+    page = client.get(
+        "/orders/changes", params={"since": cursor}, headers=auth_headers
+    ).json()
+    assert page["reset"] is True
+    assert [change["seq"] for change in page["changes"]] == [5]
+
+    # Curseur antérieur aux modifications conservées
+    purge_order_changes(db_session, retention_days=0)
+    page = client.get(
+        "/orders/changes", params={"since": cursor}, headers=auth_headers
+    ).json()
+    assert page["reset"] is True
+
+    monkeypatch.setattr(
+        "app.routes.stream_changes",
+        functools.partial(stream_changes, duration=0.3, keepalive=0.1),
+    )
+    response = client.get(
+        "/orders/changes",
+        params={"since": cursor, "stream": True},
+        headers=auth_headers,
+    )
+    assert response.text.split("\n\n")[1] == "event: reset\ndata: {}"
+
+
+def test_get_orders_batch(client, auth_headers, db_engine):
+    order_ids = [test_create_order(client, auth_headers) for _ in range(3)]
+    requested = [order_ids[2], "ORD-UNKNOWN", order_ids[0], order_ids[2]]
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        response = client.post(
+            "/orders/batch-get", json={"order_ids": requested}, headers=auth_headers
+        )
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    result = response.json()
+    assert list(result["orders"]) == [order_ids[2], order_ids[0]]
+    assert result["not_found"] == ["ORD-UNKNOWN"]
+    assert (
+        result["orders"][order_ids[0]]
+        == client.get(f"/orders/{order_ids[0]}", headers=auth_headers).json()
+    )
+    # Commandes, articles, puis archive pour les identifiants introuvables
+    assert len(statements) == 3
+
+    response = client.post(
+        "/orders/batch-get", json={"order_ids": []}, headers=auth_headers
+    )
+    assert response.status_code == 422
+
+
+def test_archived_orders_read_through(client, auth_headers, db_session):
+    archived_id = test_create_order(client, auth_headers)
+    client.put(
+        f"/orders/{archived_id}",
+        json={"customer_name": "Alice Secret", "customer_email": "alice@x.com"},
+        headers=auth_headers,
+    )
+    client.put(
+        f"/orders/{archived_id}/status",
+        json={"status": "delivered"},
+        headers=auth_headers,
+    )
+    active_id = test_create_order(client, auth_headers)
+    db_session.execute(
+        update(OrderModel)
+        .where(OrderModel.order_id == archived_id)
+        .values(updated_at=datetime(2020, 1, 1))
+    )
+    db_session.commit()
+    before = client.get(f"/orders/{archived_id}", headers=auth_headers).json()
+    events_before = client.get(
+        f"/orders/{archived_id}/events", headers=auth_headers
+    ).json()
+    stats_before = client.get("/stats", headers=auth_headers).json()
+
+    assert archive_orders(db_session, older_than_days=30) == 1
+    assert db_session.query(OrderModel).count() == 1
+
+    assert client.get(f"/orders/{archived_id}", headers=auth_headers).json() == before
+    assert (
+        client.get(f"/orders/{archived_id}/events", headers=auth_headers).json()
+        == events_before
+    )
+    partial = client.get(
+        f"/orders/{archived_id}?fields=order_id,status,items_count",
+        headers=auth_headers,
+    ).json()
+    assert partial == {"order_id": archived_id, "status": "delivered", "items_count": 2}
+
+    customer_orders = client.get(
+        "/customers/CUST_001/orders", headers=auth_headers
+    ).json()
+    assert [order["order_id"] for order in customer_orders] == [
+        active_id,
+        archived_id,
+    ]
+    second_page = client.get(
+        "/customers/CUST_001/orders?skip=1&limit=1", headers=auth_headers
+    ).json()
+    assert [order["order_id"] for order in second_page] == [archived_id]
+
+    batch = client.post(
+        "/orders/batch-get",
+        json={"order_ids": [archived_id, active_id]},
+        headers=auth_headers,
+    ).json()
+    assert batch["orders"][archived_id] == before
+    assert batch["not_found"] == []
+
+    assert client.get("/stats", headers=auth_headers).json() == stats_before
+    assert client.get("/orders", headers=auth_headers).json()[0]["order_id"] == (
+        active_id
+    )
+
+    # Les totaux des listes de commandes actives excluent l'archive
+    def total(url, **params):
+        response = client.get(
+            url, params={**params, "include_total": True}, headers=auth_headers
+        )
+        return response.headers["X-Total-Count"]
+
+    assert total("/orders") == "1"
+    assert total("/orders/status/delivered") == "0"
+    assert total("/orders", customer_id="CUST_001") == "1"
+    assert total("/customers/CUST_001/orders") == "2"
+
+    # La reconstruction des agrégats tient compte de l'archive
+    rollups = [
+        (row.granularity, row.status, row.order_count)
+        for row in db_session.query(OrderRollupModel)
+    ]
+    rebuild_rollups(db_session)
+    assert sorted(
+        (row.granularity, row.status, row.order_count)
+        for row in db_session.query(OrderRollupModel)
+    ) == sorted(rollups)
+    assert total("/orders") == "1"
+
+    rebuild_sketches(db_session)
+    assert db_session.query(func.sum(OrderSketchModel.order_count)).scalar() == 2
+
+    # L'anonymisation d'un client couvre ses commandes archivées
+    delete_customer(db_session, "CUST_001", datetime(2030, 1, 1))
+    db_session.commit()
+    anonymized = client.get(f"/orders/{archived_id}", headers=auth_headers).json()
+    assert anonymized["customer_email_at_order"] == "client.supprime@anonyme.com"
+    document = json.dumps(
+        decode_document(db_session.get(OrderArchiveModel, archived_id).document)
+    )
+    for personal in ("Jean Dupont", "jean.dupont@", "Alice Secret", "alice@x.com"):
+        assert personal not in document
+
+
+def test_export_orders(client, auth_headers, db_session, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    first_id = test_create_order(client, auth_headers)
+    second_id = test_create_order(client, auth_headers)
+    client.put(
+        f"/orders/{first_id}/status", json={"status": "delivered"}, headers=auth_headers
+    )
+    db_session.execute(
+        update(OrderModel)
+        .where(OrderModel.order_id == first_id)
+        .values(updated_at=datetime(2020, 1, 1))
+    )
+    db_session.commit()
+    archive_orders(db_session, older_than_days=30)
+
+    written = export_parquet(str(tmp_path), batch_size=1)
+    assert written and all("month=" in path for path in written)
+    orders = pq.read_table(tmp_path / "orders").to_pylist()
+    assert sorted((row["order_id"], row["archived"]) for row in orders) == sorted(
+        [(first_id, True), (second_id, False)]
+    )
+    items = pq.read_table(tmp_path / "order_items")
+    assert items.num_rows == 4
+    assert str(sum(row["total_price"] for row in items.to_pylist())) == "101.00"
+
+    # Incrémental : seules les commandes modifiées depuis le watermark
+    client.put(
+        f"/orders/{second_id}/status",
+        json={"status": "confirmed"},
+        headers=auth_headers,
+    )
+    written = export_parquet(str(tmp_path))
+    new_orders = pa.concat_tables(
+        [pq.read_table(path) for path in written if "/orders/" in path]
+    ).to_pylist()
+    assert [(row["order_id"], row["status"]) for row in new_orders] == [
+        (second_id, "confirmed")
+    ]
+
+    response = client.get(
+        "/export/orders", params={"table": "order_items"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    stream = pa.ipc.open_stream(response.content).read_all()
+    assert stream.num_rows == 4
+    assert set(stream.column("order_id").to_pylist()) == {first_id, second_id}
+
+    response = client.get(
+        "/export/orders", params={"since": "2030-01-01"}, headers=auth_headers
+    )
+    assert pa.ipc.open_stream(response.content).read_all().num_rows == 0
@@ -0,0 +1,97 @@
+# tests/test_compression.py
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.testclient import TestClient
+
+from app.compression import CompressionMiddleware, negotiate_encoding
+
+ORDERS = [{"order_id": f"ORD-{i:08d}", "status": "pending"} for i in range(500)]
+
+
+def build_app(**kwargs):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, **kwargs)
+
+    @app.get("/orders")
+    def list_orders():
+        return ORDERS
+
+    @app.get("/small")
+    def small():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    def stream():
+        chunks = (f"data: {i}\n\n" * 200 for i in range(5))
+        return StreamingResponse(chunks, media_type="text/event-stream")
+
+    return app
+
+
+def raw_get(client, path, encoding):
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as r:
+        return r, b"".join(r.iter_raw())
+
+
+def test_negotiate_encoding():
+    supported = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, br", supported) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", supported) == "gzip"
+    assert negotiate_encoding("*;q=0.1, zstd;q=0", supported) == "br"
+    assert negotiate_encoding("identity", supported) is None
+
+
+def test_large_json_is_gzipped():
+    client = TestClient(build_app())
+
+    response, raw = raw_get(client, "/orders", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(raw)
+    assert gzip.decompress(raw).startswith(b'[{"order_id":"ORD-00000000"')
+
+    response, raw = raw_get(client, "/small", "gzip")
+    assert "content-encoding" not in response.headers
+    assert raw == b'{"status":"ok"}'
+
+
+def test_offloaded_and_route_disabled_compression():
+    client = TestClient(build_app(offload_size=1))
+    response, raw = raw_get(client, "/orders", "gzip")
+    assert gzip.decompress(raw).count(b"ORD-") == len(ORDERS)
+
+    client = TestClient(build_app(route_levels={"GET /orders": 0}))
+    response, _ = raw_get(client, "/orders", "gzip")
+    assert "content-encoding" not in response.headers
+
+
+def test_streaming_is_compressed_incrementally():
+    client = TestClient(build_app())
+
+    response, raw = raw_get(client, "/stream", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert (
+        gzip.decompress(raw)
+        == "".join(f"data: {i}\n\n" * 200 for i in range(5)).encode()
+    )
+
+
+@pytest.mark.parametrize("encoding, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(encoding, module):
+    codec = pytest.importorskip(module)
+    client = TestClient(build_app())
+
+    response, raw = raw_get(client, "/orders", encoding)
+    assert response.headers["content-encoding"] == encoding
+    if encoding == "br":
+        assert codec.decompress(raw).count(b"ORD-") == len(ORDERS)
+    else:
+        decompressed = codec.ZstdDecompressor().decompressobj().decompress(raw)
+        assert decompressed.count(b"ORD-") == len(ORDERS)
+
+    response, raw = raw_get(client, "/stream", encoding)
+    assert response.headers["content-encoding"] == encoding
@@ -1,7 +1,13 @@
 # tests/test_db.py
+import gzip
+import json
+from datetime import datetime
+
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from app.db import engine
+from app.audit_log import archive_order_events
+from app.models import OrderEventModel
 
 
 def test_connection_to_database():
@@ -32,3 +38,37 @@ def test_database_tables_creation():
 
     except SQLAlchemyError as e:
         assert False, f"Database tables creation failed: {e}"
+
+
+def test_archive_order_events(db_session, db_engine, tmp_path):
+    """Test que les événements hors rétention sont archivés puis supprimés"""
+    db_session.add_all(
+        [
+            OrderEventModel(
+                order_id="ORD-OLD",
+                event_type="order_created",
+                event_data={"total_amount": "10.00"},
+                created_at=datetime(2020, 1, 15),
+            ),
+            OrderEventModel(
+                order_id="ORD-NEW",
+                event_type="order_created",
+                event_data={"total_amount": "20.00"},
+                created_at=datetime.now(),
+            ),
+        ]
+    )
+    db_session.commit()
+
+    archived = archive_order_events(
+        retention_months=1, archive_dir=str(tmp_path), engine=db_engine
+    )
+
+    assert len(archived) == 1
+    with gzip.open(archived[0], "rt", encoding="utf-8") as archive:
+        rows = [json.loads(line) for line in archive]
+    assert [row["order_id"] for row in rows] == ["ORD-OLD"]
+
+    db_session.expire_all()
+    remaining = db_session.query(OrderEventModel.order_id).all()
+    assert [order_id for (order_id,) in remaining] == ["ORD-NEW"]
@@ -0,0 +1,71 @@
+# tests/test_leadership.py
+import asyncio
+
+from sqlalchemy import create_engine
+
+from app.leadership import LeaderElection, advisory_lock_key
+
+
+def build_election(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leader.db'}")
+    return LeaderElection(
+        engine, "orders-api.leader", lock_file=str(tmp_path / "leader.lock"), **kwargs
+    )
+
+
+def test_advisory_lock_key_is_stable_signed_bigint():
+    key = advisory_lock_key("orders-api.leader")
+    assert key == advisory_lock_key("orders-api.leader")
+    assert -(2**63) <= key < 2**63
+    assert key != advisory_lock_key("other-service.leader")
+
+
+def test_only_one_candidate_holds_the_lock(tmp_path):
+    first = build_election(tmp_path)
+    second = build_election(tmp_path)
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_leadership_fails_over_when_leader_stops(tmp_path):
+    events = []
+
+    def callbacks(name):
+        async def elected():
+            events.append((name, "elected"))
+
+        async def demoted():
+            events.append((name, "demoted"))
+
+        return {"on_elected": elected, "on_demoted": demoted}
+
+    first = build_election(tmp_path, poll_interval=0.01, **callbacks("first"))
+    second = build_election(tmp_path, poll_interval=0.01, **callbacks("second"))
+
+    async def scenario():
+        first_task = asyncio.create_task(first.run())
+        await asyncio.sleep(0.05)
+        second_task = asyncio.create_task(second.run())
+        await asyncio.sleep(0.05)
+        assert first.is_leader and not second.is_leader
+
+        first_task.cancel()
+        await asyncio.gather(first_task, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        assert second.is_leader
+
+        second_task.cancel()
+        await asyncio.gather(second_task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert events == [
+        ("first", "elected"),
+        ("first", "demoted"),
+        ("second", "elected"),
+        ("second", "demoted"),
+    ]
@@ -0,0 +1,134 @@
+# tests/test_messaging.py
+import asyncio
+
+from app.messaging.broker import (
+    MessageBroker,
+    NonRetryableEventError,
+    RETRY_COUNT_HEADER,
+)
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+
+class FakeChannel:
+    def __init__(self):
+        self.default_exchange = FakeExchange()
+
+
+class FakeMessage:
+    def __init__(self, headers=None):
+        self.body = b'{"event_type": "customer.updated"}'
+        self.headers = headers or {}
+        self.content_type = "application/json"
+        self.message_id = "evt-1"
+        self.timestamp = None
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue=False):
+        raise AssertionError("message should not be nacked")
+
+
+def build_broker():
+    broker = MessageBroker("amqp://unused", "orders-api")
+    broker.channel = FakeChannel()
+    broker.retry_queue_names = [
+        "orders-api.events.retry.1000ms",
+        "orders-api.events.retry.2000ms",
+    ]
+    broker.dead_letter_queue_name = "orders-api.events.dlq"
+    return broker
+
+
+async def failing_callback(message):
+    raise RuntimeError("database unavailable")
+
+
+def test_failed_event_is_scheduled_for_retry():
+    broker = build_broker()
+    message = FakeMessage(headers={RETRY_COUNT_HEADER: 1})
+
+    asyncio.run(broker.handle_message(message, failing_callback))
+
+    routing_key, retried = broker.channel.default_exchange.published[0]
+    assert routing_key == "orders-api.events.retry.2000ms"
+    assert retried.headers[RETRY_COUNT_HEADER] == 2
+    assert message.acked
+
+
+def test_event_is_parked_after_max_retries():
+    broker = build_broker()
+    message = FakeMessage(headers={RETRY_COUNT_HEADER: 2})
+
+    asyncio.run(broker.handle_message(message, failing_callback))
+
+    routing_key, _ = broker.channel.default_exchange.published[0]
+    assert routing_key == "orders-api.events.dlq"
+    assert message.acked
+
+
+def test_non_retryable_event_goes_straight_to_dlq():
+    broker = build_broker()
+    message = FakeMessage()
+
+    async def poison_callback(message):
+        raise NonRetryableEventError("Invalid JSON in message")
+
+    asyncio.run(broker.handle_message(message, poison_callback))
+
+    routing_key, _ = broker.channel.default_exchange.published[0]
+    assert routing_key == "orders-api.events.dlq"
+
+
+def test_successful_event_is_acked():
+    broker = build_broker()
+    message = FakeMessage()
+
+    async def callback(message):
+        return None
+
+    asyncio.run(broker.handle_message(message, callback))
+
+    assert message.acked
+    assert broker.channel.default_exchange.published == []
+
+
+def test_supervisor_retries_until_connected():
+    broker = MessageBroker("amqp://unused", "orders-api")
+    attempts = []
+    connected = asyncio.Event()
+
+    class FakeConnection:
+        is_closed = False
+
+    async def fake_open():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise ConnectionError("broker down")
+        broker.connection = FakeConnection()
+
+    async def on_connected():
+        connected.set()
+
+    broker._open = fake_open
+
+    async def scenario():
+        task = asyncio.create_task(
+            broker.supervise(on_connected, base_delay=0.001, check_interval=0.01)
+        )
+        await asyncio.wait_for(connected.wait(), timeout=1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert len(attempts) == 3
+    assert broker.is_connected
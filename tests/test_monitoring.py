@@ -0,0 +1,47 @@
+# tests/test_monitoring.py
+import asyncio
+
+import httpx
+
+from app.main import app
+from monitoring.health_check import Monitor, ProbeStats
+
+
+def test_probe_stats_percentiles_and_error_budget():
+    stats = ProbeStats("read", latency_slo=0.5, window=100)
+    for i in range(100):
+        stats.record(latency=(i + 1) / 100, success=i != 0)
+
+    assert stats.quantile(0.5) == 0.51
+    assert stats.quantile(0.99) == 1.0
+    # 1 échec + 50 requêtes au-delà de 0.5 s, pour 1 % de budget sur 100
+    assert stats.bad_events() == 51
+    assert round(stats.error_budget_remaining(target=0.99), 6) == -50
+
+
+def test_monitor_probes_api_and_exports_metrics(client, auth_headers):
+    token = auth_headers["Authorization"].split()[1]
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://testserver"
+        ) as http:
+            monitor = Monitor(http, token=token, write_probe=True)
+            return monitor, await monitor.run_once()
+
+    monitor, healthy = asyncio.run(scenario())
+
+    assert healthy
+    assert set(monitor.stats) == {"health", "messaging", "read", "write"}
+    metrics = monitor.render_metrics()
+    assert 'orders_probe_up{probe="write"} 1' in metrics
+    assert 'orders_probe_latency_seconds{probe="read",quantile="0.99"}' in metrics
+    assert 'orders_probe_error_budget_remaining{probe="health"}' in metrics
+    assert client.get("/orders", headers=auth_headers).json() == []
+
+
+def test_monitor_write_probe_is_opt_in():
+    monitor = Monitor(httpx.AsyncClient(), token="token")
+
+    assert set(monitor.probes) == {"health", "messaging", "read"}
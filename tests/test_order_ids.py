@@ -0,0 +1,72 @@
+# tests/test_order_ids.py
+import pytest
+
+from app.order_ids import (
+    MAX_NODE_ID,
+    OrderIdGenerator,
+    parse_order_id,
+    worker_node_ids,
+)
+
+
+def test_order_ids_are_unique_and_time_ordered():
+    generator = OrderIdGenerator(node_id=42)
+
+    order_ids = [generator.next_id() for _ in range(10000)]
+
+    assert len(set(order_ids)) == len(order_ids)
+    assert order_ids == sorted(order_ids)
+    assert all(order_id.startswith("ORD-") for order_id in order_ids)
+
+
+def test_order_ids_from_different_nodes_do_not_collide():
+    first = OrderIdGenerator(node_id=1)
+    second = OrderIdGenerator(node_id=2)
+
+    first_ids = {first.next_id() for _ in range(5000)}
+    second_ids = {second.next_id() for _ in range(5000)}
+
+    assert not first_ids & second_ids
+
+
+def test_parse_order_id():
+    order_id = OrderIdGenerator(node_id=7).next_id()
+
+    parsed = parse_order_id(order_id)
+    assert parsed["node_id"] == 7
+    assert parsed["sequence"] == 0
+
+    assert parse_order_id("ORD-1A2B3C4D") is None
+
+
+def test_order_id_shard_tag():
+    generator = OrderIdGenerator(node_id=3)
+
+    order_id = generator.next_id(shard=5)
+
+    assert parse_order_id(order_id)["shard"] == 5
+    assert parse_order_id(generator.next_id())["shard"] is None
+    assert parse_order_id(f"{order_id}X") is None
+
+
+def test_worker_node_ids_are_distinct(monkeypatch):
+    monkeypatch.setenv("ORDER_ID_NODE_ID", "100")
+    assert worker_node_ids(4) == [100, 101, 102, 103]
+
+    monkeypatch.delenv("ORDER_ID_NODE_ID")
+    node_ids = worker_node_ids(8)
+    assert len(set(node_ids)) == 8
+    assert max(node_ids) <= MAX_NODE_ID
+
+    with pytest.raises(ValueError):
+        worker_node_ids(2, base=MAX_NODE_ID)
+
+
+def test_set_node_id():
+    generator = OrderIdGenerator(node_id=1)
+
+    generator.set_node_id(9)
+
+    assert parse_order_id(generator.next_id())["node_id"] == 9
+    with pytest.raises(ValueError):
+        generator.set_node_id(MAX_NODE_ID + 1)
@@ -0,0 +1,102 @@
+# tests/test_post_commit.py
+import asyncio
+
+from app.post_commit import PostCommitQueue
+
+
+def test_jobs_run_inline_before_start():
+    queue = PostCommitQueue(maxsize=2, workers=1)
+    done = []
+
+    async def job():
+        done.append("published")
+
+    asyncio.run(queue.submit("order.created", job))
+
+    assert done == ["published"]
+    assert queue.stats()["processed"] == 1
+
+
+def test_submit_does_not_wait_and_drain_flushes():
+    queue = PostCommitQueue(maxsize=10, workers=2)
+    done = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def slow_job():
+            await gate.wait()
+            done.append("slow")
+
+        async def failing_job():
+            raise RuntimeError("broker down")
+
+        queue.start()
+        await queue.submit("order.created", slow_job)
+        await queue.submit("order.updated", failing_job)
+        assert done == []
+
+        gate.set()
+        await queue.drain(timeout=1)
+
+    asyncio.run(scenario())
+
+    stats = queue.stats()
+    assert done == ["slow"]
+    assert stats["processed"] == 1 and stats["failed"] == 1
+    assert not stats["running"]
+
+
+def test_full_queue_waits_for_a_free_slot():
+    queue = PostCommitQueue(maxsize=1, workers=1)
+    done = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def blocked_job():
+            await gate.wait()
+            done.append("blocked")
+
+        async def job(name):
+            done.append(name)
+
+        queue.start()
+        await queue.submit("first", blocked_job)
+        await asyncio.sleep(0)  # le worker prend la première tâche
+        await queue.submit("second", lambda: job("second"))
+        # File pleine : la troisième tâche attend une place, sans passer devant
+        third = asyncio.create_task(queue.submit("third", lambda: job("third")))
+        await asyncio.sleep(0.01)
+        assert not third.done() and done == []
+
+        gate.set()
+        await third
+        await queue.drain(timeout=1)
+
+    asyncio.run(scenario())
+
+    assert done == ["blocked", "second", "third"]
+    assert queue.stats()["overflowed"] == 1
+
+
+def test_jobs_of_the_same_order_keep_their_order():
+    queue = PostCommitQueue(maxsize=10, workers=4)
+    done = []
+
+    async def scenario():
+        async def created():
+            await asyncio.sleep(0.05)  # publication lente
+            done.append("order.created")
+
+        async def status_changed():
+            done.append("order.status_changed")
+
+        queue.start()
+        await queue.submit("order.created", created, key="ORD-1")
+        await queue.submit("order.status_changed", status_changed, key="ORD-1")
+        await queue.drain(timeout=1)
+
+    asyncio.run(scenario())
+
+    assert done == ["order.created", "order.status_changed"]
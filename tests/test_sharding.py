@@ -0,0 +1,166 @@
+# tests/test_sharding.py
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+import app.sharding as sharding
+from app.archive import archive_orders
+from app.db import Base
+from app.models import OrderEventModel, OrderModel
+from app.order_ids import order_shard
+from app.sharding import shard_for_customer
+
+SHARD_COUNT = 3
+
+
+@pytest.fixture
+def shard_factories(tmp_path, monkeypatch):
+    engines = [
+        create_engine(f"sqlite:///{tmp_path}/shard_{shard}.db")
+        for shard in range(1, SHARD_COUNT)
+    ]
+    for engine in engines:
+        Base.metadata.create_all(bind=engine)
+    factories = [sessionmaker(bind=engine) for engine in engines]
+    monkeypatch.setattr(sharding, "shard_session_factories", factories)
+    yield factories
+    for engine in engines:
+        engine.dispose()
+
+
+def customers_by_shard():
+    """Un client par shard"""
+    customers = {}
+    index = 0
+    while len(customers) < SHARD_COUNT:
+        customer_id = f"CUST_{index}"
+        customers.setdefault(shard_for_customer(customer_id, SHARD_COUNT), customer_id)
+        index += 1
+    return customers
+
+
+def create_order(client, auth_headers, customer_id, quantity=1):
+    response = client.post(
+        "/orders",
+        json={
+            "customer_id": customer_id,
+            "customer_name": f"Client {customer_id}",
+            "customer_email": "client@example.com",
+            "items": [
+                {
+                    "product_id": "PROD_001",
+                    "product_name": "Café",
+                    "product_price": 10,
+                    "quantity": quantity,
+                }
+            ],
+        },
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    return response.json()["order_id"]
+
+
+def test_orders_are_stored_on_the_customer_shard(
+    client, auth_headers, db_session, shard_factories
+):
+    customers = customers_by_shard()
+    order_ids = {
+        shard: create_order(client, auth_headers, customer_id)
+        for shard, customer_id in customers.items()
+    }
+
+    for shard, order_id in order_ids.items():
+        assert order_shard(order_id) == shard
+        session = db_session if shard == 0 else shard_factories[shard - 1]()
+        assert session.query(OrderModel).filter_by(order_id=order_id).count() == 1
+
+        response = client.get(f"/orders/{order_id}", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["customer_id"] == customers[shard]
+
+        response = client.get(f"/orders/{order_id}/events", headers=auth_headers)
+        assert response.json()["events"][0]["event_type"] == "order_created"
+
+    response = client.get(f"/customers/{customers[2]}/orders", headers=auth_headers)
+    assert [o["order_id"] for o in response.json()] == [order_ids[2]]
+
+
+def test_global_reads_scatter_and_merge(
+    client, auth_headers, db_session, shard_factories
+):
+    customers = customers_by_shard()
+    created = [
+        create_order(client, auth_headers, customers[shard], quantity=shard + 1)
+        for shard in (0, 1, 2, 1, 0)
+    ]
+
+    response = client.get("/orders", params={"limit": 4}, headers=auth_headers)
+    assert [o["order_id"] for o in response.json()] == created[::-1][:4]
+
+    response = client.get(
+        "/orders", params={"skip": 3, "limit": 10}, headers=auth_headers
+    )
+    assert [o["order_id"] for o in response.json()] == created[::-1][3:]
+
+    stats = client.get("/stats", headers=auth_headers).json()
+    assert stats["total_orders"] == 5
+    assert float(stats["total_revenue"]) == 10 * (1 + 2 + 3 + 2 + 1)
+    assert stats["orders_by_status"] == {"pending": 5}
+
+    response = client.post(
+        "/orders/status/batch",
+        json={"order_ids": created + ["ORD-UNKNOWN"], "status": "confirmed"},
+        headers=auth_headers,
+    )
+    assert response.json()["updated_count"] == 5
+    assert response.json()["results"][-1]["result"] == "not_found"
+
+    response = client.get("/orders/status/confirmed", headers=auth_headers)
+    assert len(response.json()) == 5
+
+
+def test_archived_legacy_orders_are_found_on_any_shard(
+    client, auth_headers, db_session, shard_factories
+):
+    customers = customers_by_shard()
+    order_id = create_order(client, auth_headers, customers[2])
+    client.put(
+        f"/orders/{order_id}/status", json={"status": "delivered"}, headers=auth_headers
+    )
+
+    # Ancien identifiant sans suffixe de shard, archivé sur le shard 2
+    session = shard_factories[1]()
+    session.execute(
+        update(OrderModel)
+        .where(OrderModel.order_id == order_id)
+        .values(order_id="ORD-LEGACY1", updated_at=datetime(2020, 1, 1))
+    )
+    session.execute(
+        update(OrderEventModel)
+        .where(OrderEventModel.order_id == order_id)
+        .values(order_id="ORD-LEGACY1")
+    )
+    session.commit()
+    assert archive_orders(session, older_than_days=30) == 1
+    session.close()
+
+    response = client.get("/orders/ORD-LEGACY1", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "delivered"
+
+    response = client.get(
+        "/orders/ORD-LEGACY1/events?event_type=status_changed", headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert len(response.json()["events"]) == 1
+
+    batch = client.post(
+        "/orders/batch-get",
+        json={"order_ids": ["ORD-LEGACY1", "ORD-LEGACY2"]},
+        headers=auth_headers,
+    ).json()
+    assert list(batch["orders"]) == ["ORD-LEGACY1"]
+    assert batch["not_found"] == ["ORD-LEGACY2"]
@@ -0,0 +1,59 @@
+# tests/test_sketches.py
+import random
+
+from app.sketches import HyperLogLog, TDigest
+
+
+def test_tdigest_percentiles_are_close_to_exact():
+    rng = random.Random(42)
+    values = [rng.lognormvariate(3, 1) for _ in range(20000)]
+
+    digest = TDigest()
+    for value in values:
+        digest.add(value)
+
+    values.sort()
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values))]
+        assert abs(digest.quantile(q) - exact) / exact < 0.02
+
+
+def test_tdigest_merge_and_serialization():
+    rng = random.Random(1)
+    days = []
+    for _ in range(30):
+        digest = TDigest()
+        for _ in range(500):
+            digest.add(rng.uniform(0, 100))
+        days.append(TDigest.from_bytes(digest.to_bytes()))
+
+    merged = TDigest()
+    for digest in days:
+        merged.merge(digest)
+
+    assert merged.count == 15000
+    assert len(merged.centroids) <= 2 * merged.compression
+    assert abs(merged.quantile(0.5) - 50) < 2
+    assert abs(merged.quantile(0.95) - 95) < 1
+
+
+def test_hyperloglog_estimates_and_merges():
+    first, second = HyperLogLog(), HyperLogLog()
+    for i in range(30000):
+        first.add(f"CUST_{i}")
+    for i in range(20000, 50000):
+        second.add(f"CUST_{i}")
+
+    assert abs(first.count() - 30000) / 30000 < 0.05
+
+    # Les clients communs aux deux sketches ne sont comptés qu'une fois
+    merged = HyperLogLog.from_bytes(first.to_bytes())
+    merged.merge(second)
+    assert abs(merged.count() - 50000) / 50000 < 0.05
+
+
+def test_hyperloglog_small_cardinalities_are_exact():
+    sketch = HyperLogLog()
+    for customer_id in ["A", "B", "C", "A", "B"]:
+        sketch.add(customer_id)
+    assert sketch.count() == 3